@@ -0,0 +1,158 @@
+#!/bin/bash
+
+#================================================================================================
+# Entrypoint of the MySQL container for Confluence: writes the InnoDB/connection settings of the
+# selected sizing profile, scaled to the container's memory limit, and then hands over to the
+# image's own `docker-entrypoint.sh`.
+#
+# Environment:
+#
+#   MYSQL_PROFILE          small | medium | large | auto (default) | none
+#                          `auto` picks the profile from the memory limit, but only for its sizes:
+#                          it always keeps innodb_flush_log_at_trx_commit=1. `none` writes nothing,
+#                          which leaves the server on the plain settings of the Dockerfile.
+#   MYSQL_MEMORY_LIMIT_MB  Memory to size for, in MB (default: the container's cgroup limit,
+#                          or the host's memory if there is none).
+#   MYSQL_MAX_CONNECTIONS  Overrides the max_connections of the profile.
+#   CONFLUENCE_DB_POOL_MAX_SIZE
+#                          The maximum size of Confluence's connection pool; max_connections is
+#                          raised to it plus MYSQL_EXTRA_CONNECTIONS if the profile has fewer.
+#   MYSQL_EXTRA_CONNECTIONS
+#                          Connections kept free beside Confluence's pool, for the Python tools'
+#                          database readers and administration (default: 40).
+#   MYSQL_FLUSH_LOG_AT_TRX_COMMIT
+#                          Overrides innodb_flush_log_at_trx_commit of the profile (and of `auto`).
+#================================================================================================
+
+set -e
+
+# The profile settings go in their own file, read after /etc/my.cnf:
+PROFILE_CNF="/etc/mysql/conf.d/confluence-profile.cnf"
+
+# ==== MEMORY TO SIZE FOR, IN MB ====
+memory_limit_mb() {
+
+    if [ -n "${MYSQL_MEMORY_LIMIT_MB}" ]; then
+        echo "${MYSQL_MEMORY_LIMIT_MB}"
+        return
+    fi
+
+    local host_mb limit_bytes=""
+
+    host_mb=$(awk '/^MemTotal:/ { printf "%d", $2 / 1024 }' /proc/meminfo)
+
+    # cgroup v2 first, then cgroup v1; "max" or a huge number means there is no limit:
+    if [ -r /sys/fs/cgroup/memory.max ]; then
+        limit_bytes=$(cat /sys/fs/cgroup/memory.max)
+    elif [ -r /sys/fs/cgroup/memory/memory.limit_in_bytes ]; then
+        limit_bytes=$(cat /sys/fs/cgroup/memory/memory.limit_in_bytes)
+    fi
+
+    if [ -z "${limit_bytes}" ] || [ "${limit_bytes}" = "max" ]; then
+        echo "${host_mb}"
+        return
+    fi
+
+    awk -v limit="${limit_bytes}" -v host="${host_mb}" \
+        'BEGIN { limit_mb = limit / 1048576; printf "%d", (limit_mb < host ? limit_mb : host) }'
+}
+
+# ==== WRITE THE PROFILE SETTINGS ====
+write_profile() {
+
+    local profile="$1" memory_mb="$2" picked_by="$3"
+    local pool_percent io_capacity redo_capacity max_connections table_cache tmp_table flush_log flush_method
+
+    case "${profile}" in
+        small)
+            # Development and test stacks: durability relaxed to one flush per second.
+            pool_percent=50; io_capacity=200;  redo_capacity=512M; max_connections=100
+            table_cache=2000; tmp_table=32M;  flush_log=2; flush_method=fsync
+            ;;
+        medium)
+            pool_percent=60; io_capacity=1000; redo_capacity=1G;   max_connections=200
+            table_cache=4000; tmp_table=64M;  flush_log=1; flush_method=O_DIRECT
+            ;;
+        large)
+            pool_percent=70; io_capacity=2000; redo_capacity=2G;   max_connections=400
+            table_cache=8000; tmp_table=128M; flush_log=1; flush_method=O_DIRECT
+            ;;
+        *)
+            echo "Unknown MYSQL_PROFILE '${profile}'; use small, medium, large, auto or none." >&2
+            exit 1
+            ;;
+    esac
+
+    # Leave room for the whole Confluence pool and the other clients, unless it's set explicitly:
+    if [ -n "${CONFLUENCE_DB_POOL_MAX_SIZE}" ]; then
+        local pool_connections=$(( CONFLUENCE_DB_POOL_MAX_SIZE + ${MYSQL_EXTRA_CONNECTIONS:-40} ))
+        [ "${pool_connections}" -gt "${max_connections}" ] && max_connections=${pool_connections}
+    fi
+
+    # A profile picked by `auto` only sets sizes; relaxed durability has to be asked for explicitly:
+    [ "${picked_by}" = "auto" ] && flush_log=1
+
+    max_connections="${MYSQL_MAX_CONNECTIONS:-${max_connections}}"
+    flush_log="${MYSQL_FLUSH_LOG_AT_TRX_COMMIT:-${flush_log}}"
+
+    # The buffer pool is resized in 128 MB chunks; leave the rest for connections and the OS:
+    local pool_mb=$(( memory_mb * pool_percent / 100 / 128 * 128 ))
+    [ "${pool_mb}" -lt 128 ] && pool_mb=128
+
+    # One instance per GB of buffer pool, at most 8:
+    local pool_instances=$(( pool_mb / 1024 ))
+    [ "${pool_instances}" -lt 1 ] && pool_instances=1
+    [ "${pool_instances}" -gt 8 ] && pool_instances=8
+
+    mkdir -p "$(dirname "${PROFILE_CNF}")"
+
+    cat > "${PROFILE_CNF}" <<EOF
+# Written by mysql_profile_entrypoint.sh at container start; changes are overwritten.
+# Profile: ${profile}${picked_by:+ (picked by ${picked_by})}, sized for ${memory_mb} MB of memory.
+[mysqld]
+innodb_buffer_pool_size=${pool_mb}M
+innodb_buffer_pool_instances=${pool_instances}
+innodb_redo_log_capacity=${redo_capacity}
+innodb_flush_log_at_trx_commit=${flush_log}
+innodb_flush_method=${flush_method}
+innodb_io_capacity=${io_capacity}
+innodb_io_capacity_max=$(( io_capacity * 2 ))
+max_connections=${max_connections}
+table_open_cache=${table_cache}
+table_definition_cache=2000
+tmp_table_size=${tmp_table}
+max_heap_table_size=${tmp_table}
+# Required by Confluence for big pages and attachments:
+max_allowed_packet=256M
+EOF
+
+    echo "MySQL profile '${profile}' for ${memory_mb} MB: buffer pool ${pool_mb}M, max_connections ${max_connections}," \
+         "innodb_flush_log_at_trx_commit ${flush_log}"
+}
+
+#================================================================================================
+# Main:
+#================================================================================================
+
+profile="${MYSQL_PROFILE:-auto}"
+
+if [ "${profile}" = "none" ]; then
+    rm -f "${PROFILE_CNF}"
+else
+    memory_mb=$(memory_limit_mb)
+    picked_by=""
+
+    # Pick the profile from the memory there is:
+    if [ "${profile}" = "auto" ]; then
+        picked_by=auto
+        if   [ "${memory_mb}" -lt 2048 ]; then profile=small
+        elif [ "${memory_mb}" -lt 8192 ]; then profile=medium
+        else                                   profile=large
+        fi
+    fi
+
+    write_profile "${profile}" "${memory_mb}" "${picked_by}"
+fi
+
+# Carry on with the image's own entrypoint (database initialization, then mysqld):
+exec docker-entrypoint.sh "$@"
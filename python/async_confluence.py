@@ -0,0 +1,349 @@
+import aiohttp
+import argparse
+import asyncio
+import contextlib
+import os
+import time
+
+from   rate_limit import DEFAULT_MAX_RETRIES, IDEMPOTENT_METHODS, RetryPolicy
+from   test7_write_to_confluence import convert_text_to_xhtml
+from   text_reader import add_preview_arguments, preview_options, read_text_preview
+
+# Default number of requests in flight to Confluence at any time:
+DEFAULT_CONCURRENCY = 16
+
+# ==== CREATE AN ASYNC HTTP SESSION FOR CONFLUENCE ====
+def create_client_session(pat: str, concurrency: int = DEFAULT_CONCURRENCY) -> aiohttp.ClientSession:
+    """
+    Creates an `aiohttp` session with a connection pool sized for the concurrency limit
+    and the authentication headers set once for every request.
+
+    pat:         Personal Access Token for authentication.
+    concurrency: The maximum number of requests in flight; the pool keeps that many connections alive.
+
+    Returns the session; use it with `async with`.
+    """
+
+    connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+
+    return aiohttp.ClientSession(connector=connector,
+                                 headers={"Authorization": f"Bearer {pat}", "Accept": "application/json"})
+
+# ==== SEND A REQUEST, RETRYING REFUSALS ====
+async def request_json(http: aiohttp.ClientSession, method: str, url: str, limiter: asyncio.Semaphore,
+                       retry_policy: RetryPolicy = None, build_request=None, **kwargs) -> dict:
+    """
+    Sends a request and returns its JSON response. Requests Confluence refuses are re-sent after
+    the server's `Retry-After` or a jittered backoff, like `rate_limit.RateLimitedAdapter` does for
+    the sync scripts: 429/502/503/504 for idempotent methods, only 429/503 for POST.
+
+    http:          The session returned by `create_client_session`.
+    method:        The HTTP method.
+    url:           The full URL.
+    limiter:       The semaphore bounding the number of requests in flight; it's not held while waiting.
+    retry_policy:  Optional retry policy; None uses the default one.
+    build_request: Optional function building the request's keyword arguments for each attempt, for
+                   bodies that can only be sent once (e.g. an open file); it's given an `ExitStack`
+                   to register what has to be closed after the attempt.
+    kwargs:        The keyword arguments of the request, when `build_request` isn't given.
+
+    Raises an exception if the request fails, or is still refused after the last retry.
+    """
+
+    retry_policy = retry_policy or RetryPolicy()
+
+    status_codes = retry_policy.status_codes if method in IDEMPOTENT_METHODS else retry_policy.refused_status_codes
+
+    attempt = 0
+
+    while True:
+
+        with contextlib.ExitStack() as stack:
+
+            request_kwargs = build_request(stack) if build_request else kwargs
+
+            async with limiter:
+                async with http.request(method, url, **request_kwargs) as response:
+
+                    if response.status not in status_codes or attempt >= retry_policy.max_retries:
+                        response.raise_for_status()
+                        return await response.json()
+
+                    delay = retry_policy.delay(response, attempt)
+
+        await asyncio.sleep(delay)
+
+        attempt += 1
+
+# ==== FIND OR CREATE CONFLUENCE PAGE ====
+async def get_page_id_and_version(http: aiohttp.ClientSession, base_url: str, title: str, space_key: str,
+                                  limiter: asyncio.Semaphore, retry_policy: RetryPolicy = None):
+    """
+    Retrieves the Confluence page ID and version number for a given title and space key.
+    If the page does not exist, it returns None.
+
+    http:         The session returned by `create_client_session`.
+    base_url:     The base URL of the Confluence server.
+    title:        The title of the Confluence page.
+    space_key:    The space key where the page will be created/updated.
+    limiter:      The semaphore bounding the number of requests in flight.
+    retry_policy: Optional retry policy (see `request_json`).
+
+    Returns the page ID and version number if the page exists, otherwise returns None.
+
+    Raises an exception if the request fails.
+    """
+
+    params = {
+        "title": title,
+        "spaceKey": space_key,
+        "expand": "version"
+    }
+
+    response = await request_json(http, "GET", f"{base_url}/rest/api/content", limiter, retry_policy, params=params)
+    results = response.get("results", [])
+
+    if results:
+        page = results[0]
+        return page["id"], page["version"]["number"]
+
+    return None, None
+
+# ==== CREATE OR UPDATE CONFLUENCE PAGE ====
+async def create_or_update_page(http: aiohttp.ClientSession, base_url: str, title: str, space_key: str, content: str,
+                                limiter: asyncio.Semaphore, parent_page_id: str = None,
+                                retry_policy: RetryPolicy = None) -> dict:
+    """
+    Creates or updates a Confluence page with the given title and content.
+    If a page with the same title exists, it will be updated. Otherwise, a new page will be created.
+
+    http:           The session returned by `create_client_session`.
+    base_url:       The base URL of the Confluence server.
+    title:          The title of the Confluence page.
+    space_key:      The space key where the page will be created/updated.
+    content:        The content to be added to the page in XHTML format.
+    limiter:        The semaphore bounding the number of requests in flight.
+    parent_page_id: Optional ID of the page the page is created or kept under.
+    retry_policy:   Optional retry policy (see `request_json`).
+
+    Returns the response from the Confluence API.
+
+    Raises an exception if the request fails.
+    """
+
+    page_id, version = await get_page_id_and_version(http, base_url, title, space_key, limiter, retry_policy)
+
+    body = {
+        "type": "page",
+        "title": title,
+        "space": {"key": space_key},
+        "body": {
+            "storage": {
+                "value": content,
+                "representation": "storage"
+            }
+        }
+    }
+
+    # Create the page under its parent, like the sync upload does:
+    if parent_page_id:
+        body["ancestors"] = [{"id": parent_page_id}]
+
+    # If the page exists in Confluence, update it; otherwise create a new one:
+    if page_id:
+        body["version"] = {"number": version + 1}
+        method, url = "PUT", f"{base_url}/rest/api/content/{page_id}"
+    else:
+        method, url = "POST", f"{base_url}/rest/api/content"
+
+    return await request_json(http, method, url, limiter, retry_policy, json=body)
+
+# ==== UPLOAD ATTACHMENT TO CONFLUENCE PAGE ====
+async def upload_attachment(http: aiohttp.ClientSession, base_url: str, page_id: str, file_path: str,
+                            limiter: asyncio.Semaphore, retry_policy: RetryPolicy = None) -> dict:
+    """
+    Uploads a file attachment to a Confluence page.
+
+    http:         The session returned by `create_client_session`.
+    base_url:     The base URL of the Confluence server.
+    page_id:      The ID of the Confluence page to which the attachment will be uploaded.
+    file_path:    The full path to the file to be uploaded.
+    limiter:      The semaphore bounding the number of requests in flight.
+    retry_policy: Optional retry policy (see `request_json`).
+
+    Returns the response from the Confluence API.
+
+    Raises an exception if the request fails.
+    """
+
+    filename = os.path.basename(file_path)
+
+    # The file is opened again for every attempt, since a refused attempt may have read part of it:
+    def build_request(stack):
+
+        file_data = stack.enter_context(open(file_path, 'rb'))
+
+        # `aiohttp` reads the open file in chunks while sending it:
+        upload_file = aiohttp.FormData()
+        upload_file.add_field("file", file_data, filename=filename, content_type="application/octet-stream")
+
+        return {"data": upload_file, "headers": {"X-Atlassian-Token": "no-check"}}
+
+    return await request_json(http, "POST", f"{base_url}/rest/api/content/{page_id}/child/attachment",
+                              limiter, retry_policy, build_request)
+
+# ==== PUBLISH MANY PAGES WITH THEIR ATTACHMENTS ====
+async def publish_pages(base_url: str, pat: str, space_key: str, pages: list,
+                        concurrency: int = DEFAULT_CONCURRENCY, parent_page_id: str = None,
+                        max_retries: int = DEFAULT_MAX_RETRIES) -> list:
+    """
+    Creates/updates many pages and attaches a file to each of them.
+
+    Every page runs its own create → attach chain, and all the chains share one semaphore that
+    caps the number of requests in flight. That pipelines the work: while page N's attachment is
+    uploading, page N+1 is already being created, and no thread is needed for any of it.
+
+    base_url:       The base URL of the Confluence server.
+    pat:            Personal Access Token for authentication.
+    space_key:      The space key where the pages will be created/updated.
+    pages:          (title, XHTML content, attachment file path) tuples; the path may be None.
+    concurrency:    The maximum number of requests in flight to Confluence.
+    parent_page_id: Optional ID of the page the pages are created under.
+    max_retries:    How many times a refused request is re-sent (see `request_json`).
+
+    Returns one result per page, in the order given: the page info returned by Confluence,
+    or the exception that stopped that page.
+    """
+
+    limiter = asyncio.Semaphore(concurrency)
+    retry_policy = RetryPolicy(max_retries)
+
+    async with create_client_session(pat, concurrency) as http:
+
+        async def publish_one(title, content, file_path):
+
+            page_info = await create_or_update_page(http, base_url, title, space_key, content, limiter,
+                                                    parent_page_id, retry_policy)
+
+            if file_path:
+                await upload_attachment(http, base_url, page_info["id"], file_path, limiter, retry_policy)
+
+            return page_info
+
+        return await asyncio.gather(*(publish_one(*page) for page in pages), return_exceptions=True)
+
+# ==== PUBLISH UNDER A PARENT PAGE GIVEN BY TITLE ====
+async def publish_all(base_url: str, pat: str, space_key: str, pages: list, concurrency: int = DEFAULT_CONCURRENCY,
+                      parent_page_title: str = None, max_retries: int = DEFAULT_MAX_RETRIES) -> list:
+    """
+    Looks up the parent page once, if a title is given, and then runs `publish_pages` under it.
+
+    Raises an exception if the parent page does not exist.
+    """
+
+    parent_page_id = None
+
+    if parent_page_title:
+
+        async with create_client_session(pat, 1) as http:
+            parent_page_id, _ = await get_page_id_and_version(http, base_url, parent_page_title, space_key,
+                                                              asyncio.Semaphore(1), RetryPolicy(max_retries))
+
+        if parent_page_id is None:
+            raise Exception(f"The specified parent page '{parent_page_title}' does not exist in space '{space_key}'.")
+
+    return await publish_pages(base_url, pat, space_key, pages, concurrency, parent_page_id, max_retries)
+
+# ==== BUILD THE PAGES FOR A LIST OF TEXT FILES ====
+def pages_for_text_files(text_files: list, preview: dict = None) -> list:
+    """
+    Builds the (title, XHTML content, attachment file path) tuples for `publish_pages`,
+    one page per text file, titled after the file name. Each page only shows a preview
+    of its file; the full file goes in the attachment.
+
+    text_files: The full paths to the text files to be uploaded.
+    preview:    Optional keyword arguments for `text_reader.read_text_preview`.
+
+    Returns the list of page tuples.
+    """
+
+    pages = []
+
+    for text_file in text_files:
+
+        filename = os.path.basename(text_file)
+
+        text_content = read_text_preview(text_file, **(preview or {}))
+        pages.append((filename, convert_text_to_xhtml(text_content, filename), text_file))
+
+    return pages
+
+#================================================================================================
+# Main method:
+#================================================================================================
+def main():
+
+    parser = argparse.ArgumentParser(description="Parameters required to upload text files to Confluence concurrently.")
+
+    parser.add_argument("--confluence_base_url",
+                        "-u",
+                        required=True,
+                        help="The base URL of the Confluence server (http(s)://hostname:port_no).")
+
+    parser.add_argument("--personal_access_token",
+                        "-p",
+                        required=True,
+                        help="User personal access token for Confluence.")
+
+    parser.add_argument("--space_key",
+                        "-k",
+                        required=True,
+                        help="The Confluence space key where the pages will be created/updated.")
+
+    parser.add_argument("--text_files",
+                        "-f",
+                        required=True,
+                        nargs="+",
+                        help="Full paths to the text files to upload; each one gets a page titled after the file name.")
+
+    parser.add_argument("--concurrency",
+                        "-c",
+                        type=int,
+                        default=DEFAULT_CONCURRENCY,
+                        help=f"Maximum number of requests in flight to Confluence (default: {DEFAULT_CONCURRENCY}).")
+
+    parser.add_argument("--parent_page_title",
+                        "-t",
+                        help="Title of the page the new pages are created under (default: the space root).")
+
+    parser.add_argument("--max_retries",
+                        type=int,
+                        default=DEFAULT_MAX_RETRIES,
+                        help=f"How many times a request refused with 429/503 (and 502/504, except for POST) "
+                             f"is re-sent (default: {DEFAULT_MAX_RETRIES}).")
+
+    add_preview_arguments(parser)
+
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+
+    results = asyncio.run(publish_all(args.confluence_base_url,
+                                      args.personal_access_token,
+                                      args.space_key,
+                                      pages_for_text_files(args.text_files, preview_options(args)),
+                                      args.concurrency,
+                                      args.parent_page_title,
+                                      args.max_retries))
+
+    for text_file, result in zip(args.text_files, results):
+
+        if isinstance(result, Exception):
+            print(f"Error: {text_file}: {result}")
+        else:
+            print(f"{text_file}: {args.confluence_base_url}{result['_links']['webui']}")
+
+    print(f"Published {len(results)} page(s) in {time.perf_counter() - start_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
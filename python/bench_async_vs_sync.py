@@ -0,0 +1,83 @@
+from   concurrent.futures import ThreadPoolExecutor
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import async_confluence
+from   confluence_session import create_session
+from   fake_confluence_server import FakeConfluenceServer
+import test7_write_to_confluence
+
+#================================================================================================
+# Benchmark of the sync (threaded) and async publish paths against the local fake Confluence:
+#================================================================================================
+
+def make_text_files(directory: str, count: int, size: int) -> list:
+    """ Writes `count` text files of `size` bytes each and returns their paths. """
+    text_files = []
+    for number in range(count):
+        text_file = os.path.join(directory, f"bench_{number:05d}.txt")
+        with open(text_file, 'w', encoding='utf-8') as f:
+            f.write(("line %d of the benchmark file\n" % number) * (size // 30 + 1))
+        text_files.append(text_file)
+    return text_files
+
+def run_sync(base_url: str, pages: list, concurrency: int) -> float:
+    """ Publishes the pages with test7's functions over a thread pool sharing one session. """
+    session = create_session("bench", pool_size=concurrency)
+
+    def publish_one(page):
+        title, content, file_path = page
+        page_info = test7_write_to_confluence.create_or_update_page(base_url, "bench", title, "BENCH", content, session)
+        test7_write_to_confluence.upload_attachment(base_url, "bench", page_info["id"], file_path, session)
+
+    start_time = time.perf_counter()
+    with session, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(publish_one, pages))
+    return time.perf_counter() - start_time
+
+def run_async(base_url: str, pages: list, concurrency: int) -> float:
+    """ Publishes the pages with the asyncio engine. """
+    start_time = time.perf_counter()
+    results = asyncio.run(async_confluence.publish_pages(base_url, "bench", "BENCH", pages, concurrency))
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        raise errors[0]
+    return time.perf_counter() - start_time
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compares the sync and async publish paths against a fake Confluence.")
+
+    parser.add_argument("--pages", type=int, default=200, help="Number of pages to publish per run (default: 200).")
+    parser.add_argument("--size", type=int, default=4096, help="Size of each attachment in bytes (default: 4096).")
+    parser.add_argument("--concurrency", type=int, default=16, help="Threads / requests in flight (default: 16).")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated server latency in seconds (default: 0.02).")
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        text_files = make_text_files(directory, args.pages, args.size)
+        pages = async_confluence.pages_for_text_files(text_files)
+
+        print(f"{args.pages} pages, {args.size} byte attachments, concurrency {args.concurrency}, "
+              f"latency {args.latency * 1000:.0f} ms")
+
+        for name, run in (("sync ", run_sync), ("async", run_async)):
+
+            # Each run gets a fresh server, so every page is created rather than updated:
+            with FakeConfluenceServer(latency=args.latency) as server:
+                # The sync path prints a line per page; keep the benchmark output readable:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    elapsed = run(server.base_url, pages, args.concurrency)
+                requests_sent = server.store.request_count
+
+            print(f"{name}: {elapsed:7.2f}s  {args.pages / elapsed:8.1f} pages/s  {requests_sent} requests")
+
+if __name__ == "__main__":
+    main()
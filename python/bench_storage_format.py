@@ -0,0 +1,101 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+#================================================================================================
+# Benchmark of the time and peak memory of converting growing text files to storage format:
+#================================================================================================
+
+def legacy_format_for_confluence(content):
+    """ The previous `format_for_confluence`, which grows the page string with `+=`. """
+    confluence_content = "<ac:structured-macro ac:name=\"section\">\n"
+    for line in content:
+        line = line.strip()
+        if not line:
+            confluence_content += "</ac:structured-macro>\n<ac:structured-macro ac:name=\"section\">\n"
+        else:
+            confluence_content += f"<p>{line}</p>\n"
+    confluence_content += "</ac:structured-macro>"
+    return confluence_content
+
+def child_convert(file_path: str, mode: str):
+    """ Converts one file in this (child) process and prints the seconds taken and the peak RSS in MB. """
+    from storage_format import (code_macro_chunks, iter_text_pieces, page_body_chunks, section_chunks,
+                                write_storage_chunks)
+
+    started = time.perf_counter()
+
+    if mode == "sections":
+        write_storage_chunks(section_chunks(iter_text_pieces(file_path)), os.devnull)
+    elif mode == "code":
+        write_storage_chunks(code_macro_chunks(iter_text_pieces(file_path, by_line=False)), os.devnull)
+    elif mode == "json":
+        # The chunked request body, consumed the way `requests` would send it:
+        for _ in page_body_chunks({"type": "page", "title": "Bench"}, section_chunks(iter_text_pieces(file_path))):
+            pass
+    else:
+        # The previous implementation: the whole file as a list of lines, then the whole page as one string.
+        with open(file_path, 'r', encoding='utf-8') as file:
+            content = file.readlines()
+        with open(os.devnull, 'w', encoding='utf-8') as file:
+            file.write(legacy_format_for_confluence(content))
+
+    seconds = time.perf_counter() - started
+
+    # `ru_maxrss` is in kilobytes on Linux and in bytes on macOS:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(seconds, peak / (1024 * 1024 if sys.platform == "darwin" else 1024))
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the time and peak memory of the storage-format converter.")
+
+    parser.add_argument("--sizes_mb", type=int, nargs="+", default=[16, 64, 256, 1024], help="File sizes to convert, in MB.")
+    parser.add_argument("--modes", nargs="+", default=["sections", "code", "json"],
+                        choices=["sections", "code", "json", "legacy"], help="Converters to measure.")
+    parser.add_argument("--legacy_max_mb", type=int, default=256,
+                        help="Largest size the legacy converter is run on, since its memory grows with the file.")
+    parser.add_argument("--child", nargs=2, metavar=("FILE", "MODE"), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        child_convert(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        print(f"{'size MB':>8}  {'mode':>8}  {'seconds':>8}  {'MB/s':>8}  {'peak RSS MB':>12}")
+
+        for size_mb in args.sizes_mb:
+
+            # Paragraphs of text lines separated by blank lines, with the odd `<`, `&` and `]]>` to escape:
+            file_path = os.path.join(directory, f"bench_{size_mb}mb.txt")
+            paragraph = (b"benchmark log line with <angle brackets> & ampersands to escape\n" * 7
+                         + b"a line that ends a CDATA section ]]> in the middle\n\n")
+            with open(file_path, 'wb') as f:
+                block = paragraph * (1024 * 1024 // len(paragraph))
+                for _ in range(size_mb):
+                    f.write(block)
+
+            # Each conversion runs in a fresh process, so every peak is measured on its own:
+            for mode in args.modes:
+
+                if mode == "legacy" and size_mb > args.legacy_max_mb:
+                    continue
+
+                result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", file_path, mode],
+                                        check=True, capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+                seconds, peak = (float(value) for value in result.stdout.strip().splitlines()[-1].split())
+
+                print(f"{size_mb:>8}  {mode:>8}  {seconds:>8.2f}  {size_mb / seconds:>8.1f}  {peak:>12.1f}")
+
+            os.remove(file_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+from   fake_confluence_server import FakeConfluenceServer
+
+#================================================================================================
+# Benchmark suite of the upload, update and export paths against the local fake Confluence:
+#================================================================================================
+
+# The scenarios, in the order they run; each one works on what the previous one left on the server:
+# "upload" publishes every file as a new page with its attachment, "update" adds a paragraph to every
+# uploaded page (a fetch and an incremental PUT each), and "export" exports the whole space to JSONL.
+SCENARIOS = ("upload", "update", "export")
+
+# Space and parent page the benchmark publishes into:
+BENCH_SPACE_KEY = "BENCH"
+BENCH_PARENT_TITLE = "Benchmark parent"
+
+def make_text_files(directory: str, count: int, size: int) -> list:
+    """ Writes `count` log-like text files of about `size` bytes each and returns their paths. """
+    text_files = []
+    for number in range(count):
+        text_file = os.path.join(directory, f"bench_{number:05d}.txt")
+        line = f"benchmark file {number:05d}: a log line with some padding to make it a realistic length\n"
+        with open(text_file, 'w', encoding='utf-8') as f:
+            f.write(line * max(1, size // len(line)))
+        text_files.append(text_file)
+    return text_files
+
+def child_run(scenario: str, base_url: str, parent_page_id: str, directory: str, workers: int):
+    """ Runs one scenario in this (child) process and prints its measurements as one JSON line. """
+    from   concurrent.futures import ThreadPoolExecutor
+    import contextlib
+    import io
+    import time
+    from   confluence_session import create_session
+    from   space_export import JsonlExportWriter, export_space, iter_space_pages
+    from   storage_diff import update_page_incremental
+    from   upload_text_file_to_confluence import upload_text_files
+
+    session = create_session("bench", pool_size=workers)
+    text_files = sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".txt"))
+
+    start_time = time.perf_counter()
+
+    if scenario == "upload":
+        # The upload path prints a line per file; keep the benchmark output readable:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = upload_text_files(base_url, "bench", BENCH_SPACE_KEY,
+                                        {"id": parent_page_id, "title": BENCH_PARENT_TITLE},
+                                        text_files, workers=workers, max_per_host=workers,
+                                        text_dir=directory, session=session)
+        pages = sum(1 for result in results if "error" not in result)
+        errors = len(results) - pages
+        total_bytes = sum(result["bytes"] for result in results)
+    elif scenario == "update":
+        # The pages to update and their bodies are listed before the clock starts:
+        bodies = {page["id"]: page["body"]["storage"]["value"]
+                  for pages in iter_space_pages(base_url, "bench", BENCH_SPACE_KEY, session=session, expand="body.storage")
+                  for page in pages if page["id"] != parent_page_id}
+
+        def update_one(page_id):
+            new_content = bodies[page_id] + "<p>Updated by the benchmark.</p>"
+            update_page_incremental(base_url, "bench", page_id, new_content, session)
+            return len(new_content.encode("utf-8"))
+
+        start_time = time.perf_counter()
+
+        # Every page gets a paragraph added at the end of its current body:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            sizes = list(executor.map(update_one, bodies))
+
+        pages = len(sizes)
+        errors = 0
+        total_bytes = sum(sizes)
+    else:
+        with JsonlExportWriter(os.path.join(directory, "export.jsonl")) as writer:
+            pages = export_space(base_url, "bench", BENCH_SPACE_KEY, writer, session=session)
+        errors = 0
+        total_bytes = os.path.getsize(os.path.join(directory, "export.jsonl"))
+
+    seconds = time.perf_counter() - start_time
+
+    # `ru_maxrss` is in kilobytes on Linux and in bytes on macOS:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"pages": pages, "errors": errors, "bytes": total_bytes, "seconds": seconds,
+                      "peak_rss_mb": peak / (1024 * 1024 if sys.platform == "darwin" else 1024)}))
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compares the results with a saved baseline run and returns a description of every scenario
+    that got slower (pages/s) or bigger (peak RSS) by more than the tolerance.
+    """
+    regressions = []
+    for scenario, result in results.items():
+        before = baseline.get(scenario)
+        if not before:
+            continue
+        if result["pages_per_second"] < before["pages_per_second"] * (1 - tolerance):
+            regressions.append(f"{scenario}: {result['pages_per_second']:.1f} pages/s, "
+                               f"baseline {before['pages_per_second']:.1f}")
+        if result["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{scenario}: {result['peak_rss_mb']:.1f} MB peak RSS, "
+                               f"baseline {before['peak_rss_mb']:.1f}")
+    return regressions
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures pages/s, MB/s and peak memory of the upload, update and "
+                                                 "export paths against a fake Confluence.")
+
+    parser.add_argument("--pages", type=int, default=200, help="Number of files/pages per run (default: 200).")
+    parser.add_argument("--size_kb", type=int, default=64, help="Size of each attachment in KB (default: 64).")
+    parser.add_argument("--workers", type=int, default=8, help="Worker threads of the upload paths (default: 8).")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated server latency in seconds (default: 0.02).")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fraction of requests refused with 429/503 (default: 0).")
+    parser.add_argument("--retry_after", type=float, default=0.1, help="Retry-After of refused requests (default: 0.1).")
+    parser.add_argument("--max_mb_per_second", type=float, help="Bandwidth of the fake server in MB/s (default: no limit).")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="Scenarios to run.")
+    parser.add_argument("--output", help="Write the results to this JSON file, e.g. to use as a baseline later.")
+    parser.add_argument("--baseline", help="JSON file of an earlier run; exit with 1 if any scenario regressed.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Fraction a result may be worse than the baseline before it counts as a regression (default: 0.2).")
+    parser.add_argument("--child", nargs=5, metavar=("SCENARIO", "URL", "PARENT", "DIR", "WORKERS"), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        child_run(*args.child[:4], int(args.child[4]))
+        return
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory, \
+         FakeConfluenceServer(latency=args.latency, error_rate=args.error_rate, retry_after=args.retry_after,
+                              max_bytes_per_second=args.max_mb_per_second * 1024 * 1024 if args.max_mb_per_second else None,
+                              seed=1) as server:
+
+        make_text_files(directory, args.pages, args.size_kb * 1024)
+
+        parent_page = server.store.new_page({"title": BENCH_PARENT_TITLE, "space": {"key": BENCH_SPACE_KEY},
+                                             "body": {"storage": {"value": ""}}})
+
+        print(f"{args.pages} pages, {args.size_kb} KB attachments, {args.workers} workers, "
+              f"latency {args.latency * 1000:.0f} ms, error rate {args.error_rate:g}")
+        print(f"{'scenario':<8} {'pages':>6} {'errors':>6} {'seconds':>8} {'pages/s':>8} {'MB/s':>8} "
+              f"{'peak RSS MB':>12} {'requests':>9} {'refused':>8}")
+
+        for scenario in args.scenarios:
+
+            requests_before = server.store.request_count
+            refused_before = server.store.refused_count
+
+            # Each scenario runs in a fresh process, so its peak memory is measured on its own
+            # and doesn't include the fake server's page store:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", scenario, server.base_url,
+                                     parent_page["id"], directory, str(args.workers)],
+                                    check=True, capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            seconds = max(result["seconds"], 1e-9)
+
+            result.update(pages_per_second=result["pages"] / seconds,
+                          mb_per_second=result["bytes"] / seconds / 1048576,
+                          requests=server.store.request_count - requests_before,
+                          refused=server.store.refused_count - refused_before)
+            results[scenario] = result
+
+            print(f"{scenario:<8} {result['pages']:>6} {result['errors']:>6} {result['seconds']:>8.2f} "
+                  f"{result['pages_per_second']:>8.1f} {result['mb_per_second']:>8.2f} {result['peak_rss_mb']:>12.1f} "
+                  f"{result['requests']:>9} {result['refused']:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+
+        for regression in regressions:
+            print(f"- REGRESSION {regression}")
+
+        if regressions:
+            sys.exit(1)
+
+        print(f"- No regression against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import re
+import tempfile
+import time
+
+from   text_reader import read_text_with_breaks
+
+#================================================================================================
+# Micro-benchmark of reading a text file with its line breaks turned into `<br>`:
+#================================================================================================
+
+def legacy_read_text_file_by_line(file_path):
+    """ The previous `read_text_file_by_line`: a `+=` readline loop, then `re.sub` over the whole string. """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        file_content = ''
+        line = file.readline()
+        while line:
+            file_content += line
+            line = file.readline()
+        return re.sub('\n', '<br>', file_content)
+
+def best_of(repeats: int, function, *args, **kwargs):
+    """ Runs a function `repeats` times and returns the fastest time in seconds and the last result. """
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return best, result
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compares the legacy and the new line-break reader.")
+
+    parser.add_argument("--sizes_mb", type=int, nargs="+", default=[1, 2, 4, 32, 128], help="File sizes to read, in MB.")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per reader; the fastest one is reported.")
+    parser.add_argument("--legacy_max_mb", type=int, default=4,
+                        help="Largest size the legacy reader is run on, since its time grows with the square of the size.")
+
+    args = parser.parse_args()
+
+    readers = [("legacy", legacy_read_text_file_by_line, {}),
+               ("buffered", read_text_with_breaks, {}),
+               ("mmap", read_text_with_breaks, {"use_mmap": True})]
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        print(f"{'size MB':>8}  " + "  ".join(f"{name + ' s':>12}" for name, _, _ in readers))
+
+        for size_mb in args.sizes_mb:
+
+            file_path = os.path.join(directory, f"bench_{size_mb}mb.txt")
+            line = b"benchmark log line with some padding to make it a realistic length\n"
+            with open(file_path, 'wb') as f:
+                block = line * (1024 * 1024 // len(line))
+                for _ in range(size_mb):
+                    f.write(block)
+
+            timings = []
+            expected = None
+
+            for name, reader, kwargs in readers:
+
+                if name == "legacy" and size_mb > args.legacy_max_mb:
+                    timings.append(None)
+                    continue
+
+                seconds, result = best_of(args.repeats, reader, file_path, **kwargs)
+
+                # Every reader has to produce exactly the same page text:
+                if expected is None:
+                    expected = result
+                elif result != expected:
+                    raise RuntimeError(f"The {name} reader returned different text.")
+
+                timings.append(seconds)
+
+            print(f"{size_mb:>8}  " + "  ".join(f"{'-':>12}" if seconds is None else f"{seconds:>12.3f}"
+                                                for seconds in timings))
+
+            os.remove(file_path)
+
+if __name__ == "__main__":
+    main()
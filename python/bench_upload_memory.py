@@ -0,0 +1,82 @@
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+#================================================================================================
+# Benchmark of the peak memory used to upload attachments of growing size to the fake Confluence:
+#================================================================================================
+
+def child_upload(file_path: str, mode: str):
+    """ Uploads one file in this (child) process and prints the peak RSS in MB. """
+    import requests
+    from   fake_confluence_server import FakeConfluenceServer
+    from   text_reader import read_text_preview
+    import test7_write_to_confluence
+
+    with FakeConfluenceServer() as server:
+
+        # Build the page the same way the upload scripts do, from a bounded preview:
+        page = server.store.new_page({"title": "Memory", "space": {"key": "BENCH"},
+                                      "body": {"storage": {"value": read_text_preview(file_path)}}})
+
+        if mode == "streaming":
+            test7_write_to_confluence.upload_attachment(server.base_url, "bench", page["id"], file_path)
+        else:
+            # The previous implementation: `requests` builds the multipart body in memory.
+            with open(file_path, 'rb') as file_data:
+                response = requests.post(f"{server.base_url}/rest/api/content/{page['id']}/child/attachment",
+                                         headers={"X-Atlassian-Token": "no-check"},
+                                         files={"file": (os.path.basename(file_path), file_data)})
+                response.raise_for_status()
+
+    # `ru_maxrss` is in kilobytes on Linux and in bytes on macOS:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(peak / (1024 * 1024 if sys.platform == "darwin" else 1024))
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Measures the peak memory of attachment uploads against a fake Confluence.")
+
+    parser.add_argument("--sizes_mb", type=int, nargs="+", default=[16, 64, 256], help="File sizes to upload, in MB.")
+    parser.add_argument("--legacy", action="store_true", help="Also measure the previous `files=` upload for comparison.")
+    parser.add_argument("--child", nargs=2, metavar=("FILE", "MODE"), help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.child:
+        child_upload(*args.child)
+        return
+
+    modes = ["streaming", "legacy"] if args.legacy else ["streaming"]
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        print(f"{'size MB':>8}  " + "  ".join(f"{mode + ' peak RSS MB':>22}" for mode in modes))
+
+        for size_mb in args.sizes_mb:
+
+            # A file of text lines, so the preview is read the same way as for a real log file:
+            file_path = os.path.join(directory, f"bench_{size_mb}mb.txt")
+            line = b"benchmark log line with some padding to make it a realistic length\n"
+            with open(file_path, 'wb') as f:
+                block = line * (1024 * 1024 // len(line))
+                for _ in range(size_mb):
+                    f.write(block)
+
+            # Each upload runs in a fresh process, so every peak is measured on its own:
+            peaks = []
+            for mode in modes:
+                result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", file_path, mode],
+                                        check=True, capture_output=True, text=True,
+                                        cwd=os.path.dirname(os.path.abspath(__file__)))
+                peaks.append(float(result.stdout.strip().splitlines()[-1]))
+
+            print(f"{size_mb:>8}  " + "  ".join(f"{peak:>22.1f}" for peak in peaks))
+
+            os.remove(file_path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+import argparse
+from   concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from   confluence_session import create_session, iter_result_batches, request_headers
+import functools
+import importlib
+import json
+import os
+from   instrumentation import RequestMetrics, add_instrumentation_arguments, instrument_session, report_metrics, start_profile, stop_profile
+from   rate_limit import add_rate_limit_arguments, rate_limit_options
+import requests
+from   storage_diff import plan_storage_update
+from   storage_tree import parse_storage, serialize_storage, storage_name
+import threading
+import time
+from   wait_for_ready import add_wait_for_ready_arguments, wait_if_asked
+
+# Everything the patch and the write-back need, fetched in the same request as the page itself:
+PAGE_EXPAND = "body.storage,version,ancestors,space"
+
+# Default number of pages fetched per search request (the server caps it, usually at 100):
+DEFAULT_BATCH_SIZE = 50
+
+# ==== FETCH PAGES WITH A CQL SEARCH ====
+def search_pages(base_url: str, pat: str, cql: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 session: requests.Session = None):
+    """
+    Fetches every page matching a CQL query, a batch at a time, with the body, version, ancestors
+    and space expanded, so no page needs a request of its own.
+
+    base_url:   The base URL of the Confluence server.
+    pat:        Personal Access Token for authentication.
+    cql:        The CQL query, e.g. `space = DOCS and type = page`.
+    batch_size: The number of pages asked for per request.
+    session:    Optional shared session (see `confluence_session.create_session`) to reuse connections.
+
+    Returns an iterator over the batches of pages, as lists of page dictionaries.
+
+    Raises an exception if a request fails.
+    """
+
+    params = {"cql": cql, "expand": PAGE_EXPAND, "limit": batch_size, "start": 0}
+
+    return iter_result_batches(base_url, pat, "/rest/api/content/search", params, session)
+
+# ==== FETCH PAGES BY ID ====
+def pages_by_id(base_url: str, pat: str, page_ids: list, batch_size: int = DEFAULT_BATCH_SIZE,
+                session: requests.Session = None):
+    """
+    Fetches a list of pages by ID, a batch of IDs per search request (`id in (...)`) rather than one
+    request per page. Takes the same arguments as `search_pages` and yields batches the same way.
+    """
+
+    for start in range(0, len(page_ids), batch_size):
+        batch_ids = ",".join(str(page_id) for page_id in page_ids[start:start + batch_size])
+        yield from search_pages(base_url, pat, f"id in ({batch_ids})", batch_size, session)
+
+# ==== LOAD A PATCH FUNCTION ====
+@functools.lru_cache(maxsize=None)
+def load_patch_function(patch_spec: str):
+    """
+    Imports a patch function given as "module:function", e.g. "bulk_patch:remove_empty_paragraphs".
+    The function takes the tree of one page (see `storage_tree.parse_storage`) and edits it in place.
+    It's imported by name, so the worker processes can load it too.
+    """
+
+    module_name, _, function_name = patch_spec.partition(":")
+
+    return getattr(importlib.import_module(module_name), function_name)
+
+# ==== PATCH ONE PAGE BODY ====
+def patch_storage(patch_spec: str, storage_value: str):
+    """
+    Applies a patch function to one storage-format body. Runs in a worker process.
+
+    patch_spec:    The patch function, as "module:function".
+    storage_value: The current body of the page.
+
+    Returns the patched body, or None if the patch didn't change anything.
+
+    Raises `lxml.etree.XMLSyntaxError` if the body isn't well-formed.
+    """
+
+    storage_tree = parse_storage(storage_value)
+
+    # A round trip alone already changes entity spelling (`&nbsp;` becomes a no-break space),
+    # so the patched body is compared with the round-tripped original, not with the stored text:
+    original_value = serialize_storage(storage_tree)
+
+    load_patch_function(patch_spec)(storage_tree)
+
+    patched_value = serialize_storage(storage_tree)
+
+    action, _ = plan_storage_update(original_value, patched_value)
+
+    return None if action == "unchanged" else patched_value
+
+# ==== PATCH ONE PAGE BODY, REPORTING FAILURES ====
+def try_patch_storage(patch_spec: str, storage_value: str):
+    """
+    Runs `patch_storage` in a worker process, so that a malformed body or a failing patch
+    only fails its own page instead of the whole batch.
+
+    Returns a (patched body or None, error message or None) tuple.
+    """
+
+    try:
+        return patch_storage(patch_spec, storage_value), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+# ==== WRITE ONE PATCHED PAGE BACK ====
+def write_patched_page(base_url: str, pat: str, page: dict, patched_value: str, session: requests.Session = None):
+    """
+    Writes a patched body back to its page as the next version, keeping its title and parent.
+    The update is a minor edit, so watchers aren't notified of every page of a bulk patch.
+
+    Returns the updated page, as returned by Confluence.
+
+    Raises an exception if the request fails, e.g. with a 409 if the page changed since it was fetched.
+    """
+
+    body = {
+        "id": page["id"],
+        "type": page.get("type", "page"),
+        "title": page["title"],
+        "version": {"number": page["version"]["number"] + 1, "minorEdit": True},
+        "body": {
+            "storage": {
+                "value": patched_value,
+                "representation": "storage"
+            }
+        }
+    }
+
+    # Keep the page where it is in the tree:
+    if page.get("ancestors"):
+        body["ancestors"] = [{"id": page["ancestors"][-1]["id"]}]
+
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
+
+    response = (session or requests).put(f"{base_url}/rest/api/content/{page['id']}",
+                                         headers=headers_with_pat,
+                                         data=json.dumps(body))
+    response.raise_for_status()
+
+    return response.json()
+
+# ==== PATCH MANY PAGES ====
+def bulk_patch(base_url: str, pat: str, patch_spec: str, cql: str = None, page_ids: list = None,
+               batch_size: int = DEFAULT_BATCH_SIZE, processes: int = None, writers: int = 4,
+               dry_run: bool = False, session: requests.Session = None) -> dict:
+    """
+    Patches every page matching a CQL query, or every page in a list of IDs.
+
+    The pages are fetched in expanded batches. Each batch is patched in a pool of worker processes,
+    since parsing and serializing storage format is CPU-bound, and the changed pages are written back
+    by a pool of threads while the next batch is fetched and patched.
+
+    base_url:   The base URL of the Confluence server.
+    pat:        Personal Access Token for authentication.
+    patch_spec: The patch function, as "module:function" (see `load_patch_function`).
+    cql:        The CQL query selecting the pages; give either this or `page_ids`.
+    page_ids:   The IDs of the pages to patch.
+    batch_size: The number of pages fetched per request.
+    processes:  The number of worker processes patching pages (default: one per CPU).
+    writers:    The maximum number of write requests in flight.
+    dry_run:    If True, nothing is written; the pages that would change are only counted.
+    session:    Optional shared session (see `confluence_session.create_session`); one sized for the writers
+                is created if it isn't given.
+
+    Returns a dictionary with the number of pages fetched, changed and written, and the pages
+    that failed, as (page ID, error) tuples.
+    """
+
+    if (cql is None) == (page_ids is None):
+        raise ValueError("Give either a CQL query or a list of page IDs.")
+
+    if session is None:
+        session = create_session(pat, pool_size=writers)
+
+    processes = processes or os.cpu_count() or 1
+
+    # Make sure the patch function can be imported before any worker is started:
+    load_patch_function(patch_spec)
+
+    if cql is not None:
+        batches = search_pages(base_url, pat, cql, batch_size, session)
+    else:
+        batches = pages_by_id(base_url, pat, list(page_ids), batch_size, session)
+
+    summary = {"pages": 0, "changed": 0, "written": 0, "failed": []}
+    summary_lock = threading.Lock()
+
+    # Only a bounded number of writes wait for a thread, so patched bodies don't pile up in memory:
+    write_slots = threading.BoundedSemaphore(writers * 2)
+
+    def write_one(page, patched_value):
+        try:
+            write_patched_page(base_url, pat, page, patched_value, session)
+            with summary_lock:
+                summary["written"] += 1
+        except Exception as e:
+            with summary_lock:
+                summary["failed"].append((page["id"], str(e)))
+        finally:
+            write_slots.release()
+
+    with ProcessPoolExecutor(max_workers=processes) as patch_pool, ThreadPoolExecutor(max_workers=writers) as write_pool:
+
+        for pages in batches:
+
+            values = [page["body"]["storage"]["value"] for page in pages]
+            chunk_size = max(1, len(values) // (processes * 4))
+
+            for page, (patched_value, error) in zip(pages, patch_pool.map(try_patch_storage, [patch_spec] * len(values),
+                                                                          values, chunksize=chunk_size)):
+
+                summary["pages"] += 1
+
+                if error is not None:
+                    with summary_lock:
+                        summary["failed"].append((page["id"], error))
+                    continue
+
+                if patched_value is None:
+                    continue
+
+                summary["changed"] += 1
+
+                if dry_run:
+                    print(f"- Would patch page ID {page['id']}: \"{page['title']}\"")
+                    continue
+
+                write_slots.acquire()
+                write_pool.submit(write_one, page, patched_value)
+
+    return summary
+
+# ==== EXAMPLE PATCH: REMOVE EMPTY PARAGRAPHS ====
+def remove_empty_paragraphs(storage_tree):
+    """ Removes paragraphs with no text and no elements in them, e.g. left behind by the editor. """
+
+    for paragraph in list(storage_tree.iter("p")):
+        if len(paragraph) == 0 and not (paragraph.text or "").strip():
+            parent = paragraph.getparent()
+
+            # Keep the text that followed the paragraph:
+            if paragraph.tail:
+                previous = paragraph.getprevious()
+                if previous is not None:
+                    previous.tail = (previous.tail or "") + paragraph.tail
+                else:
+                    parent.text = (parent.text or "") + paragraph.tail
+
+            parent.remove(paragraph)
+
+# ==== EXAMPLE PATCH: LABEL CODE MACROS WITHOUT A LANGUAGE AS PLAIN TEXT ====
+def default_code_language(storage_tree):
+    """ Sets the language of every code macro that has none to "text". """
+
+    name_attribute = storage_name("ac:name")
+
+    for macro in storage_tree.iter(storage_name("ac:structured-macro")):
+        if macro.get(name_attribute) != "code":
+            continue
+        if any(parameter.get(name_attribute) == "language"
+               for parameter in macro.iterchildren(storage_name("ac:parameter"))):
+            continue
+        parameter = macro.makeelement(storage_name("ac:parameter"), {name_attribute: "language"})
+        parameter.text = "text"
+        macro.insert(0, parameter)
+
+#================================================================================================
+# Main method:
+#================================================================================================
+def main():
+
+    parser = argparse.ArgumentParser(description="Applies a patch function to many Confluence pages.")
+
+    parser.add_argument("--confluence_base_url",
+                        "-u",
+                        required=True,
+                        help="The base URL of the Confluence server (http(s)://hostname:port_no).")
+
+    parser.add_argument("--personal_access_token",
+                        "-p",
+                        required=True,
+                        help="User personal access token for Confluence.")
+
+    # The pages are selected either with a CQL query or by ID:
+    page_selection = parser.add_mutually_exclusive_group(required=True)
+
+    page_selection.add_argument("--cql",
+                                help="CQL query selecting the pages, e.g. 'space = DOCS and type = page'.")
+
+    page_selection.add_argument("--page_ids",
+                                nargs="+",
+                                help="IDs of the pages to patch.")
+
+    parser.add_argument("--patch",
+                        required=True,
+                        help="The patch function as module:function, e.g. bulk_patch:remove_empty_paragraphs.")
+
+    parser.add_argument("--batch_size",
+                        type=int,
+                        default=DEFAULT_BATCH_SIZE,
+                        help=f"Number of pages fetched per request (default: {DEFAULT_BATCH_SIZE}).")
+
+    parser.add_argument("--processes",
+                        type=int,
+                        help="Number of processes patching pages (default: one per CPU).")
+
+    parser.add_argument("--writers",
+                        type=int,
+                        default=4,
+                        help="Maximum number of pages written back at the same time (default: 4).")
+
+    parser.add_argument("--dry_run",
+                        action="store_true",
+                        help="Only report how many pages would change; nothing is written.")
+
+    add_rate_limit_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_wait_for_ready_arguments(parser)
+
+    args = parser.parse_args()
+
+    session = create_session(args.personal_access_token, pool_size=args.writers, **rate_limit_options(args))
+
+    metrics = RequestMetrics()
+    instrument_session(session, metrics)
+
+    start_time = time.perf_counter()
+    profiler = start_profile(args.profile)
+
+    try:
+        wait_if_asked(args.confluence_base_url.rstrip("/"), args)
+
+        summary = bulk_patch(args.confluence_base_url.rstrip("/"),
+                             args.personal_access_token,
+                             args.patch,
+                             cql=args.cql,
+                             page_ids=args.page_ids,
+                             batch_size=args.batch_size,
+                             processes=args.processes,
+                             writers=args.writers,
+                             dry_run=args.dry_run,
+                             session=session)
+
+        for page_id, error in summary["failed"]:
+            print(f"- FAILED page ID {page_id}: {error}")
+
+        print("========================================================================")
+        print(f"- {summary['pages']} page(s) checked, {summary['changed']} would change"
+              if args.dry_run else
+              f"- {summary['pages']} page(s) checked, {summary['changed']} changed, {summary['written']} written, "
+              f"{len(summary['failed'])} failed")
+        print(f"- in {time.perf_counter() - start_time:.2f}s")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+    finally:
+        # The metrics matter most on a failed run, so they are reported whatever happened:
+        stop_profile(profiler, args.profile)
+        report_metrics(metrics, args)
+
+if __name__ == "__main__":
+    main()
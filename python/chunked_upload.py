@@ -0,0 +1,252 @@
+from   concurrent.futures import ThreadPoolExecutor
+from   confluence_session import request_headers
+import contextlib
+import hashlib
+import json
+from   multipart_stream import StreamingMultipartEncoder
+import os
+import requests
+import threading
+
+# Default size of one part attachment:
+DEFAULT_PART_SIZE = 64 * 1024 * 1024
+
+# Block size used to checksum a part without loading it:
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Directory of the upload state files and manifests. They are kept out of the source directory, so a
+# batch run never uploads them as content, and a read-only source directory can still be uploaded from:
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "confluence_upload_state")
+
+# Ending of the state file names:
+STATE_FILE_SUFFIX = ".upload_state.json"
+
+# ==== NAME OF ONE PART ATTACHMENT ====
+def part_name(filename: str, index: int) -> str:
+    """ Returns the attachment name of part `index` (counting from 1) of `filename`. """
+    return f"{filename}.part{index:04d}"
+
+# ==== CHECKSUM OF ONE PART OF A FILE ====
+def sha256_of_range(file_path: str, offset: int, length: int) -> str:
+    """
+    Computes the SHA-256 of a byte range of a file, reading it in blocks.
+
+    file_path: The full path to the file.
+    offset:    Where the range starts.
+    length:    How many bytes the range holds.
+
+    Returns the hex digest.
+    """
+
+    digest = hashlib.sha256()
+
+    with open(file_path, 'rb') as file_data:
+
+        file_data.seek(offset)
+
+        while length > 0:
+            block = file_data.read(min(length, HASH_BLOCK_SIZE))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+
+    return digest.hexdigest()
+
+# ==== DEFAULT LOCATION OF THE UPLOAD STATE FILE ====
+def default_state_path(file_path: str, state_dir: str = None) -> str:
+    """
+    Returns the path of the state file of a file being uploaded, in the state directory
+    (default: `DEFAULT_STATE_DIR`). The name starts with a hash of the file's full path,
+    so files with the same name in different directories don't share a state file.
+    """
+
+    path_hash = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+
+    return os.path.join(state_dir or DEFAULT_STATE_DIR, f"{path_hash}_{os.path.basename(file_path)}{STATE_FILE_SUFFIX}")
+
+# ==== LOAD THE PROGRESS OF AN EARLIER, INTERRUPTED UPLOAD ====
+def load_state(state_path: str, file_path: str, part_size: int):
+    """
+    Loads the progress recorded by an earlier run for the same file.
+
+    state_path: The full path to the state file.
+    file_path:  The full path to the file being uploaded.
+    part_size:  The part size of this run.
+
+    Returns the state dictionary, or None if there is nothing to resume: no state file, or one
+    recorded for a different version of the file or a different part size.
+    """
+
+    if not os.path.isfile(state_path):
+        return None
+
+    with open(state_path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+
+    file_stat = os.stat(file_path)
+
+    if (state.get("size") != file_stat.st_size or state.get("mtime") != file_stat.st_mtime
+            or state.get("part_size") != part_size):
+        return None
+
+    return state
+
+# ==== SAVE THE UPLOAD PROGRESS ====
+def save_state(state_path: str, state: dict):
+    """
+    Writes the upload state so that an interrupted run can resume from it.
+    The file is replaced atomically, so a crash never leaves a half-written state behind.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+
+    temp_path = f"{state_path}.tmp"
+
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+    os.replace(temp_path, state_path)
+
+# ==== UPLOAD ONE PART OF A FILE AS AN ATTACHMENT ====
+def upload_part(base_url: str, pat: str, page_id: str, file_path: str, name: str, offset: int, length: int,
+                session: requests.Session = None) -> dict:
+    """
+    Uploads a byte range of a file as its own attachment, streaming it from disk.
+
+    The upload uses PUT ("create or update"), so a part that was partly sent by an interrupted
+    run is simply replaced.
+
+    base_url:  The base URL of the Confluence server.
+    pat:       Personal Access Token for authentication.
+    page_id:   The ID of the Confluence page the part is attached to.
+    file_path: The full path to the file.
+    name:      The attachment name of the part.
+    offset:    Where the part starts in the file.
+    length:    How many bytes the part holds.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+
+    Returns the attachment info from the Confluence API.
+
+    Raises an exception if the request fails.
+    """
+
+    attachment_url = f"{base_url}/rest/api/content/{page_id}/child/attachment"
+
+    with StreamingMultipartEncoder("file", name, file_path, offset=offset, length=length,
+                                   fields={"minorEdit": "true"}) as upload_file:
+
+        headers_with_pat = request_headers(pat, session, {"X-Atlassian-Token": "no-check",
+                                                          "Content-Type": upload_file.content_type})
+
+        response = (session or requests).put(attachment_url, headers=headers_with_pat, data=upload_file)
+
+    response.raise_for_status()
+
+    return response.json()["results"][0]
+
+# ==== UPLOAD A LARGE FILE AS NUMBERED PART ATTACHMENTS ====
+def upload_file_in_parts(base_url: str, pat: str, page_id: str, file_path: str,
+                         part_size: int = DEFAULT_PART_SIZE, workers: int = 4, state_path: str = None,
+                         session: requests.Session = None, state: dict = None,
+                         host_slots: threading.BoundedSemaphore = None) -> dict:
+    """
+    Uploads a large file as numbered part attachments (`name.part0001`, `name.part0002`, ...)
+    in parallel, followed by a manifest attachment (`name.manifest.json`) listing the parts and
+    their SHA-256 checksums.
+
+    Every confirmed part is recorded in a local state file right away, so a run that is
+    interrupted resumes with the first part that wasn't confirmed instead of starting over.
+    The state file is removed once the manifest has been uploaded.
+
+    base_url:   The base URL of the Confluence server.
+    pat:        Personal Access Token for authentication.
+    page_id:    The ID of the Confluence page the parts are attached to.
+    file_path:  The full path to the file to be uploaded.
+    part_size:  The size of each part in bytes.
+    workers:    The number of parts uploaded at the same time.
+    state_path: The full path to the state file (default: see `default_state_path`); the manifest is
+                written next to it.
+    session:    Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    state:      The state returned by `load_state`, if the caller already loaded it.
+    host_slots: Optional semaphore limiting the number of concurrent requests to the Confluence host;
+                a slot is taken for each part, so the parts of all files together stay within the limit.
+
+    Returns the manifest.
+
+    Raises an exception if a part fails; the parts confirmed so far stay recorded.
+    """
+
+    filename = os.path.basename(file_path)
+    file_stat = os.stat(file_path)
+    state_path = state_path or default_state_path(file_path)
+
+    # With no per-host limit, every part goes out as soon as a worker is free:
+    if host_slots is None:
+        host_slots = contextlib.nullcontext()
+
+    # Resume an earlier upload of the same file to the same page, or start a new one:
+    if state is None:
+        state = load_state(state_path, file_path, part_size)
+
+    if state is None or state.get("page_id") != page_id:
+        state = {"file": filename,
+                 "size": file_stat.st_size,
+                 "mtime": file_stat.st_mtime,
+                 "part_size": part_size,
+                 "page_id": page_id,
+                 "parts": {}}
+        save_state(state_path, state)
+
+    part_count = max(1, -(-file_stat.st_size // part_size))
+    state_lock = threading.Lock()
+
+    pending = [index for index in range(1, part_count + 1) if str(index) not in state["parts"]]
+
+    if len(pending) < part_count:
+        print(f"- Resuming {filename}: {part_count - len(pending)} of {part_count} part(s) already uploaded")
+
+    def upload_one(index):
+
+        offset = (index - 1) * part_size
+        length = min(part_size, file_stat.st_size - offset)
+        name = part_name(filename, index)
+
+        checksum = sha256_of_range(file_path, offset, length)
+        with host_slots:
+            attachment = upload_part(base_url, pat, page_id, file_path, name, offset, length, session)
+
+        # Record the part as soon as Confluence has confirmed it:
+        with state_lock:
+            state["parts"][str(index)] = {"name": name,
+                                          "offset": offset,
+                                          "size": length,
+                                          "sha256": checksum,
+                                          "attachment_id": attachment["id"]}
+            save_state(state_path, state)
+
+        print(f"- Uploaded {name} ({length} bytes)")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so that the first failed part raises here:
+        list(executor.map(upload_one, pending))
+
+    manifest = {"file": filename,
+                "size": file_stat.st_size,
+                "part_size": part_size,
+                "parts": [state["parts"][str(index)] for index in range(1, part_count + 1)]}
+
+    # Write the manifest next to the state file, under the same name, and attach it to the page:
+    state_base = state_path[:-len(STATE_FILE_SUFFIX)] if state_path.endswith(STATE_FILE_SUFFIX) else state_path
+    manifest_path = f"{state_base}.manifest.json"
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    with host_slots:
+        upload_part(base_url, pat, page_id, manifest_path, f"{filename}.manifest.json",
+                    0, os.path.getsize(manifest_path), session)
+
+    # The upload is complete, so there's nothing left to resume:
+    os.remove(state_path)
+
+    return manifest
@@ -0,0 +1,162 @@
+from   atlassian import Confluence
+import requests
+from   rate_limit import AdaptiveConcurrency, DEFAULT_MAX_RETRIES, RateLimitedAdapter, RetryPolicy, TokenBucket
+import threading
+
+# Default number of pooled connections kept open to the Confluence host:
+DEFAULT_POOL_SIZE = 10
+
+# ==== CREATE A POOLED HTTP SESSION FOR CONFLUENCE ====
+def create_session(pat: str, pool_size: int = DEFAULT_POOL_SIZE, pool_block: bool = False, rate_limit: float = None,
+                   max_retries: int = DEFAULT_MAX_RETRIES, target_latency: float = None) -> requests.Session:
+    """
+    Creates one `requests.Session` that every Confluence request of a run can share, so that
+    the TCP (and TLS) connections are kept alive and reused instead of being set up for every request.
+
+    Every request sent over the session goes through `rate_limit.RateLimitedAdapter`: requests refused
+    with 429/503 (and 502/504, except POSTs) are re-sent after the server's `Retry-After` or a jittered backoff, and the number
+    of requests in flight is halved whenever the server pushes back, then grows again one at a time.
+
+    pat:            Personal Access Token for authentication.
+    pool_size:      The maximum number of connections kept open to the Confluence host; set this to at
+                    least the number of threads sharing the session. It's also the most requests in flight.
+    pool_block:     If True, a thread waits for a free pooled connection instead of opening an extra one.
+    rate_limit:     Optional maximum number of requests per second, shared by every thread of the session.
+    max_retries:    How many times a refused request is re-sent before its refusal is returned.
+    target_latency: Optional latency in seconds above which the number of requests in flight is reduced too.
+
+    Returns the session, with the authentication headers already set.
+    """
+
+    session = requests.Session()
+
+    # Size the connection pool for the number of threads sharing the session, and pace the requests sent over it:
+    adapter = RateLimitedAdapter(rate_limiter=TokenBucket(rate_limit) if rate_limit else None,
+                                 concurrency=AdaptiveConcurrency(pool_size, target_latency=target_latency),
+                                 retry_policy=RetryPolicy(max_retries),
+                                 pool_connections=1,
+                                 pool_maxsize=pool_size,
+                                 pool_block=pool_block)
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    # Build the authentication headers once for the whole session.
+    # `Content-Type` is deliberately left out, since it differs between JSON requests and attachment uploads:
+    session.headers.update({
+        "Authorization": f"Bearer {pat}",
+        "Accept": "application/json",
+        "Connection": "keep-alive"
+    })
+
+    return session
+
+# ==== CREATE A CONFLUENCE OBJECT SHARING THE SESSION ====
+def create_confluence(base_url: str, session: requests.Session) -> Confluence:
+    """
+    Creates a Confluence object that sends its requests over the given session, so that the
+    `atlassian` calls and the raw `requests` calls of an upload share the same connections.
+
+    base_url: The base URL of the Confluence server.
+    session:  The session returned by `create_session`.
+
+    Returns the Confluence object.
+    """
+
+    # The session already carries the authentication headers, so no token is passed here:
+    return Confluence(url=base_url, session=session)
+
+# ==== BUILD THE HEADERS FOR ONE REQUEST ====
+def request_headers(pat: str, session: requests.Session = None, headers: dict = None) -> dict:
+    """
+    Builds the headers for one Confluence request.
+
+    pat:     Personal Access Token for authentication.
+    session: The shared session, if any; its prebuilt authentication header is reused.
+    headers: Any extra headers the request needs (e.g. `Content-Type`).
+
+    Returns the headers to pass to the request.
+    """
+
+    request_headers = dict(headers or {})
+
+    # One-off requests without a session need the authentication header themselves:
+    if session is None or "Authorization" not in session.headers:
+        request_headers["Authorization"] = f"Bearer {pat}"
+
+    return request_headers
+
+# ==== FOLLOW A PAGINATED RESULT ====
+def iter_result_batches(base_url: str, pat: str, path: str, params: dict, session: requests.Session = None):
+    """
+    Requests a paginated REST resource (e.g. `/rest/api/content` or `/rest/api/content/search`)
+    and follows its `_links.next` cursor until the last batch.
+
+    base_url: The base URL of the Confluence server.
+    pat:      Personal Access Token for authentication.
+    path:     The path of the resource, e.g. "/rest/api/content".
+    params:   The query parameters of the first request, including `start` and `limit`;
+              the `next` links carry them on from there.
+    session:  Optional shared session (see `create_session`) to reuse connections.
+
+    Yields the `results` list of every batch that has any.
+
+    Raises an exception if a request fails.
+    """
+
+    headers_with_pat = request_headers(pat, session)
+
+    url = f"{base_url}{path}"
+
+    while url:
+
+        response = (session or requests).get(url, params=params, headers=headers_with_pat)
+        response.raise_for_status()
+
+        result = response.json()
+
+        if result.get("results"):
+            yield result["results"]
+
+        # The `next` link is relative to the base URL and already carries the query:
+        next_link = result.get("_links", {}).get("next")
+        url = f"{base_url}{next_link}" if next_link else None
+        params = None
+
+#================================================================================================
+# Session wrapper that counts the requests sent through it:
+#================================================================================================
+class CountingSession:
+    """
+    Wraps a shared session and counts the requests sent through it, so that a caller can
+    report how many round trips one piece of work took. Create one per piece of work
+    (e.g. per file); it can be passed wherever a `session` argument is accepted.
+
+    session: The shared session the requests are actually sent over.
+    """
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.count = 0
+        self.lock = threading.Lock()
+
+    @property
+    def headers(self):
+        return self.session.headers
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        with self.lock:
+            self.count += 1
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def put(self, url: str, **kwargs) -> requests.Response:
+        return self.request("PUT", url, **kwargs)
+
+    def delete(self, url: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
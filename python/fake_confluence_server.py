@@ -0,0 +1,563 @@
+from   http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import itertools
+import json
+import random
+from   rate_limit import TokenBucket
+import re
+import threading
+import time
+from   urllib.parse import parse_qs, urlencode, urlparse
+
+# Regex patterns for the REST endpoints the scripts call:
+content_id_regex_pattern = re.compile(r"^/rest/api/content/(\d+)$")
+attachment_regex_pattern = re.compile(r"^/rest/api/content/(\d+)/child/attachment$")
+attachment_filename_regex_pattern = re.compile(rb'filename="([^"]*)"')
+convert_regex_pattern = re.compile(r"^/rest/api/contentbody/convert/(\w+)$")
+child_page_regex_pattern = re.compile(r"^/rest/api/content/(\d+)/child/page$")
+
+# Regex patterns for the few CQL clauses the fake search understands, joined with AND:
+cql_and_regex_pattern = re.compile(r"\s+and\s+", re.IGNORECASE)
+cql_in_regex_pattern = re.compile(r'^(\w+)\s+in\s*\((.*)\)$', re.IGNORECASE)
+cql_equals_regex_pattern = re.compile(r'^(\w+)\s*=\s*"?([^"]*)"?$')
+cql_lastmodified_regex_pattern = re.compile(r'^lastmodified\s*(>=|>)\s*"?([^"]*)"?$', re.IGNORECASE)
+
+# Default and maximum page size of search results, like the real server:
+DEFAULT_SEARCH_LIMIT = 25
+MAX_SEARCH_LIMIT = 100
+
+# Request bodies are read in blocks of this size:
+BODY_BLOCK_SIZE = 1024 * 1024
+
+# Only the head of an attachment upload is kept, to find the file name in it:
+ATTACHMENT_HEAD_SIZE = 64 * 1024
+
+# Status codes of the injected errors; both come with a `Retry-After` header:
+INJECTED_ERROR_CODES = (429, 503)
+
+# ==== TIMESTAMP OF A NEW PAGE VERSION ====
+def version_timestamp() -> str:
+    """ Returns the current time the way Confluence writes `version.when`, e.g. "2025-07-01T09:30:00.000+00:00". """
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000+00:00", time.gmtime())
+
+# ==== TURN A SIMPLE CQL QUERY INTO A PAGE FILTER ====
+def cql_page_filter(cql: str):
+    """
+    Builds a filter for the CQL clauses the fake search understands: `id in (...)`, `title in (...)`,
+    `space = KEY`, `type = page`, `title = "..."` and `lastmodified > "yyyy-MM-dd HH:mm"`, joined with AND.
+
+    Returns a function taking a page and returning True if it matches.
+
+    Raises ValueError for anything else, which the search answers with a 400 like the real server.
+    """
+
+    checks = []
+
+    for clause in cql_and_regex_pattern.split(cql.strip()):
+
+        lastmodified_match = cql_lastmodified_regex_pattern.match(clause.strip())
+        in_match = cql_in_regex_pattern.match(clause.strip())
+        equals_match = cql_equals_regex_pattern.match(clause.strip())
+
+        if lastmodified_match:
+            # CQL dates are compared to the minute, like "yyyy-MM-dd HH:mm" or "yyyy/MM/dd HH:mm":
+            since = lastmodified_match.group(2).replace("/", "-")[:16]
+            inclusive = lastmodified_match.group(1) == ">="
+            checks.append(lambda page, since=since, inclusive=inclusive:
+                          (page["version"]["when"][:16].replace("T", " ") >= since) if inclusive else
+                          (page["version"]["when"][:16].replace("T", " ") > since))
+        elif in_match and in_match.group(1).lower() in ("id", "title"):
+            field = in_match.group(1).lower()
+            values = {value.strip().strip('"') for value in in_match.group(2).split(",")}
+            checks.append(lambda page, field=field, values=values: page[field] in values)
+        elif equals_match and equals_match.group(1).lower() == "space":
+            checks.append(lambda page, key=equals_match.group(2): page["space"]["key"] == key)
+        elif equals_match and equals_match.group(1).lower() == "type":
+            checks.append(lambda page, kind=equals_match.group(2): page["type"] == kind)
+        elif equals_match and equals_match.group(1).lower() == "title":
+            checks.append(lambda page, title=equals_match.group(2): page["title"] == title)
+        else:
+            raise ValueError(f"Could not parse cql: {clause}")
+
+    return lambda page: all(check(page) for check in checks)
+
+#================================================================================================
+# In-memory page store shared by all request handler threads:
+#================================================================================================
+class FakeConfluenceStore:
+    """ Holds the pages and attachments created through the fake server. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.attachments = {}
+        self.ids = itertools.count(100000)
+        self.request_count = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.refused_count = 0
+
+    def find_page(self, space_key, title):
+        """ Returns the page with the given title in the given space, or None. """
+        for page in self.pages.values():
+            if page["title"] == title and page["space"]["key"] == space_key:
+                return page
+        return None
+
+    def new_page(self, body):
+        """ Creates a page from a POST body and returns it. """
+        page_id = str(next(self.ids))
+        page = {
+            "id": page_id,
+            "type": body.get("type", "page"),
+            "title": body["title"],
+            "space": {"key": body["space"]["key"]},
+            "version": {"number": 1, "when": version_timestamp()},
+            "ancestors": body.get("ancestors", []),
+            "body": {"storage": {"value": body["body"]["storage"]["value"], "representation": "storage"}},
+            "_links": {"webui": f"/pages/viewpage.action?pageId={page_id}"}
+        }
+        self.pages[page_id] = page
+        return page
+
+#================================================================================================
+# Request handler implementing the subset of the REST API used by the scripts:
+#================================================================================================
+class FakeConfluenceHandler(BaseHTTPRequestHandler):
+    """ Serves `/rest/api/content` lookups, searches, child page lists, page creates/updates/deletes, attachment uploads and conversions. """
+
+    # Keep connections alive, like the real server does:
+    protocol_version = "HTTP/1.1"
+
+    # The headers and the body of a response are written separately; without TCP_NODELAY the body
+    # waits for the client's delayed ACK, which adds about 40 ms to every request on Linux:
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # Stay quiet; benchmarks send thousands of requests:
+        pass
+
+    def send_json(self, status, payload, headers: dict = None):
+        """ Sends a JSON response with a Content-Length, so keep-alive connections stay usable. """
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        # Responses share the bandwidth limit with the uploads:
+        for start in range(0, len(data), BODY_BLOCK_SIZE):
+            self.limit_bandwidth(len(data[start:start + BODY_BLOCK_SIZE]))
+            self.wfile.write(data[start:start + BODY_BLOCK_SIZE])
+
+        with self.server.store.lock:
+            self.server.store.bytes_sent += len(data)
+
+    def limit_bandwidth(self, size: int):
+        """ Waits until `size` more bytes fit in the configured bandwidth of the whole server. """
+        if self.server.bandwidth is not None:
+            self.server.bandwidth.acquire(size)
+
+    def iter_body(self):
+        """ Yields the request body in blocks, with either a Content-Length or chunked transfer encoding. """
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            while True:
+                size = int(self.rfile.readline().strip().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                while size > 0:
+                    block = self.rfile.read(min(size, BODY_BLOCK_SIZE))
+                    size -= len(block)
+                    self.limit_bandwidth(len(block))
+                    yield block
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get("Content-Length", 0))
+            while remaining > 0:
+                block = self.rfile.read(min(remaining, BODY_BLOCK_SIZE))
+                if not block:
+                    break
+                remaining -= len(block)
+                self.limit_bandwidth(len(block))
+                yield block
+
+    def read_body(self, keep: int = None):
+        """
+        Reads the request body and returns it along with its full size.
+        With `keep`, only the first `keep` bytes are held on to, so huge uploads don't fill memory.
+        """
+        kept = bytearray()
+        size = 0
+        for block in self.iter_body():
+            size += len(block)
+            if keep is None or len(kept) < keep:
+                kept += block if keep is None else block[:keep - len(kept)]
+
+        with self.server.store.lock:
+            self.server.store.request_count += 1
+            self.server.store.bytes_received += size
+
+        return bytes(kept), size
+
+    def simulate_latency(self):
+        """ Waits for the configured server-side latency before answering. """
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def starting(self) -> bool:
+        """ Returns True while the simulated startup of the server isn't over. """
+        return time.monotonic() < self.server.ready_at
+
+    def refuse_request(self) -> bool:
+        """
+        Refuses the request, like a busy Confluence would, if the server is over its request rate
+        (429) or an injected error is due (429 or 503). Either comes with a `Retry-After` header.
+        While the simulated startup lasts, every request is refused with a 503.
+        Called after the body has been read, so the connection stays usable.
+
+        Returns True if the request was refused and answered.
+        """
+
+        server = self.server
+
+        # Nothing but `/status` is served until the simulated startup is over:
+        if self.starting():
+            self.send_json(503, {"message": "Confluence is starting"})
+            return True
+
+        if server.request_rate is not None and not server.request_rate.try_acquire():
+            status = 429
+        elif server.error_rate and server.random.random() < server.error_rate:
+            status = server.random.choice(INJECTED_ERROR_CODES)
+        else:
+            return False
+
+        with server.store.lock:
+            server.store.refused_count += 1
+
+        self.send_json(status, {"message": "Too many requests" if status == 429 else "Service unavailable"},
+                       {"Retry-After": f"{server.retry_after:g}"})
+
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        store = self.server.store
+        self.read_body()
+
+        # The status endpoint answers at once, whatever the load, like the real one:
+        if url.path == "/status":
+            if self.starting():
+                self.send_json(503, {"state": "STARTING"})
+            else:
+                self.send_json(200, {"state": "RUNNING"})
+            return
+
+        if self.refuse_request():
+            return
+        self.simulate_latency()
+
+        if url.path == "/rest/api/content" and "title" in query:
+            with store.lock:
+                page = store.find_page(query.get("spaceKey"), query.get("title"))
+            self.send_json(200, {"results": [page] if page else [], "size": 1 if page else 0})
+            return
+
+        if url.path == "/rest/api/content":
+            self.list_content(query)
+            return
+
+        if url.path == "/rest/api/content/search":
+            self.search(query)
+            return
+
+        # The direct children of a page are those whose last ancestor it is:
+        child_page = child_page_regex_pattern.match(url.path)
+        if child_page:
+            self.send_results(url.path, query,
+                              lambda page: page["type"] == "page" and bool(page["ancestors"])
+                                           and page["ancestors"][-1]["id"] == child_page.group(1))
+            return
+
+        match = content_id_regex_pattern.match(url.path)
+        if match:
+            with store.lock:
+                page = store.pages.get(match.group(1))
+            if page:
+                self.send_json(200, page)
+            else:
+                self.send_json(404, {"message": "No content found with id " + match.group(1)})
+            return
+
+        self.send_json(404, {"message": "Unknown endpoint " + url.path})
+
+    def search(self, query):
+        """ Answers a CQL search with one page of results and a `next` link while more are left. """
+        try:
+            page_filter = cql_page_filter(query.get("cql", ""))
+        except ValueError as e:
+            self.send_json(400, {"message": str(e)})
+            return
+
+        self.send_results("/rest/api/content/search", query, page_filter)
+
+    def list_content(self, query):
+        """ Lists the content of a space (`spaceKey`, `type`), one page of results at a time. """
+        space_key = query.get("spaceKey")
+        content_type = query.get("type", "page")
+
+        self.send_results("/rest/api/content", query,
+                          lambda page: (space_key is None or page["space"]["key"] == space_key)
+                                       and page["type"] == content_type)
+
+    def send_results(self, path, query, page_filter):
+        """ Sends the pages matching a filter, paginated with `start`/`limit` and a `_links.next` cursor. """
+        store = self.server.store
+
+        start = int(query.get("start", 0))
+        limit = min(int(query.get("limit", DEFAULT_SEARCH_LIMIT)), MAX_SEARCH_LIMIT)
+
+        with store.lock:
+            matches = [page for page in store.pages.values() if page_filter(page)]
+
+        results = matches[start:start + limit]
+        payload = {"results": results, "start": start, "limit": limit, "size": len(results), "_links": {}}
+
+        if start + limit < len(matches):
+            next_query = dict(query, start=start + limit, limit=limit)
+            payload["_links"]["next"] = f"{path}?{urlencode(next_query)}"
+
+        self.send_json(200, payload)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        store = self.server.store
+        attachment = attachment_regex_pattern.match(url.path)
+        body, size = self.read_body(ATTACHMENT_HEAD_SIZE if attachment else None)
+        if self.refuse_request():
+            return
+        self.simulate_latency()
+
+        convert = convert_regex_pattern.match(url.path)
+        if convert:
+            self.convert_body(convert.group(1), json.loads(body))
+            return
+
+        if url.path.rstrip("/") == "/rest/api/content":
+            request = json.loads(body)
+            with store.lock:
+                if store.find_page(request["space"]["key"], request["title"]):
+                    self.send_json(400, {"message": "A page with this title already exists"})
+                    return
+                page = store.new_page(request)
+            self.send_json(200, page)
+            return
+
+        if attachment:
+            self.store_attachment(attachment.group(1), body, size)
+            return
+
+        self.send_json(404, {"message": "Unknown endpoint " + url.path})
+
+    def do_PUT(self):
+        url = urlparse(self.path)
+        store = self.server.store
+        attachment = attachment_regex_pattern.match(url.path)
+        body, size = self.read_body(ATTACHMENT_HEAD_SIZE if attachment else None)
+        if self.refuse_request():
+            return
+        self.simulate_latency()
+
+        match = content_id_regex_pattern.match(url.path)
+        if match:
+            request = json.loads(body)
+            with store.lock:
+                page = store.pages.get(match.group(1))
+                if not page:
+                    self.send_json(404, {"message": "No content found with id " + match.group(1)})
+                    return
+                if request["version"]["number"] != page["version"]["number"] + 1:
+                    self.send_json(409, {"message": "Version must be incremented on update"})
+                    return
+                page["title"] = request["title"]
+                page["version"] = {"number": request["version"]["number"], "when": version_timestamp()}
+                page["body"]["storage"]["value"] = request["body"]["storage"]["value"]
+                if request.get("ancestors"):
+                    page["ancestors"] = request["ancestors"]
+            self.send_json(200, page)
+            return
+
+        if attachment:
+            self.store_attachment(attachment.group(1), body, size)
+            return
+
+        self.send_json(404, {"message": "Unknown endpoint " + url.path})
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        store = self.server.store
+        self.read_body()
+        if self.refuse_request():
+            return
+        self.simulate_latency()
+
+        # Deleting a page moves it to the trash; here it's simply gone:
+        match = content_id_regex_pattern.match(url.path)
+        if match:
+            with store.lock:
+                page = store.pages.pop(match.group(1), None)
+            if page:
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+            else:
+                self.send_json(404, {"message": "No content found with id " + match.group(1)})
+            return
+
+        self.send_json(404, {"message": "Unknown endpoint " + url.path})
+
+    def convert_body(self, representation, request):
+        """
+        Answers `/rest/api/contentbody/convert/{to}`. Nothing is rendered: the value comes back unchanged
+        in the requested representation, which is enough to time the round trip.
+        """
+        if "value" not in request:
+            self.send_json(400, {"message": "The body to convert has no value"})
+            return
+
+        self.send_json(200, {"value": request["value"], "representation": representation, "_expandable": {}})
+
+    def store_attachment(self, page_id, body_head, size):
+        """ Records an uploaded attachment; only its name and size are kept. """
+        store = self.server.store
+        filename = attachment_filename_regex_pattern.search(body_head)
+        filename = filename.group(1).decode("utf-8") if filename else "file"
+
+        with store.lock:
+            if page_id not in store.pages:
+                self.send_json(404, {"message": "No content found with id " + page_id})
+                return
+            attachment_id = "att" + str(next(store.ids))
+            store.attachments[attachment_id] = {"page_id": page_id, "title": filename, "size": size}
+
+        self.send_json(200, {"results": [{"id": attachment_id, "type": "attachment", "title": filename,
+                                          "extensions": {"fileSize": size}}],
+                             "size": 1})
+
+#================================================================================================
+# HTTP server with room for many connections opened at once:
+#================================================================================================
+class FakeConfluenceHTTPServer(ThreadingHTTPServer):
+    """
+    A `ThreadingHTTPServer` with a longer listen backlog. The default of 5 drops the connections a
+    client opens all at once beyond that (e.g. an aiohttp pool of 16 starting up), and each dropped
+    connection only gets through when its SYN is re-sent a second later.
+    """
+
+    request_queue_size = 128
+    daemon_threads = True
+
+#================================================================================================
+# In-process fake Confluence server:
+#================================================================================================
+class FakeConfluenceServer:
+    """
+    Runs the fake Confluence REST API on a background thread, for offline tests and benchmarks.
+
+    latency:                 Seconds every request waits before it is answered, to simulate network and server time.
+    port:                    The port to listen on; 0 picks a free one.
+    error_rate:              Fraction of the requests refused with a 429 or 503, e.g. 0.05.
+    retry_after:             Seconds sent in the `Retry-After` header of refused requests.
+    max_requests_per_second: Optional request rate of the whole server; requests over it get a 429.
+    max_bytes_per_second:    Optional bandwidth of the whole server, shared by request and response bodies.
+    seed:                    Optional seed for the injected errors, so a run can be repeated exactly.
+    startup_seconds:         Seconds after the start during which the server reports "STARTING" on `/status`
+                             and answers every other request with a 503, like Confluence while it boots.
+    """
+
+    def __init__(self, latency: float = 0.0, port: int = 0, error_rate: float = 0.0, retry_after: float = 1.0,
+                 max_requests_per_second: float = None, max_bytes_per_second: float = None, seed: int = None,
+                 startup_seconds: float = 0.0):
+        self.httpd = FakeConfluenceHTTPServer(("127.0.0.1", port), FakeConfluenceHandler)
+        self.httpd.latency = latency
+        self.httpd.error_rate = error_rate
+        self.httpd.retry_after = retry_after
+        self.httpd.random = random.Random(seed)
+        self.httpd.request_rate = TokenBucket(max_requests_per_second) if max_requests_per_second else None
+        self.httpd.bandwidth = (TokenBucket(max_bytes_per_second, burst=BODY_BLOCK_SIZE)
+                                if max_bytes_per_second else None)
+        self.httpd.store = FakeConfluenceStore()
+        self.httpd.ready_at = time.monotonic() + startup_seconds
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    @property
+    def store(self) -> FakeConfluenceStore:
+        return self.httpd.store
+
+    def start(self) -> str:
+        """ Starts serving on a background thread and returns the base URL. """
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        """ Stops serving and closes the listening socket. """
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+#================================================================================================
+# Main method:
+#================================================================================================
+def main():
+
+    parser = argparse.ArgumentParser(description="Runs a local fake Confluence REST API for offline testing.")
+
+    parser.add_argument("--port", type=int, default=8090, help="Port to listen on (default: 8090).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request (default: 0).")
+    parser.add_argument("--error_rate", type=float, default=0.0,
+                        help="Fraction of the requests refused with a 429 or 503 (default: 0).")
+    parser.add_argument("--retry_after", type=float, default=1.0,
+                        help="Seconds in the Retry-After header of refused requests (default: 1).")
+    parser.add_argument("--max_requests_per_second", type=float,
+                        help="Request rate above which requests are refused with a 429 (default: no limit).")
+    parser.add_argument("--max_mb_per_second", type=float,
+                        help="Bandwidth of the server for request and response bodies, in MB/s (default: no limit).")
+    parser.add_argument("--seed", type=int, help="Seed for the injected errors, to repeat a run exactly.")
+    parser.add_argument("--startup_seconds", type=float, default=0.0,
+                        help="Seconds the server reports STARTING and refuses requests with a 503 (default: 0).")
+
+    args = parser.parse_args()
+
+    server = FakeConfluenceServer(latency=args.latency,
+                                  port=args.port,
+                                  error_rate=args.error_rate,
+                                  retry_after=args.retry_after,
+                                  max_requests_per_second=args.max_requests_per_second,
+                                  max_bytes_per_second=args.max_mb_per_second * 1024 * 1024 if args.max_mb_per_second else None,
+                                  seed=args.seed,
+                                  startup_seconds=args.startup_seconds)
+
+    print(f"Fake Confluence listening at {server.base_url} ...")
+
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
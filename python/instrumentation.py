@@ -0,0 +1,286 @@
+import cProfile
+import json
+import os
+import pstats
+import re
+import requests
+import threading
+import time
+from   urllib.parse import urlsplit
+
+# Percentiles reported for every endpoint:
+PERCENTILES = (50, 95, 99)
+
+# Number of functions listed when a profile is printed:
+PROFILE_TOP_FUNCTIONS = 30
+
+# Regex pattern used to turn the IDs in a REST path into a placeholder, so every page shares one endpoint:
+path_id_regex_pattern = re.compile(r"/\d+(?=/|$)")
+
+# ==== NAME THE ENDPOINT OF A REQUEST ====
+def endpoint_name(method: str, url: str) -> str:
+    """
+    Names the endpoint a request went to, from its method and path, with the IDs left out,
+    e.g. "POST /rest/api/content/{id}/child/attachment".
+    """
+
+    return f"{method} {path_id_regex_pattern.sub('/{id}', urlsplit(url).path)}"
+
+# ==== PERCENTILE OF A SORTED LIST ====
+def percentile(sorted_values: list, percent: float) -> float:
+    """ Returns the nearest-rank percentile of a sorted list of numbers (0 for an empty list). """
+
+    if not sorted_values:
+        return 0.0
+
+    rank = max(1, -(-len(sorted_values) * percent // 100))
+
+    return sorted_values[int(rank) - 1]
+
+#================================================================================================
+# Collector of per-request measurements:
+#================================================================================================
+class RequestMetrics:
+    """
+    Collects one measurement per Confluence request (endpoint, latency, bytes sent and received,
+    status and retries) and summarizes them per endpoint. It's fed by `instrument_session`,
+    and can be shared by every thread of a run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.started = time.perf_counter()
+
+    def record(self, endpoint: str, latency: float, bytes_sent: int, bytes_received: int, status: int, retries: int = 0):
+        """ Records one request. """
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((latency, bytes_sent, bytes_received, status, retries))
+
+    def summary(self) -> dict:
+        """
+        Summarizes the requests per endpoint.
+
+        Returns a dictionary keyed by endpoint, each with the number of requests, the number of
+        error responses (4xx/5xx), the retries, the bytes sent and received, the total latency,
+        the latency percentiles (`p50`, `p95`, `p99`, in seconds) and the count per status code.
+        """
+
+        with self.lock:
+            samples = {endpoint: list(endpoint_samples) for endpoint, endpoint_samples in self.samples.items()}
+
+        summary = {}
+
+        for endpoint, endpoint_samples in sorted(samples.items()):
+
+            latencies = sorted(sample[0] for sample in endpoint_samples)
+            statuses = {}
+
+            for sample in endpoint_samples:
+                statuses[str(sample[3])] = statuses.get(str(sample[3]), 0) + 1
+
+            summary[endpoint] = {
+                "requests": len(endpoint_samples),
+                "errors": sum(1 for sample in endpoint_samples if sample[3] >= 400),
+                "retries": sum(sample[4] for sample in endpoint_samples),
+                "bytes_sent": sum(sample[1] for sample in endpoint_samples),
+                "bytes_received": sum(sample[2] for sample in endpoint_samples),
+                "latency_total": sum(latencies),
+                **{f"p{percent}": percentile(latencies, percent) for percent in PERCENTILES},
+                "statuses": statuses
+            }
+
+        return summary
+
+    def print_summary(self):
+        """ Prints a table with one line per endpoint. """
+
+        summary = self.summary()
+
+        print("========================================================================")
+        print(f"- {sum(entry['requests'] for entry in summary.values())} request(s) "
+              f"in {time.perf_counter() - self.started:.2f}s")
+        print("------------------------------------------------------------------------")
+        print(f"{'endpoint':<50} {'count':>6} {'err':>4} {'retry':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+              f"{'sent KB':>9} {'recv KB':>9}")
+
+        for endpoint, entry in summary.items():
+            print(f"{endpoint:<50} {entry['requests']:>6} {entry['errors']:>4} {entry['retries']:>5} "
+                  f"{entry['p50'] * 1000:>8.1f} {entry['p95'] * 1000:>8.1f} {entry['p99'] * 1000:>8.1f} "
+                  f"{entry['bytes_sent'] / 1024:>9.1f} {entry['bytes_received'] / 1024:>9.1f}")
+
+    def write_json(self, output_path: str):
+        """ Writes the summary to a JSON file. """
+
+        write_file_atomically(output_path, json.dumps({"elapsed": time.perf_counter() - self.started,
+                                                       "endpoints": self.summary()}, indent=2))
+
+    def write_prometheus(self, output_path: str):
+        """
+        Writes the summary in the Prometheus text format, e.g. for the node exporter's textfile collector.
+        The file is replaced in one step, so the collector never reads half of it.
+        """
+
+        lines = [
+            "# HELP confluence_client_request_duration_seconds Latency of the Confluence requests of the last run.",
+            "# TYPE confluence_client_request_duration_seconds summary"
+        ]
+
+        summary = self.summary()
+
+        for endpoint, entry in summary.items():
+            label = prometheus_label(endpoint)
+            for percent in PERCENTILES:
+                lines.append(f'confluence_client_request_duration_seconds{{endpoint="{label}",quantile="{percent / 100}"}} '
+                             f'{entry[f"p{percent}"]}')
+            lines.append(f'confluence_client_request_duration_seconds_sum{{endpoint="{label}"}} {entry["latency_total"]}')
+            lines.append(f'confluence_client_request_duration_seconds_count{{endpoint="{label}"}} {entry["requests"]}')
+
+        lines.append("# HELP confluence_client_requests_total Confluence requests of the last run, by status.")
+        lines.append("# TYPE confluence_client_requests_total counter")
+
+        for endpoint, entry in summary.items():
+            for status, count in sorted(entry["statuses"].items()):
+                lines.append(f'confluence_client_requests_total{{endpoint="{prometheus_label(endpoint)}",status="{status}"}} {count}')
+
+        # The other counters are one summary entry each:
+        counters = (
+            ("confluence_client_request_retries_total", "retries", "Confluence requests re-sent after a refusal."),
+            ("confluence_client_request_bytes_sent_total", "bytes_sent", "Bytes sent in Confluence request bodies."),
+            ("confluence_client_request_bytes_received_total", "bytes_received", "Bytes received in Confluence response bodies.")
+        )
+
+        for metric_name, summary_key, help_text in counters:
+
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} counter")
+
+            for endpoint, entry in summary.items():
+                lines.append(f'{metric_name}{{endpoint="{prometheus_label(endpoint)}"}} {entry[summary_key]}')
+
+        write_file_atomically(output_path, "\n".join(lines) + "\n")
+
+# ==== ESCAPE A PROMETHEUS LABEL VALUE ====
+def prometheus_label(value: str) -> str:
+    """ Escapes a string for use as a Prometheus label value. """
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# ==== WRITE A FILE IN ONE STEP ====
+def write_file_atomically(output_path: str, text: str):
+    """ Writes a text file next to its destination first and then moves it in place. """
+
+    temporary_path = f"{output_path}.tmp"
+
+    with open(temporary_path, "w", encoding="utf-8") as output_file:
+        output_file.write(text)
+
+    os.replace(temporary_path, output_path)
+
+# ==== MEASURE EVERY REQUEST OF A SESSION ====
+def instrument_session(session: requests.Session, metrics: RequestMetrics) -> requests.Session:
+    """
+    Adds a response hook to a session that records every request sent over it in `metrics`:
+    lookups, creates and updates, attachment uploads and conversions alike, including the
+    `atlassian.Confluence` calls that share the session.
+
+    The latency is the time until the response headers arrived, plus reading the body for
+    requests that aren't streamed. The bytes sent are taken from `Content-Length`, so bodies sent with
+    chunked encoding count as 0. The retries are those made by `rate_limit.RateLimitedAdapter`.
+
+    session: The session returned by `confluence_session.create_session`.
+    metrics: The collector the measurements go to.
+
+    Returns the same session.
+    """
+
+    def record_response(response, stream=False, **kwargs):
+
+        latency = response.elapsed.total_seconds()
+
+        # The body is read right after the hooks anyway, unless the response is streamed:
+        if stream:
+            bytes_received = int(response.headers.get("Content-Length") or 0)
+        else:
+            start_time = time.perf_counter()
+            bytes_received = len(response.content)
+            latency += time.perf_counter() - start_time
+
+        metrics.record(endpoint_name(response.request.method, response.request.url),
+                       latency,
+                       int(response.request.headers.get("Content-Length") or 0),
+                       bytes_received,
+                       response.status_code,
+                       getattr(response, "retries", 0))
+
+    session.hooks["response"].append(record_response)
+
+    return session
+
+# ==== START PROFILING ====
+def start_profile(profile_path: str = None):
+    """
+    Starts cProfile if a profile path is given (see `stop_profile`).
+
+    Returns the running profiler, or None if no path is given.
+    """
+
+    if not profile_path:
+        return None
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    return profiler
+
+# ==== STOP PROFILING AND REPORT ====
+def stop_profile(profiler, profile_path: str = None):
+    """
+    Stops a profiler started by `start_profile`, and either prints the functions that took the most
+    time (for "-") or saves the statistics to the file (for `python -m pstats` or snakeviz).
+    Does nothing if no profiler was started.
+    """
+
+    if profiler is None:
+        return
+
+    profiler.disable()
+
+    if profile_path == "-":
+        print("========================================================================")
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    else:
+        profiler.dump_stats(profile_path)
+        print(f"- Profile written to {profile_path}")
+
+#================================================================================================
+# Command-line arguments:
+#================================================================================================
+def add_instrumentation_arguments(parser):
+    """ Adds the `--metrics`, `--metrics_json`, `--metrics_prom` and `--profile` arguments to an argument parser. """
+
+    parser.add_argument("--metrics",
+                        action="store_true",
+                        help="Print the latency percentiles, bytes and retries per Confluence endpoint at the end of the run.")
+
+    parser.add_argument("--metrics_json",
+                        help="Write the request metrics to this JSON file.")
+
+    parser.add_argument("--metrics_prom",
+                        help="Write the request metrics to this file in the Prometheus text format.")
+
+    parser.add_argument("--profile",
+                        nargs="?",
+                        const="-",
+                        help="Run under cProfile; print the top functions, or save the statistics to the given file.")
+
+def report_metrics(metrics: RequestMetrics, args):
+    """ Prints and exports the request metrics as asked for by the parsed instrumentation arguments. """
+
+    if args.metrics:
+        metrics.print_summary()
+
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
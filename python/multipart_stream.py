@@ -0,0 +1,126 @@
+import io
+import os
+import uuid
+
+# Size of the blocks read from disk while the request body is being sent:
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+#================================================================================================
+# Streaming multipart/form-data request body:
+#================================================================================================
+class StreamingMultipartEncoder(io.RawIOBase):
+    """
+    A `multipart/form-data` request body that streams one file (or a byte range of it) from disk.
+
+    Passing an open file to `requests.post(files=...)` makes `requests` build the whole multipart
+    body in memory first. This object is passed as `data=` instead: `requests` gets the exact
+    Content-Length from `len()` and then calls `read()` block by block while sending, so memory
+    use stays at one block no matter how big the file is.
+
+    field_name:   The form field the file is sent in (`file` for Confluence attachments).
+    filename:     The file name reported to the server.
+    file_path:    The full path to the file on disk.
+    content_type: The content type of the file part.
+    offset:       Where in the file the part starts, for sending one slice of a larger file.
+    length:       How many bytes of the file to send; by default everything from `offset` on.
+    fields:       Extra plain form fields (e.g. `comment`, `minorEdit`) sent before the file.
+    chunk_size:   The largest block read from disk at a time.
+    """
+
+    def __init__(self, field_name: str, filename: str, file_path: str,
+                 content_type: str = "application/octet-stream", offset: int = 0, length: int = None,
+                 fields: dict = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+
+        self.boundary = uuid.uuid4().hex
+        self.file_path = file_path
+        self.offset = offset
+        self.file_length = os.path.getsize(file_path) - offset if length is None else length
+        self.chunk_size = chunk_size
+
+        # The small parts of the body around the file content are built up front:
+        preamble = b""
+        for name, value in (fields or {}).items():
+            preamble += (f"--{self.boundary}\r\n"
+                         f"Content-Disposition: form-data; name=\"{name}\"\r\n\r\n"
+                         f"{value}\r\n").encode("utf-8")
+
+        preamble += (f"--{self.boundary}\r\n"
+                     f"Content-Disposition: form-data; name=\"{field_name}\"; filename=\"{filename}\"\r\n"
+                     f"Content-Type: {content_type}\r\n\r\n").encode("utf-8")
+
+        self.preamble = preamble
+        self.epilogue = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+        self.file_data = None
+        self.position = 0
+
+    @property
+    def content_type(self) -> str:
+        """ The `Content-Type` header value to send with the body. """
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        return len(self.preamble) + self.file_length + len(self.epilogue)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        """ Moves the read position; `requests` rewinds the body this way before re-sending it. """
+        if whence == io.SEEK_CUR:
+            position += self.position
+        elif whence == io.SEEK_END:
+            position += len(self)
+
+        self.position = max(0, min(position, len(self)))
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        """ Returns the next block of the body; an empty result means the body has been sent. """
+
+        # Never hand out more than one block at a time, even when asked for everything:
+        if size is None or size < 0 or size > self.chunk_size:
+            size = self.chunk_size
+
+        block = bytearray()
+        file_start = len(self.preamble)
+        file_end = file_start + self.file_length
+
+        while size > 0 and self.position < len(self):
+
+            if self.position < file_start:
+                piece = self.preamble[self.position:self.position + size]
+
+            elif self.position < file_end:
+                if self.file_data is None:
+                    self.file_data = open(self.file_path, 'rb')
+                self.file_data.seek(self.offset + self.position - file_start)
+                piece = self.file_data.read(min(size, file_end - self.position))
+                if not piece:
+                    raise IOError(f"{self.file_path} is shorter than expected; it changed while being uploaded.")
+
+            else:
+                piece = self.epilogue[self.position - file_end:self.position - file_end + size]
+
+            block += piece
+            self.position += len(piece)
+            size -= len(piece)
+
+        return bytes(block)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if self.file_data is not None:
+            self.file_data.close()
+            self.file_data = None
+        super().close()
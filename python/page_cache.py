@@ -0,0 +1,187 @@
+from   collections import OrderedDict
+import sqlite3
+import threading
+import time
+
+# Defaults for how long and how many page lookups are remembered:
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 10000
+
+# Default TTL of a cache backed by a SQLite file, long enough to carry the lookups from one nightly
+# cron run to the next (a page ID doesn't change; a stale version only costs a 409 and a new lookup):
+DEFAULT_SQLITE_TTL = 2 * 24 * 3600
+
+#================================================================================================
+# Cache of (space key, title) → page ID, version and web UI link:
+#================================================================================================
+class PageCache:
+    """
+    Remembers which page a (space key, title) pair resolves to, so that repeated lookups don't
+    need a `/rest/api/content?title=...` request each time.
+
+    Entries expire after `ttl` seconds and the least recently used entries are dropped once
+    `max_entries` is reached. With `sqlite_path`, every entry is also written to a SQLite file,
+    so the cache survives between cron runs; the same TTL applies to the entries read back, and
+    expired rows are deleted when the file is opened.
+
+    An entry recorded without a version (from a lookup that didn't expand it) still answers
+    lookups of the page ID, but counts as a miss for lookups that need the version.
+
+    Pages returned by create/update requests should be fed in with `put_page`, so that a write
+    never needs a follow-up read to find the new page ID or version.
+
+    ttl:         How many seconds an entry stays valid (default: `DEFAULT_TTL`, or `DEFAULT_SQLITE_TTL`
+                 with a SQLite file).
+    max_entries: How many entries are kept in memory.
+    sqlite_path: Optional SQLite file backing the cache.
+    """
+
+    def __init__(self, ttl: float = None, max_entries: int = DEFAULT_MAX_ENTRIES, sqlite_path: str = None):
+
+        if ttl is None:
+            ttl = DEFAULT_SQLITE_TTL if sqlite_path else DEFAULT_TTL
+
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.database = None
+
+        if sqlite_path:
+            self.database = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self.database.execute("CREATE TABLE IF NOT EXISTS page_cache ("
+                                  " space_key TEXT NOT NULL,"
+                                  " title     TEXT NOT NULL,"
+                                  " page_id   TEXT NOT NULL,"
+                                  " version   INTEGER,"
+                                  " webui     TEXT,"
+                                  " stored_at REAL NOT NULL,"
+                                  " PRIMARY KEY (space_key, title))")
+            # Rows that expired since the last run would never be read again:
+            self.database.execute("DELETE FROM page_cache WHERE stored_at < ?", (time.time() - ttl,))
+            self.database.commit()
+
+    def get(self, space_key: str, title: str, need_version: bool = False):
+        """
+        Looks up a page.
+
+        need_version: If True, an entry without a version number counts as a miss.
+
+        Returns a page dictionary shaped like the REST API's (`id`, `title`, `version.number`,
+        `_links.webui`), or None if the page isn't cached or its entry has expired.
+        """
+
+        key = (space_key, title)
+        now = time.time()
+
+        with self.lock:
+
+            entry = self.entries.get(key)
+
+            if entry is None and self.database is not None:
+                row = self.database.execute("SELECT page_id, version, webui, stored_at FROM page_cache"
+                                            " WHERE space_key = ? AND title = ?", key).fetchone()
+                if row:
+                    entry = {"id": row[0], "version": row[1], "webui": row[2], "stored_at": row[3]}
+                    self.store_in_memory(key, entry)
+
+            if entry is None or now - entry["stored_at"] > self.ttl or (need_version and entry["version"] is None):
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        return {"id": entry["id"],
+                "title": title,
+                "space": {"key": space_key},
+                "version": {"number": entry["version"]},
+                "_links": {"webui": entry["webui"]}}
+
+    def put(self, space_key: str, title: str, page_id: str, version: int = None, webui: str = None):
+        """ Records the page a (space key, title) pair resolves to. """
+
+        entry = {"id": str(page_id), "version": version, "webui": webui, "stored_at": time.time()}
+
+        with self.lock:
+
+            self.store_in_memory((space_key, title), entry)
+
+            if self.database is not None:
+                self.database.execute("INSERT OR REPLACE INTO page_cache VALUES (?, ?, ?, ?, ?, ?)",
+                                      (space_key, title, entry["id"], version, webui, entry["stored_at"]))
+                self.database.commit()
+
+    def put_page(self, page: dict, space_key: str = None):
+        """
+        Records a page as returned by the REST API, e.g. the response of a create or update request.
+
+        page:      The page dictionary; it needs at least `id` and `title`.
+        space_key: The space key, if the page dictionary doesn't carry `space.key`.
+        """
+
+        space_key = (page.get("space") or {}).get("key") or space_key
+
+        if not space_key or not page.get("id") or not page.get("title"):
+            return
+
+        self.put(space_key,
+                 page["title"],
+                 page["id"],
+                 (page.get("version") or {}).get("number"),
+                 (page.get("_links") or {}).get("webui"))
+
+    def invalidate(self, space_key: str, title: str):
+        """ Forgets a (space key, title) pair, e.g. after the page was renamed or deleted. """
+
+        with self.lock:
+
+            self.entries.pop((space_key, title), None)
+
+            if self.database is not None:
+                self.database.execute("DELETE FROM page_cache WHERE space_key = ? AND title = ?", (space_key, title))
+                self.database.commit()
+
+    def store_in_memory(self, key: tuple, entry: dict):
+        """ Adds an entry to the in-memory LRU, dropping the least recently used one if it's full. Hold the lock. """
+
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        """ Closes the SQLite file, if there is one. """
+
+        if self.database is not None:
+            self.database.close()
+            self.database = None
+
+# ==== LOOK UP A PAGE BY TITLE THROUGH THE CACHE ====
+def get_page_by_title_cached(confluence, space_key: str, title: str, cache: PageCache = None, expand: str = "version"):
+    """
+    Looks up a page with `Confluence.get_page_by_title`, answering from the cache when possible.
+
+    confluence: The Confluence object to interact with the Confluence API.
+    space_key:  The space key of the page.
+    title:      The title of the page.
+    cache:      Optional page cache; without it every call goes to Confluence.
+    expand:     What to expand in the lookup; the version is needed to cache a complete entry.
+
+    Returns the page dictionary, or None if the page doesn't exist.
+    """
+
+    if cache is not None:
+        page = cache.get(space_key, title, need_version="version" in expand)
+        if page is not None:
+            return page
+
+    page = confluence.get_page_by_title(space=space_key, title=title, expand=expand)
+
+    if page and cache is not None:
+        cache.put_page(page, space_key)
+
+    return page
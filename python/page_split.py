@@ -0,0 +1,324 @@
+import argparse
+from   concurrent.futures import ThreadPoolExecutor
+from   confluence_session import create_confluence, create_session, iter_result_batches, request_headers
+from   html import escape
+import os
+import re
+from   page_cache import PageCache, get_page_by_title_cached
+from   instrumentation import RequestMetrics, add_instrumentation_arguments, instrument_session, report_metrics, start_profile, stop_profile
+from   rate_limit import add_rate_limit_arguments, rate_limit_options
+import requests
+from   storage_diff import update_page_incremental
+from   storage_format import iter_text_pieces, section_chunks
+import threading
+import time
+from   upload_text_file_to_confluence import create_page, get_page_id_and_version
+from   wait_for_ready import add_wait_for_ready_arguments, wait_if_asked
+
+# Default maximum size of the body of one child page:
+DEFAULT_MAX_PAGE_BYTES = 512 * 1024
+
+# Section macro tags, as written by `storage_format.section_chunks`:
+SECTION_START = '<ac:structured-macro ac:name="section">\n'
+SECTION_END = "</ac:structured-macro>"
+
+# ==== SPLIT A DOCUMENT INTO BOUNDED PAGE BODIES ====
+def split_into_page_bodies(pieces, max_page_bytes: int = DEFAULT_MAX_PAGE_BYTES):
+    """
+    Converts text to sections of paragraphs (see `storage_format.section_chunks`) and groups
+    the sections into page bodies of at most about `max_page_bytes` bytes each.
+
+    Pages are cut between sections. A section that is too big for one page on its own is cut
+    between paragraphs, with the section closed at the end of one page and opened again on the next.
+    Only a single paragraph bigger than the limit makes a page go over it.
+
+    pieces:         The text, as an iterable of strings (lines, or pieces from `storage_format.iter_text_pieces`).
+    max_page_bytes: The size each page body is kept under.
+
+    Yields the page bodies in order; only one body is held in memory at a time.
+    """
+
+    body = []
+    body_bytes = 0
+    in_section = False
+
+    for chunk in section_chunks(pieces):
+
+        if chunk == SECTION_START:
+            in_section = True
+
+        # A section reopened at the top of a page that ends right away is left out altogether:
+        if chunk.startswith(SECTION_END) and body and body[-1] == SECTION_START:
+            body.pop()
+            body_bytes -= len(SECTION_START)
+            in_section = False
+            continue
+
+        body.append(chunk)
+        body_bytes += len(chunk.encode("utf-8"))
+
+        if chunk.startswith(SECTION_END):
+
+            in_section = False
+
+            # Between two sections is the natural place to start a new page:
+            if body_bytes >= max_page_bytes:
+                yield "".join(body)
+                body = []
+                body_bytes = 0
+
+        elif in_section and chunk == "</p>\n" and body_bytes + len(SECTION_END) >= max_page_bytes:
+
+            # The section alone is too big for the page, so it continues on the next one:
+            body.append(SECTION_END)
+            yield "".join(body)
+            body = [SECTION_START]
+            body_bytes = len(SECTION_START)
+
+    # Whatever is left makes the last page:
+    if "".join(body).strip():
+        yield "".join(body)
+
+# ==== TITLE OF ONE CHILD PAGE ====
+def child_page_title(title: str, part_number: int) -> str:
+    """ Builds the title of a child page, e.g. "Big log - Part 007". """
+    return f"{title} - Part {part_number:03d}"
+
+# ==== LIST THE CHILD PAGES OF A PAGE ====
+def child_pages_by_title(base_url: str, pat: str, page_id: str, session: requests.Session = None) -> dict:
+    """
+    Lists the direct child pages of a page, with their versions, a batch of children per request.
+
+    Returns a dictionary of title → page.
+
+    Raises an exception if a request fails.
+    """
+
+    params = {"expand": "version", "start": 0, "limit": 100}
+
+    return {page["title"]: page
+            for pages in iter_result_batches(base_url, pat, f"/rest/api/content/{page_id}/child/page", params, session)
+            for page in pages}
+
+# ==== DELETE A PAGE ====
+def delete_page(base_url: str, pat: str, page_id: str, session: requests.Session = None):
+    """
+    Deletes a page. Confluence moves it to the space's trash, where it can still be restored from.
+
+    Raises an exception if the request fails.
+    """
+
+    response = (session or requests).delete(f"{base_url}/rest/api/content/{page_id}",
+                                            headers=request_headers(pat, session))
+    response.raise_for_status()
+
+# ==== BUILD THE INDEX OF THE PARENT PAGE ====
+def index_page_body(child_titles: list, source_name: str = None) -> str:
+    """
+    Builds the body of the parent page: a note on how the document was split and a numbered list
+    linking every child page by its title.
+
+    child_titles: The titles of the child pages, in order.
+    source_name:  Optional name of the file the document was made from.
+    """
+
+    source = f" <code>{escape(source_name, quote=False)}</code>" if source_name else ""
+
+    items = "\n".join(f'<li><ac:link><ri:page ri:content-title="{escape(child_title)}"/></ac:link></li>'
+                      for child_title in child_titles)
+
+    return (f"<p>This document{source} was split into {len(child_titles)} page(s), so that each one stays "
+            f"quick to load. The parts are:</p>\n"
+            f"<ol>\n{items}\n</ol>")
+
+# ==== PUBLISH A DOCUMENT AS A PARENT PAGE WITH CHILD PAGES ====
+def publish_split_document(base_url: str, pat: str, space_key: str, parent_page_id: str, title: str, text_file: str,
+                           max_page_bytes: int = DEFAULT_MAX_PAGE_BYTES, workers: int = 4,
+                           session: requests.Session = None, cache: PageCache = None) -> dict:
+    """
+    Publishes a text file too big for one page as a page with an index, with the document split
+    over child pages underneath it.
+
+    The page is created first, so its ID is known; the child pages are then created concurrently
+    under it while the file is still being read and converted, and the page gets its index last.
+
+    Running it again updates the same pages: the existing children are listed once, and each part
+    that already has a page is fetched and written only if its content changed, with no create attempt
+    first. Parts left over from a longer earlier version of the document are deleted (to the trash);
+    other child pages added by hand are left alone.
+
+    base_url:       The base URL of the Confluence server.
+    pat:            Personal Access Token for authentication.
+    space_key:      The space key where the pages will be created.
+    parent_page_id: The ID of the page the document is published under.
+    title:          The title of the document page; the child pages are titled after it.
+    text_file:      The full path to the text file.
+    max_page_bytes: The size each child page body is kept under.
+    workers:        The number of child pages created at the same time.
+    session:        Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:          Optional page cache; the new pages are recorded in it.
+
+    Returns a dictionary with the document page, the list of child pages, in order (ID, title, version
+    and link of each), and the titles of the leftover child pages that were deleted.
+
+    Raises an exception if any of the requests fail.
+    """
+
+    # On a rerun the document page already exists and keeps its index until the new one is written;
+    # a new one holds a placeholder until the children exist:
+    document_page_id, _ = get_page_id_and_version(base_url, pat, title, space_key, session, cache)
+    existing_children = {}
+
+    if document_page_id is None:
+        document_page_id = create_page(base_url, pat, parent_page_id, title, space_key,
+                                       "<p>This document is being published; the index follows shortly.</p>",
+                                       session, cache)["id"]
+    else:
+        existing_children = child_pages_by_title(base_url, pat, document_page_id, session)
+
+    # Only a bounded number of bodies wait for a worker, so the file is never held in memory as a whole:
+    pending_slots = threading.BoundedSemaphore(workers * 2)
+
+    def publish_child(child_title, body):
+        try:
+            existing = existing_children.get(child_title)
+            if existing is not None:
+                _, page = update_page_incremental(base_url, pat, existing["id"], body, session)
+            else:
+                page = create_page(base_url, pat, document_page_id, child_title, space_key, body, session, cache,
+                                   incremental=True)
+            # Only what the index and the report need is kept, not the bodies:
+            return {"id": page["id"], "title": page["title"], "version": page.get("version"), "_links": page.get("_links")}
+        finally:
+            pending_slots.release()
+
+    futures = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        for part_number, body in enumerate(split_into_page_bodies(iter_text_pieces(text_file), max_page_bytes), start=1):
+            pending_slots.acquire()
+            futures.append(executor.submit(publish_child, child_page_title(title, part_number), body))
+
+    child_pages = [future.result() for future in futures]
+
+    # Delete the parts the document no longer has, e.g. after it shrank:
+    part_title_regex_pattern = re.compile(re.escape(title) + r" - Part \d{3,}")
+    published_titles = {page["title"] for page in child_pages}
+    deleted_titles = []
+
+    for child_title, page in sorted(existing_children.items()):
+        if child_title not in published_titles and part_title_regex_pattern.fullmatch(child_title):
+            delete_page(base_url, pat, page["id"], session)
+            if cache is not None:
+                cache.invalidate(space_key, child_title)
+            deleted_titles.append(child_title)
+
+    # Now that every child exists, replace the placeholder with the index:
+    _, document_page = update_page_incremental(base_url, pat, document_page_id,
+                                               index_page_body([page["title"] for page in child_pages],
+                                                               os.path.basename(text_file)),
+                                               session)
+
+    return {"page": document_page, "children": child_pages, "deleted": deleted_titles}
+
+#================================================================================================
+# Main method:
+#================================================================================================
+def main():
+
+    parser = argparse.ArgumentParser(description="Publishes a big text file as a page with an index and child pages.")
+
+    parser.add_argument("--confluence_base_url",
+                        "-u",
+                        required=True,
+                        help="The base URL of the Confluence server (http(s)://hostname:port_no).")
+
+    parser.add_argument("--personal_access_token",
+                        "-p",
+                        required=True,
+                        help="User personal access token for Confluence.")
+
+    parser.add_argument("--space_key",
+                        "-k",
+                        required=True,
+                        help="The Confluence space key where the pages will be created/updated.")
+
+    parser.add_argument("--parent_page_title",
+                        "-t",
+                        required=True,
+                        help="The title of the page the document is published under.")
+
+    parser.add_argument("--text_file",
+                        "-f",
+                        required=True,
+                        help="Full path to the text file to publish.")
+
+    parser.add_argument("--title",
+                        help="The title of the document page (default: the file name).")
+
+    parser.add_argument("--max_page_kb",
+                        type=int,
+                        default=DEFAULT_MAX_PAGE_BYTES // 1024,
+                        help=f"Maximum size of one child page in KB (default: {DEFAULT_MAX_PAGE_BYTES // 1024}).")
+
+    parser.add_argument("--workers",
+                        "-w",
+                        type=int,
+                        default=4,
+                        help="Number of child pages created in parallel (default: 4).")
+
+    add_rate_limit_arguments(parser)
+    add_instrumentation_arguments(parser)
+    add_wait_for_ready_arguments(parser)
+
+    args = parser.parse_args()
+
+    base_url = args.confluence_base_url.rstrip("/")
+
+    metrics = RequestMetrics()
+    profiler = start_profile(args.profile)
+
+    try:
+
+        wait_if_asked(base_url, args)
+
+        session = create_session(args.personal_access_token, pool_size=args.workers, **rate_limit_options(args))
+
+        instrument_session(session, metrics)
+        cache = PageCache()
+
+        parent_page = get_page_by_title_cached(create_confluence(base_url, session), args.space_key,
+                                               args.parent_page_title, cache)
+
+        if not parent_page:
+            raise Exception(f"Page titled '{args.parent_page_title}' in space '{args.space_key}' does not exist.")
+
+        start_time = time.perf_counter()
+
+        result = publish_split_document(base_url,
+                                        args.personal_access_token,
+                                        args.space_key,
+                                        parent_page["id"],
+                                        args.title or os.path.basename(args.text_file),
+                                        args.text_file,
+                                        max_page_bytes=args.max_page_kb * 1024,
+                                        workers=args.workers,
+                                        session=session,
+                                        cache=cache)
+
+        print(f"- Published {len(result['children'])} child page(s) in {time.perf_counter() - start_time:.2f}s")
+
+        if result["deleted"]:
+            print(f"- Deleted {len(result['deleted'])} leftover child page(s) from a longer earlier version")
+        print(f"- {base_url}{result['page']['_links']['webui']}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+
+    finally:
+        stop_profile(profiler, args.profile)
+        report_metrics(metrics, args)
+
+if __name__ == "__main__":
+    main()
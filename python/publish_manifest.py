@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import threading
+
+# Block size used to hash files without loading them:
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# ==== SHA-256 OF A FILE ====
+def sha256_of_file(file_path: str) -> str:
+    """ Computes the SHA-256 of a file, reading it in blocks, and returns the hex digest. """
+
+    digest = hashlib.sha256()
+
+    with open(file_path, 'rb') as file_data:
+        for block in iter(lambda: file_data.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+#================================================================================================
+# Local record of what has already been published:
+#================================================================================================
+class PublishManifest:
+    """
+    A local JSON file mapping each published file to its size, modification time and SHA-256,
+    and to the page ID, page version and attachment ID it was published as.
+
+    It lets the upload skip files that haven't changed since the last run without any request
+    to Confluence. A file whose size and modification time still match is not even hashed again;
+    the hash is only compared when the modification time moved but the size didn't (e.g. a file
+    that was touched or copied without being changed).
+
+    manifest_path: The full path to the manifest file; it's created on the first save.
+    """
+
+    def __init__(self, manifest_path: str):
+
+        self.manifest_path = manifest_path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.dirty = False
+
+        if os.path.isfile(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def is_unchanged(self, file_path: str) -> bool:
+        """ Returns True if the file is in the manifest and hasn't changed since it was published. """
+
+        key = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+        if entry is None or entry["size"] != file_stat.st_size:
+            return False
+
+        if entry["mtime_ns"] == file_stat.st_mtime_ns:
+            return True
+
+        # Same size but a new modification time, so only the content can tell:
+        if sha256_of_file(file_path) != entry["sha256"]:
+            return False
+
+        # Remember the new modification time, so the file isn't hashed again next time
+        # (written by `flush`, so a run that skips every file still saves it):
+        with self.lock:
+            entry["mtime_ns"] = file_stat.st_mtime_ns
+            self.dirty = True
+
+        return True
+
+    def record(self, file_path: str, page_id: str, version: int = None, attachment_id: str = None):
+        """ Records a file that has just been published and saves the manifest right away. """
+
+        file_stat = os.stat(file_path)
+        entry = {"size": file_stat.st_size,
+                 "mtime_ns": file_stat.st_mtime_ns,
+                 "sha256": sha256_of_file(file_path),
+                 "page_id": page_id,
+                 "version": version,
+                 "attachment_id": attachment_id}
+
+        with self.lock:
+            self.entries[os.path.abspath(file_path)] = entry
+            self.save()
+
+    def flush(self):
+        """ Saves the manifest if `is_unchanged` updated modification times since it was last saved. """
+
+        with self.lock:
+            if self.dirty:
+                self.save()
+
+    def save(self):
+        """ Writes the manifest; the file is replaced atomically so a crash can't leave it half-written. """
+
+        temp_path = f"{self.manifest_path}.tmp"
+
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+        os.replace(temp_path, self.manifest_path)
+
+        self.dirty = False
@@ -0,0 +1,295 @@
+from   email.utils import parsedate_to_datetime
+import random
+import requests
+from   requests.adapters import HTTPAdapter
+import threading
+import time
+
+# Status codes re-sent for idempotent methods. A 502 or 504 from a proxy can come after Confluence
+# has already carried out the request, so these are only safe for requests that can be repeated:
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+# Status codes re-sent for any method, POST included: Confluence refused the request without processing it:
+REFUSED_STATUS_CODES = (429, 503)
+
+# Methods that have the same effect whether they are sent once or twice:
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# Defaults for the retries:
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 0.5
+DEFAULT_BACKOFF_MAX = 60.0
+
+#================================================================================================
+# Token bucket limiting the request rate:
+#================================================================================================
+class TokenBucket:
+    """
+    Lets requests through at `rate` per second on average, with bursts of up to `burst` requests.
+    One bucket is shared by every thread using the session, so the limit holds for the whole run.
+
+    rate:  The sustained number of requests per second.
+    burst: The number of requests that may go out at once after a quiet spell (default: `rate`, at least 1).
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count: float = 1):
+        """ Takes `count` tokens (at most the burst size), waiting until they are available. """
+
+        while True:
+
+            with self.lock:
+
+                self.refill()
+
+                if self.tokens >= count:
+                    self.tokens -= count
+                    return
+
+                wait = (count - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+    def try_acquire(self, count: float = 1) -> bool:
+        """ Takes `count` tokens if they are available right now; returns False, without waiting, if not. """
+
+        with self.lock:
+
+            self.refill()
+
+            if self.tokens >= count:
+                self.tokens -= count
+                return True
+
+            return False
+
+    def refill(self):
+        """ Adds the tokens earned since the last call; the lock must be held. """
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+#================================================================================================
+# Concurrency limit that adapts to the server's latency (AIMD):
+#================================================================================================
+class AdaptiveConcurrency:
+    """
+    Limits the number of requests in flight, and adapts the limit to how the server copes:
+    the limit grows by one after a full round of fast, successful requests (additive increase)
+    and is halved when a request is throttled or slower than `target_latency` (multiplicative decrease).
+
+    max_concurrency: The highest the limit can go, e.g. the size of the connection pool.
+    min_concurrency: The lowest the limit can go.
+    target_latency:  Optional latency in seconds; slower requests count as a sign of an overloaded server.
+                     Without it only throttled requests (429/502/503/504) make the limit shrink, which
+                     suits runs whose requests are slow by nature, like big attachment uploads.
+    """
+
+    def __init__(self, max_concurrency: int, min_concurrency: int = 1, target_latency: float = None):
+
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.target_latency = target_latency
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """ Waits until a request may go out under the current limit. """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, throttled: bool = False):
+        """ Ends a request and adjusts the limit from its latency and whether it was throttled. """
+
+        with self.condition:
+
+            self.in_flight -= 1
+
+            slow = self.target_latency is not None and latency > self.target_latency
+
+            if throttled or slow:
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+#================================================================================================
+# Retry policy with jittered exponential backoff:
+#================================================================================================
+class RetryPolicy:
+    """
+    Decides whether a refused request is re-sent and how long to wait first.
+
+    The wait is the server's `Retry-After` when it sends one; otherwise it's a random time up to
+    `backoff_base * 2 ** attempt` seconds ("full jitter"), so that many clients refused at the same
+    moment don't all come back at the same moment.
+
+    max_retries:          How many times one request is re-sent at most.
+    backoff_base:         The upper bound of the first wait, in seconds.
+    backoff_max:          The longest wait, in seconds, also for `Retry-After`.
+    status_codes:         The status codes that are retried for idempotent methods.
+    refused_status_codes: The status codes that are retried for the other methods (POST: page creates,
+                          attachment uploads), where a second attempt could create a duplicate.
+    """
+
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES, backoff_base: float = DEFAULT_BACKOFF_BASE,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX, status_codes: tuple = RETRY_STATUS_CODES,
+                 refused_status_codes: tuple = REFUSED_STATUS_CODES):
+
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.status_codes = status_codes
+        self.refused_status_codes = refused_status_codes
+
+    def should_retry(self, response: requests.Response, attempt: int) -> bool:
+        """ Returns True if the response is a refusal worth retrying for its method and retries are left. """
+
+        if response.request is not None and response.request.method not in IDEMPOTENT_METHODS:
+            status_codes = self.refused_status_codes
+        else:
+            status_codes = self.status_codes
+
+        return response.status_code in status_codes and attempt < self.max_retries
+
+    def delay(self, response: requests.Response, attempt: int) -> float:
+        """ Returns how many seconds to wait before the next attempt. """
+
+        retry_after = retry_after_seconds(response)
+
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+# ==== READ THE RETRY-AFTER HEADER ====
+def retry_after_seconds(response: requests.Response):
+    """ Returns the wait asked for in a `Retry-After` header (seconds or an HTTP date), or None. """
+
+    value = response.headers.get("Retry-After")
+
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+#================================================================================================
+# Transport adapter applying the rate limit, the concurrency limit and the retries:
+#================================================================================================
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    An `HTTPAdapter` that sends every request of a session through a token bucket and an adaptive
+    concurrency limit, and re-sends refused requests after a backoff: 429/502/503/504 for idempotent
+    methods, only 429/503 for POST (see `RetryPolicy`). Mounted on
+    the shared session (see `confluence_session.create_session`), it covers both the raw `requests`
+    calls and the `atlassian.Confluence` calls that go over that session.
+
+    A request whose body can't be rewound (e.g. a generator sent with chunked encoding) is not re-sent;
+    its refusal is returned as it is. Seekable bodies, like `multipart_stream.StreamingMultipartEncoder`,
+    are rewound before each attempt.
+
+    rate_limiter: Optional token bucket; None sends requests as fast as the concurrency allows.
+    concurrency:  Optional adaptive concurrency limit; None leaves concurrency to the callers.
+    retry_policy: Optional retry policy; None uses the default one.
+
+    The other keyword arguments are passed on to `HTTPAdapter` (`pool_connections`, `pool_maxsize`, ...).
+    """
+
+    def __init__(self, rate_limiter: TokenBucket = None, concurrency: AdaptiveConcurrency = None,
+                 retry_policy: RetryPolicy = None, **kwargs):
+
+        self.rate_limiter = rate_limiter
+        self.concurrency = concurrency
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.retries_sent = 0
+
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+
+        attempt = 0
+
+        while True:
+
+            # Rewind the body for a retry; the first attempt may already have read it:
+            if attempt and hasattr(request.body, "seek"):
+                request.body.seek(0)
+
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+
+            if self.concurrency is not None:
+                self.concurrency.acquire()
+
+            start_time = time.monotonic()
+            throttled = False
+
+            try:
+                response = super().send(request, **kwargs)
+                throttled = response.status_code in self.retry_policy.status_codes
+            finally:
+                if self.concurrency is not None:
+                    self.concurrency.release(time.monotonic() - start_time, throttled)
+
+            replayable = request.body is None or isinstance(request.body, (bytes, str)) or hasattr(request.body, "seek")
+
+            if not (replayable and self.retry_policy.should_retry(response, attempt)):
+                # Let the caller (e.g. `instrumentation.instrument_session`) see how often it was re-sent:
+                response.retries = attempt
+                return response
+
+            delay = self.retry_policy.delay(response, attempt)
+
+            # Free the connection for others while waiting:
+            response.close()
+
+            time.sleep(delay)
+
+            attempt += 1
+            self.retries_sent += 1
+
+#================================================================================================
+# Command-line arguments:
+#================================================================================================
+def add_rate_limit_arguments(parser):
+    """ Adds the `--rate_limit`, `--max_retries` and `--target_latency` arguments to an argument parser. """
+
+    parser.add_argument("--rate_limit",
+                        type=float,
+                        help="Maximum number of requests per second sent to Confluence (default: no limit).")
+
+    parser.add_argument("--max_retries",
+                        type=int,
+                        default=DEFAULT_MAX_RETRIES,
+                        help=f"How many times a request refused with 429/503 (and 502/504, except for POST) "
+                             f"is re-sent (default: {DEFAULT_MAX_RETRIES}).")
+
+    parser.add_argument("--target_latency",
+                        type=float,
+                        help="Seconds above which a response counts as slow and the number of parallel requests "
+                             "is halved (default: only throttled responses reduce it).")
+
+def rate_limit_options(args) -> dict:
+    """ Returns the keyword arguments for `confluence_session.create_session` from the parsed rate limit arguments. """
+
+    return {"rate_limit": args.rate_limit, "max_retries": args.max_retries, "target_latency": args.target_latency}
@@ -0,0 +1,165 @@
+from   confluence_session import request_headers
+import json
+import re
+import requests
+
+# Tokens of the storage format that matter for finding block boundaries:
+# CDATA sections and comments are skipped as a whole; tags are matched with their attributes.
+storage_token_regex_pattern = re.compile(
+    r"<!\[CDATA\[.*?\]\]>"
+    r"|<!--.*?-->"
+    r"|<(/?)([A-Za-z][\w:.-]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*?)(/?)>",
+    re.DOTALL)
+
+# Regex patterns used to compare blocks the way Confluence re-serializes them:
+whitespace_between_tags_regex_pattern = re.compile(r">\s+<")
+self_closing_tag_regex_pattern = re.compile(r"\s*/>")
+
+# HTML elements that never have a closing tag:
+VOID_ELEMENTS = {"br", "hr", "img", "col", "area", "base", "input", "link", "meta", "wbr"}
+
+# ==== SPLIT A STORAGE-FORMAT BODY INTO TOP-LEVEL BLOCKS ====
+def split_blocks(storage_value: str) -> list:
+    """
+    Splits a storage-format body into its top-level blocks: every top-level element (paragraph,
+    heading, macro, table, ...) is one block, and so is any non-blank text between them.
+
+    storage_value: The storage-format XHTML.
+
+    Returns the list of blocks, with the whitespace around each one stripped.
+    """
+
+    blocks = []
+    depth = 0
+    block_start = 0
+
+    for match in storage_token_regex_pattern.finditer(storage_value):
+
+        closing, tag, _, self_closing = match.group(1), match.group(2), match.group(3), match.group(4)
+
+        # CDATA sections and comments don't change the nesting:
+        if tag is None:
+            continue
+
+        if depth == 0 and not closing:
+            # Text in front of a top-level element is a block of its own:
+            text = storage_value[block_start:match.start()].strip()
+            if text:
+                blocks.append(text)
+            block_start = match.start()
+
+        if closing:
+            depth -= 1
+        elif not self_closing and tag.lower() not in VOID_ELEMENTS:
+            depth += 1
+
+        if depth <= 0:
+            depth = 0
+            block = storage_value[block_start:match.end()].strip()
+            if block:
+                blocks.append(block)
+            block_start = match.end()
+
+    text = storage_value[block_start:].strip()
+    if text:
+        blocks.append(text)
+
+    return blocks
+
+# ==== NORMALIZE ONE BLOCK FOR COMPARISON ====
+def normalize_block(block: str) -> str:
+    """ Evens out the whitespace differences Confluence introduces when it stores a body. """
+    block = whitespace_between_tags_regex_pattern.sub("><", block)
+    return self_closing_tag_regex_pattern.sub(" />", block)
+
+# ==== WORK OUT THE SMALLEST UPDATE FOR A PAGE BODY ====
+def plan_storage_update(current_value: str, new_value: str):
+    """
+    Compares the stored body of a page with the new body, block by block.
+
+    current_value: The body currently stored in Confluence.
+    new_value:     The body about to be written.
+
+    Returns an (action, value) tuple:
+
+    - ("unchanged", None):  every block matches; there is nothing to write.
+    - ("append", value):    the new body is the current one plus blocks at the end; `value` is the
+                            current body exactly as stored, followed by the new blocks only.
+    - ("replace", value):   anything else; `value` is the new body.
+    """
+
+    current_blocks = [normalize_block(block) for block in split_blocks(current_value)]
+    new_blocks = split_blocks(new_value)
+    new_normalized = [normalize_block(block) for block in new_blocks]
+
+    if new_normalized == current_blocks:
+        return "unchanged", None
+
+    if len(new_blocks) > len(current_blocks) and new_normalized[:len(current_blocks)] == current_blocks:
+        appended = "\n".join(new_blocks[len(current_blocks):])
+        return "append", f"{current_value.rstrip()}\n{appended}" if current_value.strip() else appended
+
+    return "replace", new_value
+
+# ==== UPDATE A PAGE ONLY AS FAR AS ITS CONTENT CHANGED ====
+def update_page_incremental(base_url: str, pat: str, page_id: str, new_content: str,
+                            session: requests.Session = None, title: str = None):
+    """
+    Updates a page only if its content actually changed.
+
+    The current body and version are fetched in one request and compared with the new content
+    block by block. Nothing is written when every block matches, so no new page version is stored
+    in the database. The REST API has no partial update, so a PUT always carries a whole body; when
+    the only change is blocks added at the end, that body is the stored one untouched plus the new
+    blocks, and the update is marked as a minor edit so watchers aren't notified.
+
+    base_url:    The base URL of the Confluence server.
+    pat:         Personal Access Token for authentication.
+    page_id:     The ID of the page to update.
+    new_content: The new body of the page in storage format.
+    session:     Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    title:       The new title of the page; by default it keeps its current one.
+
+    Returns an (action, page info) tuple, where action is "unchanged", "append" or "replace";
+    for "unchanged" the page info is the page as fetched.
+
+    Raises an exception if a request fails.
+    """
+
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
+
+    # Fetch the current body and version in one request:
+    response = (session or requests).get(f"{base_url}/rest/api/content/{page_id}",
+                                         params={"expand": "body.storage,version"},
+                                         headers=headers_with_pat)
+    response.raise_for_status()
+
+    page = response.json()
+
+    action, value = plan_storage_update(page["body"]["storage"]["value"], new_content)
+
+    if action == "unchanged" and (title is None or title == page["title"]):
+        return action, page
+
+    if action == "unchanged":
+        action, value = "replace", new_content
+
+    body = {
+        "id": str(page_id),
+        "type": page.get("type", "page"),
+        "title": title or page["title"],
+        "version": {"number": page["version"]["number"] + 1, "minorEdit": action == "append"},
+        "body": {
+            "storage": {
+                "value": value,
+                "representation": "storage"
+            }
+        }
+    }
+
+    response = (session or requests).put(f"{base_url}/rest/api/content/{page_id}",
+                                         headers=headers_with_pat,
+                                         data=json.dumps(body))
+    response.raise_for_status()
+
+    return action, response.json()
@@ -0,0 +1,215 @@
+from   html import escape
+import json
+
+# Pieces of text are read at most this many characters at a time, so one huge line can't blow up memory:
+DEFAULT_PIECE_SIZE = 64 * 1024
+
+# Small chunks are joined up to this size before being written or sent:
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# A CDATA section can't contain its own end marker, so `]]>` in the text is split across two sections:
+CDATA_END = "]]>"
+CDATA_END_SPLIT = "]]]]><![CDATA[>"
+
+# ==== READ A TEXT FILE IN BOUNDED PIECES ====
+def iter_text_pieces(file_path: str, piece_size: int = DEFAULT_PIECE_SIZE, by_line: bool = True):
+    """
+    Reads a text file line by line without ever holding more than one piece of it in memory.
+
+    file_path:  The full path to the text file.
+    piece_size: The maximum number of characters per piece; longer lines are yielded in several pieces,
+                and only the last piece of a line ends with the newline.
+    by_line:    If False, the file is read in pieces of `piece_size` regardless of lines, which is much
+                faster for converters that don't look at lines (e.g. `code_macro_chunks`).
+
+    Yields the pieces of the file in order.
+    """
+
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+
+        read = file.readline if by_line else file.read
+
+        piece = read(piece_size)
+
+        while piece:
+            yield piece
+            piece = read(piece_size)
+
+# ==== CODE MACRO WITH A CDATA BODY ====
+def code_macro_chunks(pieces, language: str = None):
+    """
+    Converts text to a Confluence code macro, keeping the text exactly as it is.
+
+    pieces:   The text, as an iterable of strings (lines, or pieces from `iter_text_pieces`).
+    language: Optional language for the syntax highlighting of the macro.
+
+    Yields the storage-format XHTML in chunks.
+    """
+
+    yield '<ac:structured-macro ac:name="code">'
+
+    if language:
+        yield f'<ac:parameter ac:name="language">{escape(language)}</ac:parameter>'
+
+    yield "<ac:plain-text-body><![CDATA["
+
+    # A `]]>` can straddle two pieces, so trailing `]` characters are held back until the next piece:
+    carry = ""
+
+    for piece in pieces:
+
+        text = (carry + piece).replace(CDATA_END, CDATA_END_SPLIT)
+        kept = len(text) - len(text.rstrip("]"))
+        kept = min(kept, 2)
+
+        carry = text[len(text) - kept:] if kept else ""
+
+        if len(text) > kept:
+            yield text[:len(text) - kept]
+
+    if carry:
+        yield carry
+
+    yield "]]></ac:plain-text-body></ac:structured-macro>"
+
+# ==== SECTIONS OF PARAGRAPHS ====
+def section_chunks(pieces):
+    """
+    Converts text to Confluence sections, one section per block of lines separated by blank lines,
+    with every line in a paragraph of its own. The text is escaped, so `<` and `&` show up as written.
+
+    pieces: The text, as an iterable of strings (lines, or pieces from `iter_text_pieces`).
+
+    Yields the storage-format XHTML in chunks.
+    """
+
+    in_section = False
+    in_paragraph = False
+
+    for piece in pieces:
+
+        # Only the end of a line is stripped, so spaces where a long line was split into pieces stay:
+        line_ends = piece.endswith("\n")
+        text = piece.rstrip() if line_ends else piece
+
+        if not in_paragraph:
+            text = text.lstrip()
+
+        if in_paragraph:
+
+            # The rest of a line that was longer than one piece:
+            if text:
+                yield escape(text, quote=False)
+
+        elif not text:
+
+            # A blank line closes the current section; consecutive blank lines don't open empty ones:
+            if line_ends and in_section:
+                yield "</ac:structured-macro>\n"
+                in_section = False
+            continue
+
+        else:
+
+            if not in_section:
+                yield '<ac:structured-macro ac:name="section">\n'
+                in_section = True
+
+            yield "<p>" + escape(text, quote=False)
+            in_paragraph = True
+
+        if line_ends and in_paragraph:
+            yield "</p>\n"
+            in_paragraph = False
+
+    if in_paragraph:
+        yield "</p>\n"
+
+    if in_section:
+        yield "</ac:structured-macro>"
+
+# ==== PAGE WITH A PREVIEW AND A DOWNLOAD LINK ====
+def preview_page_chunks(preview: str, filename: str):
+    """
+    Builds the page of an uploaded text file: a heading, a preview in a code macro and a link
+    to the attachment holding the full file.
+
+    preview:  The preview of the file (see `text_reader.read_text_preview`).
+    filename: The name of the uploaded file.
+
+    Yields the storage-format XHTML in chunks.
+    """
+
+    yield f"<h1>{escape(filename, quote=False)}</h1>\n\n"
+    yield "<p>This file has been uploaded automatically to Confluence. You can download the full version below.</p>\n\n"
+    yield "<p><b>Preview:</b></p>\n\n"
+
+    yield from code_macro_chunks(preview.splitlines(keepends=True))
+
+    yield f'\n\n<p><b>Download:</b> <ac:link><ri:attachment ri:filename="{escape(filename)}"/></ac:link></p>'
+
+# ==== JOIN SMALL CHUNKS ====
+def coalesce_chunks(chunks, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """ Joins the small chunks of a converter into chunks of about `chunk_size` characters. """
+
+    buffer = []
+    buffered = 0
+
+    for chunk in chunks:
+
+        buffer.append(chunk)
+        buffered += len(chunk)
+
+        if buffered >= chunk_size:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+
+    if buffer:
+        yield "".join(buffer)
+
+# ==== WRITE STORAGE FORMAT TO A FILE ====
+def write_storage_chunks(chunks, output_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Writes the output of a converter to a file as it is generated.
+
+    chunks:      The storage-format chunks, e.g. from `section_chunks` or `code_macro_chunks`.
+    output_path: The full path to the output file.
+    chunk_size:  How many characters are joined up before each write.
+
+    Returns the number of characters written.
+    """
+
+    written = 0
+
+    with open(output_path, 'w', encoding='utf-8') as file:
+        for chunk in coalesce_chunks(chunks, chunk_size):
+            written += file.write(chunk)
+
+    return written
+
+# ==== STREAM A PAGE AS A JSON REQUEST BODY ====
+def page_body_chunks(page: dict, chunks, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """
+    Streams a create/update request body for the REST API, with the page body taken from a converter,
+    so that the body never has to be built as one string. Pass the generator as `data=` to `requests`,
+    which sends it with chunked transfer encoding.
+
+    page:       The other fields of the request (`type`, `title`, `space`, `version`, ...).
+    chunks:     The storage-format chunks of the page body.
+    chunk_size: How many characters are joined up before each chunk is sent.
+
+    Yields the JSON body in UTF-8 encoded chunks.
+    """
+
+    fields = {key: value for key, value in page.items() if key != "body"}
+
+    # Everything but the body value is small, so it's serialized as usual:
+    head = json.dumps(fields)[:-1]
+    yield f'{head}{", " if fields else ""}"body": {{"storage": {{"representation": "storage", "value": "'.encode("utf-8")
+
+    # Each chunk is escaped on its own; JSON escaping works character by character:
+    for chunk in coalesce_chunks(chunks, chunk_size):
+        yield json.dumps(chunk)[1:-1].encode("utf-8")
+
+    yield b'"}}}'
@@ -0,0 +1,143 @@
+from   html.entities import name2codepoint
+from   lxml import etree
+import re
+
+# Namespaces of the Confluence-specific elements and attributes in storage format:
+STORAGE_NAMESPACES = {
+    "ac": "http://atlassian.com/content",
+    "ri": "http://atlassian.com/resource/identifier",
+    "at": "http://atlassian.com/template"
+}
+
+# Wrapper element that gives a storage-format body (a fragment, with undeclared prefixes) one root:
+STORAGE_ROOT_TAG = "storage-root"
+
+# Regex patterns used to turn HTML named entities into character references, outside CDATA and comments:
+cdata_or_comment_regex_pattern = re.compile(r"(<!\[CDATA\[.*?\]\]>|<!--.*?-->)", re.DOTALL)
+named_entity_regex_pattern = re.compile(r"&([A-Za-z][A-Za-z0-9]*);")
+
+# The only named entities XML knows without a DTD:
+XML_ENTITIES = {"amp", "lt", "gt", "quot", "apos"}
+
+# One parser for every body; CDATA sections are kept as they are, so code macros serialize unchanged:
+storage_parser = etree.XMLParser(strip_cdata=False, resolve_entities=False, remove_blank_text=False, huge_tree=True)
+
+# ==== QUALIFIED NAME OF A STORAGE-FORMAT TAG OR ATTRIBUTE ====
+def storage_name(prefixed_name: str) -> str:
+    """
+    Turns a prefixed name as written in storage format (e.g. "ac:structured-macro" or "ri:filename")
+    into the name lxml uses for it (e.g. "{http://atlassian.com/content}structured-macro").
+    Names without a prefix are returned unchanged.
+    """
+
+    prefix, _, local_name = prefixed_name.rpartition(":")
+
+    if not prefix:
+        return prefixed_name
+
+    return f"{{{STORAGE_NAMESPACES[prefix]}}}{local_name}"
+
+# ==== REPLACE HTML ENTITIES THAT XML DOESN'T KNOW ====
+def replace_html_entities(storage_value: str) -> str:
+    """
+    Replaces the HTML named entities in a body (e.g. `&nbsp;`, `&rsquo;`) with numeric character
+    references, which any XML parser understands. CDATA sections and comments are left alone.
+    """
+
+    def replace_entity(match):
+        name = match.group(1)
+        if name in XML_ENTITIES or name not in name2codepoint:
+            return match.group(0)
+        return f"&#{name2codepoint[name]};"
+
+    parts = cdata_or_comment_regex_pattern.split(storage_value)
+
+    # The split keeps the CDATA sections and comments at the odd positions:
+    return "".join(part if index % 2 else named_entity_regex_pattern.sub(replace_entity, part)
+                   for index, part in enumerate(parts))
+
+# ==== PARSE A STORAGE-FORMAT BODY ====
+def parse_storage(storage_value: str):
+    """
+    Parses a storage-format body (as found in `body.storage.value`) into an lxml tree, without any
+    request to Confluence. The `ac:`, `ri:` and `at:` prefixes are declared on a wrapper root element,
+    so the Confluence elements can be found and edited like any other, e.g.
+    `root.iter(storage_name("ac:structured-macro"))`.
+
+    storage_value: The storage-format XHTML.
+
+    Returns the wrapper root element; its children (and its text) are the top-level content of the body.
+
+    Raises `lxml.etree.XMLSyntaxError` if the body isn't well-formed.
+    """
+
+    namespaces = " ".join(f'xmlns:{prefix}="{uri}"' for prefix, uri in STORAGE_NAMESPACES.items())
+
+    wrapped = f"<{STORAGE_ROOT_TAG} {namespaces}>{replace_html_entities(storage_value)}</{STORAGE_ROOT_TAG}>"
+
+    return etree.fromstring(wrapped.encode("utf-8"), storage_parser)
+
+# ==== SERIALIZE A TREE BACK TO STORAGE FORMAT ====
+def serialize_storage(root) -> str:
+    """
+    Serializes a tree returned by `parse_storage` back to a storage-format body, ready to be
+    written with a create/update request. The wrapper root element and its namespace
+    declarations are left out, as Confluence expects.
+
+    root: The wrapper root element returned by `parse_storage`.
+
+    Returns the storage-format XHTML.
+    """
+
+    serialized = etree.tostring(root, encoding="unicode")
+
+    # An empty body serializes as a self-closing wrapper:
+    if serialized.endswith("/>") and not len(root) and not root.text:
+        return ""
+
+    return serialized[serialized.index(">") + 1:serialized.rindex("</")]
+
+# ==== FIND MACROS IN A TREE ====
+def iter_macros(root, macro_name: str = None):
+    """
+    Iterates over the structured macros in a tree, e.g. every "code" macro.
+
+    root:       The wrapper root element returned by `parse_storage` (or any element in the tree).
+    macro_name: Optional macro name (the `ac:name` attribute) to filter on.
+
+    Yields the macro elements in document order.
+    """
+
+    name_attribute = storage_name("ac:name")
+
+    for macro in root.iter(storage_name("ac:structured-macro")):
+        if macro_name is None or macro.get(name_attribute) == macro_name:
+            yield macro
+
+# ==== READ OR SET A MACRO PARAMETER ====
+def macro_parameter(macro, parameter_name: str, value: str = None):
+    """
+    Reads a parameter of a structured macro, or sets it if `value` is given.
+
+    macro:          A macro element, e.g. from `iter_macros`.
+    parameter_name: The `ac:name` of the parameter.
+    value:          The new value; the parameter is added if the macro doesn't have it yet.
+
+    Returns the value of the parameter, or None if the macro doesn't have it.
+    """
+
+    name_attribute = storage_name("ac:name")
+    parameter_tag = storage_name("ac:parameter")
+
+    parameter = next((child for child in macro.iterchildren(parameter_tag)
+                      if child.get(name_attribute) == parameter_name), None)
+
+    if value is not None:
+
+        if parameter is None:
+            parameter = etree.Element(parameter_tag, {name_attribute: parameter_name})
+            macro.insert(0, parameter)
+
+        parameter.text = value
+
+    return parameter.text if parameter is not None else None
@@ -1,8 +1,11 @@
 from atlassian import Confluence
+from page_cache import get_page_by_title_cached
 import json
 import os
 import re
 import requests
+from storage_format import code_macro_chunks, iter_text_pieces, section_chunks
+from text_reader import read_text_with_breaks
 import urllib
 
 # Regex pattern to match the Confluence page ID if already in URL:
@@ -11,20 +14,23 @@ page_id_in_url_regex_pattern = re.compile(r"\?pageId=(\d+)")
 #================================================================================================
 # Function that extracts the ID of the Confluence page specified in the `page_url`:
 #================================================================================================
-def get_page_id_from_url(confluence, url):
+def get_page_id_from_url(confluence, url, cache=None):
     """ Extracts the page ID from the given URL or retrieves it using the Confluence API. """
     page_url = urllib.parse.unquote(url) #unquoting url to deal with special characters like '%'
     space, page_title = page_url.split("/")[-2:]
 
     # If there's a page ID found in the response URL, parse the URL and return it:
-    if re.search(page_id_in_url_regex_pattern, page_title):
-        return_str = "The ID of the page is: " + re.search(page_id_in_url_regex_pattern, page_title).group(1)
+    page_id_match = page_id_in_url_regex_pattern.search(page_title)
+
+    if page_id_match:
+        return_str = "The ID of the page is: " + page_id_match.group(1)
         return return_str
     
     # No page ID was found in the response URL:
     else:
         page_title = page_title.replace("+", " ")
-        return_str = "The ID the page at \"" + str(page_title) + "\" is: " + confluence.get_page_id(space, page_title)
+        # Resolve the title through the page cache, if one is given, so repeated URLs don't need a request:
+        return_str = "The ID the page at \"" + str(page_title) + "\" is: " + get_page_by_title_cached(confluence, space, page_title, cache)["id"]
         return return_str
 
 #================================================================================================
@@ -41,36 +47,15 @@ def read_text_file(file_path):
 #================================================================================================
 # Function that reads the content of an unstructured text file:
 #================================================================================================
-def read_text_file_by_line(file_path):
-    """Reads the content of an unstructured text file line-by-line."""
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"The file {file_path} does not exist.")
-    
-    with open(file_path, 'r', encoding='utf-8') as file:
-#       return file.readlines()
-
-        # Initialize the string used for the page HTML:
-        file_content = ''
-
-        # Read the first line of the file:
-        line = file.readline()
-
-        # Loop through all the rest of the lines in the file:
-        while line:
-
-            # Add the last line read to the string:
-            file_content += line
-            # Read the next line of the file:
-            line = file.readline()
-
-        # After the entire file is read into a string, close the file:
-        file.close()
-
-        # Search the string for carriage returns and replace them with HTML line breaks:
-        file_content = re.sub('\n', '<br>', file_content)            
+def read_text_file_by_line(file_path, use_mmap=False):
+    """
+    Reads the content of an unstructured text file as one string, with its line breaks
+    replaced by HTML line breaks.
 
-        # Return the read file as a continuous string:
-        return file_content
+    The file is read in blocks and the line breaks are replaced as each block is read
+    (see `text_reader.iter_text_with_breaks`), so the file is only passed over once.
+    """
+    return read_text_with_breaks(file_path, use_mmap=use_mmap)
 
 #================================================================================================
 # Method which takes text content and applies format for Confluence's `storage` format:
@@ -79,18 +64,12 @@ def format_for_confluence(content):
     """
     Formats the content into Confluence Storage Format.
     Assumes sections are separated by blank lines.
+
+    `content` can be any iterable of lines, e.g. a list or `iter_text_pieces(path)`;
+    the XHTML is built from the chunks of `storage_format.section_chunks` in one join
+    instead of growing a string line by line.
     """
-    confluence_content = "<ac:structured-macro ac:name=\"section\">\n"
-    for line in content:
-        line = line.strip()
-        if not line:
-            # Close the current section and start a new one
-            confluence_content += "</ac:structured-macro>\n<ac:structured-macro ac:name=\"section\">\n"
-        else:
-            # Wrap each line in a paragraph tag
-            confluence_content += f"<p>{line}</p>\n"
-    confluence_content += "</ac:structured-macro>"  # Close the last section
-    return confluence_content
+    return "".join(section_chunks(content))
 
 #================================================================================================
 # Method which writes formatted output to a file on the local filesystem:
@@ -105,8 +84,8 @@ def save_to_file(output_path, content):
 # Method which wraps text in the appropriate tags for Confluence XHTML `storage` format:
 #================================================================================================
 def wrap_in_confluence_format(text):
-    # Wrap in <pre> tags to preserve formatting (like code block):
-    return f"<ac:structured-macro ac:name='code'><ac:plain-text-body><![CDATA[{text}]]></ac:plain-text-body></ac:structured-macro>"
+    # Wrap in a code macro to preserve formatting; any `]]>` in the text is split across CDATA sections:
+    return "".join(code_macro_chunks([text]))
 
 #================================================================================================
 # Main method:
@@ -142,9 +121,10 @@ def main():
 #   page_html = '<p>This page was created by Andrew Poloni with Python v3.13.3.</p>'
 #   page_html = read_text_file_by_line('/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/lorem_ipsum_html_cropped.html')
 #   page_html = read_text_file('/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lorem_ipsum_formatted_for_confluence.xml')
-    page_html = read_text_file('/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lorem_ipsum.txt')
+#   page_html = read_text_file('/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lorem_ipsum.txt')
 #   formatted_page_html = wrap_in_confluence_format(page_html)
-    formatted_page_html = format_for_confluence(page_html)
+    text_path = '/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lorem_ipsum.txt'
+    formatted_page_html = format_for_confluence(iter_text_pieces(text_path))
     save_to_file('/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lorem_ipsum_formatted_for_confluence.xhtml', formatted_page_html)
 
     #parent_page_id = {Parent Page ID}
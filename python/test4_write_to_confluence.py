@@ -6,6 +6,8 @@ import json
 import keyring
 import requests
 import lxml.html
+from storage_diff import plan_storage_update
+from storage_tree import parse_storage, serialize_storage
 
 # -----------------------------------------------------------------------------
 # Globals
@@ -19,11 +21,11 @@ VIEW_URL = "http://localhost:8090/pages/viewpage.action?pageId="
 USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/48.0.2564.82 Safari/537.36"
 
 def pprint(data):
-    print json.dumps(
+    print(json.dumps(
         data,
         sort_keys=True,
         indent=4,
-        separators=(', ', ' : '))
+        separators=(', ', ' : ')))
 
 
 def get_page_ancestors(auth, pageid):
@@ -41,7 +43,8 @@ def get_page_ancestors(auth, pageid):
 
 
 def get_page_info(auth, page_id):
-    url = '{base}/{page_id}'.format(
+    # Body, version and ancestors all come back from this one request
+    url = '{base}/{page_id}?expand=body.storage,version,ancestors'.format(
         base=BASE_URL,
         page_id=page_id)
 
@@ -89,14 +92,17 @@ def convert_view_to_db(auth2, html):
 def write_data(auth, html, page_id):
     info = get_page_info(auth, page_id)
 
-    ver = int(info['version']['number']) + 1
+    # Compare with the stored body first: an unchanged page gets no new version,
+    # and a page that only grew keeps its stored body untouched in front of the new blocks
+    action, html = plan_storage_update(info['body']['storage']['value'], str(html))
+
+    if action == 'unchanged':
+        print("'%s' is unchanged, nothing written" % info['title'])
+        return ""
 
-    ancestors = get_page_ancestors(auth, page_id)
+    ver = int(info['version']['number']) + 1
 
-    anc = ancestors[-1]
-    del anc['_links']
-    del anc['_expandable']
-    del anc['extensions']
+    anc = {'id': info['ancestors'][-1]['id']}
 
     info['title'] = "Team City Change Log"
 
@@ -104,7 +110,7 @@ def write_data(auth, html, page_id):
         'id': str(page_id),
         'type': 'page',
         'title': info['title'],
-        'version': {'number': ver},
+        'version': {'number': ver, 'minorEdit': action == 'append'},
         'ancestors': [anc],
         'body': {
             'storage':
@@ -130,8 +136,8 @@ def write_data(auth, html, page_id):
 
     r.raise_for_status()
 
-    print "Wrote '%s' version %d" % (info['title'], ver)
-    print "URL: %s%d" % (VIEW_URL, page_id)
+    print("Wrote '%s' version %d (%s)" % (info['title'], ver, action))
+    print("URL: %s%d" % (VIEW_URL, page_id))
 
     return ""
 
@@ -149,16 +155,23 @@ def read_data(auth, page_id):
     return r
 
 
-def patch_html(auth, options):
+def patch_html(auth, options, patch=None):
+    # Parse the storage format locally instead of converting it to the view format
+    # and back on the server (convert_db_to_view / convert_view_to_db), which took
+    # two extra round trips per page
     json_text = read_data(auth, options.pageid).text
     json2 = json.loads(json_text)
     html_storage_txt = json2['body']['storage']['value']
-    html_display_json = convert_db_to_view(auth, html_storage_txt)
-    html_display_txt = html_display_json['value'].encode('utf-8')
+    storage_tree = parse_storage(html_storage_txt)
+
+    # PATCH
+    # patch(storage_tree) edits the tree in place: custom patching of HTML here,
+    # e.g. with storage_tree.iter_macros or lxml's find/iter using storage_name("ac:...")
+    if patch is not None:
+        patch(storage_tree)
 
-    # PATCH 
-    # new_view_string = custom patching of HTML here,
-    return new_view_string
+    new_storage_string = serialize_storage(storage_tree)
+    return new_storage_string
 
 
 def get_login(username=None):
@@ -193,7 +206,6 @@ def main():
     auth = get_login(options.user)
 
     html = patch_html(auth, options)
-    html = html.replace('&Acirc;', '')
     write_data(auth, html, options.pageid)
     return
 
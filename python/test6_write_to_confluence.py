@@ -1,6 +1,5 @@
-import html
-import json
 import requests
+from storage_format import code_macro_chunks, iter_text_pieces, page_body_chunks
 
 # ==== CONFIGURATION ====
 # CONFLUENCE_BASE_URL = "https://your-confluence-server"  # No /wiki or /rest
@@ -16,23 +15,16 @@ TEXT_FILE_PATH = "/Users/andrewpoloni/Git_repos/Confluence_MySQL_stack/python/Lo
 PAT = "MjA1ODczMzA4OTA2OhMelDOf91qGExdua3d2rqZk/b+5"
 
 # ==== FUNCTIONS ====
-def read_and_convert_to_storage_format(path: str) -> str:
+def read_and_convert_to_storage_format(path: str):
    """
    Reads a plain-text file and converts it to Confluence storage format XHTML
    wrapped in a code macro to preserve formatting.
-   """
-   with open(path, 'r', encoding='utf-8') as f:
-      raw_text = f.read()
-
-   escaped = html.escape(raw_text)
 
-   xhtml = f"""
-<ac:structured-macro ac:name="code">
-<ac:plain-text-body><![CDATA[{escaped}]]></ac:plain-text-body>
-</ac:structured-macro>
-""".strip()
-
-   return xhtml
+   The file is read line by line and the XHTML is yielded in chunks, so it can be
+   streamed straight into the request body without holding the whole page in memory.
+   The text inside the CDATA section is kept as it is (escaping it would show `&amp;` etc. on the page).
+   """
+   return code_macro_chunks(iter_text_pieces(path, by_line=False))
 
 def get_page_id_and_version(title: str, space_key: str, headers: dict):
    url = f"{CONFLUENCE_BASE_URL}/rest/api/content"
@@ -52,19 +44,20 @@ def get_page_id_and_version(title: str, space_key: str, headers: dict):
 
    return None, None
 
-def create_or_update_confluence_page(title: str, space_key: str, content: str, headers: dict):
+def create_or_update_confluence_page(title: str, space_key: str, content, headers: dict):
+   """
+   Creates or updates the page; `content` is the storage-format XHTML, either as one string
+   or as the chunks yielded by `read_and_convert_to_storage_format`.
+   """
    page_id, version = get_page_id_and_version(title, space_key, headers)
 
+   if isinstance(content, str):
+      content = [content]
+
    body = {
       "type": "page",
       "title": title,
-      "space": {"key": space_key},
-      "body": {
-         "storage": {
-         "value": content,
-         "representation": "storage"
-         }
-      }
+      "space": {"key": space_key}
    }
 
    if page_id:
@@ -72,13 +65,13 @@ def create_or_update_confluence_page(title: str, space_key: str, content: str, h
       print(f"Updating existing page (ID: {page_id})...")
       body["version"] = {"number": version + 1}
       url = f"{CONFLUENCE_BASE_URL}/rest/api/content/{page_id}"
-      response = requests.put(url, headers=headers, data=json.dumps(body))
+      response = requests.put(url, headers=headers, data=page_body_chunks(body, content))
 
    else:
 
       print("Creating a new page...")
       url = f"{CONFLUENCE_BASE_URL}/rest/api/content/"
-      response = requests.post(url, headers=headers, data=json.dumps(body))
+      response = requests.post(url, headers=headers, data=page_body_chunks(body, content))
 
    response.raise_for_status()
    print("Page successfully published.")
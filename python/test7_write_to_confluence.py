@@ -1,35 +1,32 @@
 import argparse
+from   confluence_session import create_session, request_headers
 from   datetime import date
 import json
+from   multipart_stream import StreamingMultipartEncoder
 import os
+from   page_cache import PageCache
 import requests
+from   storage_diff import update_page_incremental
+from   storage_format import preview_page_chunks
+from   instrumentation import RequestMetrics, add_instrumentation_arguments, instrument_session, report_metrics, start_profile, stop_profile
+from   rate_limit import add_rate_limit_arguments, rate_limit_options
+from   text_reader import add_preview_arguments, preview_options, read_text_preview
 
 # ==== CONVERT UPLOAD TEXT TO FORMATTED XHTML ====
 def convert_text_to_xhtml(text: str, filename: str) -> str:
     """
     Generates formatted Confluence storage-format XHTML with a heading, text preview,
     and a downloadable attachment link.
-    """
-    # Short preview only, to avoid long pages in the browser:
-    # You would replace `text` in the f-string below with `preview` if you want to show the preview instead.
-#   preview = html.escape("\n".join(text.splitlines()[:20]))
-
-    return f"""
-<h1>{filename}</h1>
-
-<p>This file has been uploaded automatically to Confluence. You can download the full version below.</p>
-
-<p><b>Preview:</b></p>
 
-<ac:structured-macro ac:name="code">
-  <ac:plain-text-body><![CDATA[{text}]]></ac:plain-text-body>
-</ac:structured-macro>
+    text:     The preview of the file (see `text_reader.read_text_preview`); the full file goes in the attachment.
+    filename: The name of the uploaded file.
+    """
 
-<p><b>Download:</b> <ac:link><ri:attachment ri:filename="{filename}"/></ac:link></p>
-""".strip()
+    return "".join(preview_page_chunks(text, filename))
 
 # ==== FIND OR CREATE CONFLUENCE PAGE ====
-def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str):
+def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str, session: requests.Session = None,
+                            cache: PageCache = None):
     """
     Retrieves the Confluence page ID and version number for a given title and space key.
     If the page does not exist, it returns None.
@@ -38,12 +35,20 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     pat:       Personal Access Token for authentication.
     title:     The title of the Confluence page.
     space_key: The space key where the page will be created/updated.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:     Optional page cache (see `page_cache.PageCache`) answering repeated lookups without a request.
 
     Returns the page ID and version number if the page exists, otherwise returns None.
 
     Raises an exception if the request fails.
     """
 
+    # Answer from the page cache if the page was looked up or written recently, with its version:
+    if cache is not None:
+        page = cache.get(space_key, title, need_version=True)
+        if page is not None:
+            return page["id"], page["version"]["number"]
+
     # Set the URL for the Confluence API to search for the page:
     url = f"{base_url}/rest/api/content"
 
@@ -55,13 +60,10 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     }
 
     # Create the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-        "Authorization": f"Bearer {pat}",
-        "Content-Type": "application/json"
-    } 
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
 
     # Make the GET request to Confluence to find the page we're looking for:
-    response = requests.get(url, params=params, headers=headers_with_pat)
+    response = (session or requests).get(url, params=params, headers=headers_with_pat)
     response.raise_for_status()
 
     # Parse the JSON response:
@@ -70,21 +72,30 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     # If the page exists, return its ID and version number:
     if results:
         page = results[0]
+
+        if cache is not None:
+            cache.put_page(page, space_key)
+
         return page["id"], page["version"]["number"]
 
     return None, None
 
 # ==== CREATE OR UPDATE CONFLUENCE PAGE ====
-def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, content: str):
+def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, content: str,
+                          session: requests.Session = None, cache: PageCache = None, incremental: bool = False):
     """
     Creates or updates a Confluence page with the given title and content.
     If a page with the same title exists, it will be updated. Otherwise, a new page will be created.
 
-    base_url:  The base URL of the Confluence server.
-    pat:       Personal Access Token for authentication.
-    title:     The title of the Confluence page.
-    space_key: The space key where the page will be created/updated.
-    content:   The content to be added to the page in XHTML format.
+    base_url:    The base URL of the Confluence server.
+    pat:         Personal Access Token for authentication.
+    title:       The title of the Confluence page.
+    space_key:   The space key where the page will be created/updated.
+    content:     The content to be added to the page in XHTML format.
+    session:     Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:       Optional page cache; the written page is recorded in it, so it never needs a follow-up read.
+    incremental: If True, an existing page is compared with the new content first and is only
+                 written if it changed (see `storage_diff.update_page_incremental`).
 
     Returns the response from the Confluence API.
 
@@ -97,7 +108,7 @@ def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, c
     # Check if the page already exists:
     # If it does, get the page ID and version number;
     # If it doesn't, create a new page.
-    page_id, version = get_page_id_and_version(base_url, pat, title, space_key)
+    page_id, version = get_page_id_and_version(base_url, pat, title, space_key, session, cache)
 
     # Prepare the request body for creating or updating the page:
     body = {
@@ -113,10 +124,19 @@ def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, c
     }
 
     # Creaqte the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-         "Authorization": f"Bearer {pat}",
-         "Content-Type": "application/json"
-     }
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
+
+    # In incremental mode an existing page is only written as far as its content changed:
+    if page_id and incremental:
+
+        action, page_info = update_page_incremental(base_url, pat, page_id, content, session, title)
+
+        print(f"Page ID {page_id}: {action}")
+
+        if cache is not None:
+            cache.put_page(page_info, space_key)
+
+        return page_info
 
     # If the page exists in Confluence, update it:
     if page_id:
@@ -130,7 +150,7 @@ def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, c
         url = f"{base_url}/rest/api/content/{page_id}"
 
         # Make the PUT request to update the page:
-        response = requests.put(url, headers=headers_with_pat, data=json.dumps(body))
+        response = (session or requests).put(url, headers=headers_with_pat, data=json.dumps(body))
 
     else: # The page does not exist, so create a new one:
 
@@ -140,16 +160,27 @@ def create_or_update_page(base_url: str, pat: str, title: str, space_key: str, c
         url = f"{base_url}/rest/api/content"
 
         # Make the POST request to create the page:
-        response = requests.post(url, headers=headers_with_pat, data=json.dumps(body))
+        response = (session or requests).post(url, headers=headers_with_pat, data=json.dumps(body))
+
+    # A failed write may mean the cached version was stale, so don't trust it again:
+    if cache is not None and not response.ok:
+        cache.invalidate(space_key, title)
 
     # Check if the request was successful:
     response.raise_for_status()
 
-    # Parse the JSON response and return it:
-    return response.json()
+    # Parse the JSON response:
+    page_info = response.json()
+
+    # Remember the written page, so the new ID and version never need a follow-up read:
+    if cache is not None:
+        cache.put_page(page_info, space_key)
+
+    return page_info
 
 # ==== UPLOAD ATTACHMENT TO CONFLUENCE PAGE ====
-def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
+def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str, session: requests.Session = None,
+                      comment: str = None):
     """
     Uploads a file attachment to a Confluence page.
 
@@ -157,6 +188,10 @@ def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
     pat:       Personal Access Token for authentication.
     page_id:   The ID of the Confluence page to which the attachment will be uploaded.
     file_path: The full path to the file to be uploaded.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    comment:   Optional comment stored with the attachment.
+
+    The file is streamed from disk in chunks, so memory use doesn't grow with the file size.
 
     Returns the response from the Confluence API.
 
@@ -170,21 +205,18 @@ def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
     attachment_url = f"{base_url}/rest/api/content/{page_id}/child/attachment"
 
     # Create the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-         "X-Atlassian-Token": "no-check",
-         "Authorization": f"Bearer {pat}",
-     }
+    headers_with_pat = request_headers(pat, session, {"X-Atlassian-Token": "no-check"})
 
-    # Open the target file in binary mode:
-    with open(file_path, 'rb') as file_data:
+    # Prepare the multipart body, which reads the target file from disk while it's being sent:
+    with StreamingMultipartEncoder("file", filename, file_path,
+                                   fields={"comment": comment} if comment else None) as upload_file:
 
-        # Prepare the file data for the request:
-        upload_file = { "file": (filename, file_data, "application/octet-stream") }
+        headers_with_pat["Content-Type"] = upload_file.content_type
 
         print(f"Uploading attachment: {filename}")
 
         # Make the POST request to upload the attachment:
-        response = requests.post(attachment_url, headers=headers_with_pat, files=upload_file)
+        response = (session or requests).post(attachment_url, headers=headers_with_pat, data=upload_file)
 
         # Check if the request was successful:
         response.raise_for_status()
@@ -241,17 +273,35 @@ def main():
                         required=True,
                         help="Full path to the text file to upload to Confluence.")
 
+    # Optional flag to only write the page if its content changed:
+    parser.add_argument("--incremental",
+                        "-i",
+                        action="store_true",
+                        help="Compare an existing page with the new content and skip or shrink the update accordingly.")
+
+    # Optional arguments for the part of the file shown on the page:
+    add_preview_arguments(parser)
+
+    # Optional arguments for pacing the requests, so a busy Confluence isn't overloaded:
+    add_rate_limit_arguments(parser)
+
+    # Optional arguments for timing the requests and profiling the run:
+    add_instrumentation_arguments(parser)
+
     # Parse the command-line arguments:
     args = parser.parse_args()
 
+    # Every request of the run is measured, and the run is profiled if asked for:
+    metrics = RequestMetrics()
+    profiler = start_profile(args.profile)
+
     # Do the magic:
     # Read the text file, convert it to XHTML, and create/update the Confluence page.
     try:
         print("Reading file: " + args.text_file)
 
-        # Read the text file to be written to Confluence:
-        with open(args.text_file, 'r', encoding='utf-8') as f:
-            text_content = f.read()
+        # Read only the part of the text file shown in the page preview:
+        text_content = read_text_preview(args.text_file, **preview_options(args))
 
         filename = os.path.basename(args.text_file)
 
@@ -268,13 +318,19 @@ def main():
 
         print("Today's date is: " + str(day) + " " + str(month_name) + " " + str(year))
         
+        # Share one pooled session between the page and attachment requests, so they reuse one connection:
+        session = create_session(args.personal_access_token, **rate_limit_options(args))
+
+        instrument_session(session, metrics)
+
         # Create or update the Confluence page with the formatted XHTML:
-        page_info = create_or_update_page(args.confluence_base_url, args.personal_access_token, args.page_title, args.space_key, formatted_xhtml)
+        page_info = create_or_update_page(args.confluence_base_url, args.personal_access_token, args.page_title, args.space_key, formatted_xhtml, session,
+                                          incremental=args.incremental)
 
         page_id = page_info['id']
 
         # Upload the file as an attachment to the same Confluence page:
-        upload_attachment(args.confluence_base_url, args.personal_access_token, page_id, args.text_file)
+        upload_attachment(args.confluence_base_url, args.personal_access_token, page_id, args.text_file, session)
 
         # Print the URL where the page can be viewed:
         print("Success!")
@@ -283,5 +339,9 @@ def main():
     except Exception as e:
         print(f"Error: {e}")
 
+    finally:
+        stop_profile(profiler, args.profile)
+        report_metrics(metrics, args)
+
 if __name__ == "__main__":
    main()
\ No newline at end of file
@@ -0,0 +1,212 @@
+import codecs
+import io
+import mmap
+import os
+
+# Defaults for the page preview of an uploaded text file:
+DEFAULT_PREVIEW_LINES = 20
+DEFAULT_PREVIEW_BYTES = 64 * 1024
+DEFAULT_PREVIEW_MODE = "lines"
+
+# The ways a preview can be cut out of a text file (see `read_text_preview`):
+PREVIEW_MODES = ("lines", "bytes", "head_tail")
+
+# Block size used to read whole files:
+DEFAULT_READ_BLOCK_SIZE = 1024 * 1024
+
+#================================================================================================
+# Functions that read the parts of a text file shown in the page preview:
+#================================================================================================
+def read_text_head(file, max_lines: int, max_bytes: int) -> bytes:
+    """
+    Reads the first lines of a file opened in binary mode, stopping at `max_lines` lines or
+    `max_bytes` bytes, whichever comes first, so one huge line can't blow up the preview.
+    """
+
+    lines = []
+    remaining = max_bytes
+
+    while len(lines) < max_lines and remaining > 0:
+
+        # Never read further than the bytes still allowed in the preview:
+        line = file.readline(remaining)
+
+        if not line:
+            break
+
+        lines.append(line)
+        remaining -= len(line)
+
+    return b"".join(lines)
+
+def read_text_tail(file, max_lines: int, max_bytes: int, file_size: int):
+    """
+    Reads the last lines of a file opened in binary mode by seeking to at most `max_bytes` bytes
+    before its end, so nothing in front of the tail is read.
+
+    Returns an (offset, bytes) tuple with the offset in the file where the tail starts.
+    """
+
+    offset = max(0, file_size - max_bytes)
+
+    file.seek(offset)
+    data = file.read(max_bytes)
+
+    # The seek usually lands in the middle of a line; start at the next full one if there is one:
+    if offset > 0:
+        line_end = data.find(b"\n")
+        if 0 <= line_end < len(data) - 1:
+            data = data[line_end + 1:]
+
+    tail = b"".join(data.splitlines(keepends=True)[-max_lines:]) if max_lines > 0 else b""
+
+    return file_size - len(tail), tail
+
+def decode_preview(data: bytes) -> str:
+    """ Decodes preview bytes as UTF-8, dropping a character cut in half at the end and using `\n` line endings. """
+
+    text = codecs.getincrementaldecoder("utf-8")(errors="replace").decode(data)
+    return text.replace("\r\n", "\n")
+
+#================================================================================================
+# Function that reads the part of a text file shown in the page preview:
+#================================================================================================
+def read_text_preview(file_path: str, max_lines: int = DEFAULT_PREVIEW_LINES,
+                      max_bytes: int = DEFAULT_PREVIEW_BYTES, mode: str = DEFAULT_PREVIEW_MODE) -> str:
+    """
+    Reads the part of a text file shown in the page preview, without loading the rest of the file;
+    the full file only goes into the attachment.
+
+    file_path: The full path to the text file.
+    max_lines: The maximum number of lines in the preview (not used by the "bytes" mode).
+    max_bytes: The maximum number of bytes in the preview, so one huge line can't blow it up.
+    mode:      The preview policy:
+               - "lines":     the first `max_lines` lines;
+               - "bytes":     the first `max_bytes` bytes, regardless of lines;
+               - "head_tail": the first and the last lines, half of `max_lines` and `max_bytes` each,
+                              with a note of how much was left out in between. The tail is read
+                              after a seek to the end of the file.
+
+    Returns the preview text.
+    """
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    if mode not in PREVIEW_MODES:
+        raise ValueError(f"Unknown preview mode '{mode}'; use one of: {', '.join(PREVIEW_MODES)}.")
+
+    with open(file_path, 'rb') as file:
+
+        if mode == "lines":
+            return decode_preview(read_text_head(file, max_lines, max_bytes))
+
+        if mode == "bytes":
+            return decode_preview(file.read(max_bytes))
+
+        file_size = os.fstat(file.fileno()).st_size
+
+        head = read_text_head(file, (max_lines + 1) // 2, (max_bytes + 1) // 2)
+
+        # A small file fits in the head on its own:
+        if len(head) == file_size:
+            return decode_preview(head)
+
+        tail_offset, tail = read_text_tail(file, max_lines // 2, max_bytes // 2, file_size)
+
+        # The head and the tail meet, so the preview is the whole file:
+        if tail_offset <= len(head):
+            return decode_preview(head + tail[len(head) - tail_offset:])
+
+        omitted = tail_offset - len(head)
+        separator = "" if head.endswith(b"\n") else "\n"
+
+        return (f"{decode_preview(head)}{separator}"
+                f"[... {omitted:,} bytes left out here, download the attachment for the full file ...]\n"
+                f"{decode_preview(tail)}")
+
+#================================================================================================
+# Function that reads a whole text file with its line breaks turned into HTML line breaks:
+#================================================================================================
+def iter_text_with_breaks(file_path: str, line_break: str = "<br>", block_size: int = DEFAULT_READ_BLOCK_SIZE,
+                          use_mmap: bool = False):
+    """
+    Reads a text file in blocks and translates every line ending to `line_break` as it reads,
+    so the file is passed over once and never held in memory as a whole.
+
+    file_path:  The full path to the text file.
+    line_break: What each line ending is replaced with.
+    block_size: How many characters (or, with `use_mmap`, bytes) are read at a time.
+    use_mmap:   If True, the file is memory-mapped and decoded straight from the mapping instead of
+                being copied through read buffers; worth it for very large files.
+
+    Line endings are translated like text mode does (`\n`, `\r\n` and `\r`), also when one falls
+    across two blocks.
+
+    Yields the translated text in blocks.
+    """
+
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    if not use_mmap:
+        with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
+            for block in iter(lambda: file.read(block_size), ""):
+                yield block.replace("\n", line_break)
+        return
+
+    # An empty file can't be memory-mapped:
+    if os.path.getsize(file_path) == 0:
+        return
+
+    # Decode incrementally, so multi-byte characters and `\r\n` split between two slices come out right:
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(errors="replace"), translate=True)
+
+    with open(file_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+
+        for offset in range(0, len(mapped), block_size):
+            block = decoder.decode(mapped[offset:offset + block_size])
+            if block:
+                yield block.replace("\n", line_break)
+
+        block = decoder.decode(b"", final=True)
+        if block:
+            yield block.replace("\n", line_break)
+
+def read_text_with_breaks(file_path: str, line_break: str = "<br>", block_size: int = DEFAULT_READ_BLOCK_SIZE,
+                          use_mmap: bool = False) -> str:
+    """
+    Reads a whole text file as one string with its line endings turned into `line_break`
+    (see `iter_text_with_breaks`); the blocks are joined once at the end.
+
+    Returns the translated text.
+    """
+
+    return "".join(iter_text_with_breaks(file_path, line_break, block_size, use_mmap))
+
+#================================================================================================
+# Command-line arguments for the page preview, shared by the upload scripts:
+#================================================================================================
+def add_preview_arguments(parser):
+    """ Adds the `--preview_mode`, `--preview_lines` and `--preview_kb` arguments to an argument parser. """
+
+    parser.add_argument("--preview_mode",
+                        choices=PREVIEW_MODES,
+                        default=DEFAULT_PREVIEW_MODE,
+                        help=f"How the page preview is cut out of the file: the first lines, the first bytes, or the "
+                             f"first and last lines (default: {DEFAULT_PREVIEW_MODE}). The full file is only in the attachment.")
+
+    parser.add_argument("--preview_lines",
+                        type=int,
+                        default=DEFAULT_PREVIEW_LINES,
+                        help=f"Maximum number of lines in the page preview (default: {DEFAULT_PREVIEW_LINES}).")
+
+    parser.add_argument("--preview_kb",
+                        type=int,
+                        default=DEFAULT_PREVIEW_BYTES // 1024,
+                        help=f"Maximum size of the page preview in KB (default: {DEFAULT_PREVIEW_BYTES // 1024}).")
+
+def preview_options(args) -> dict:
+    """ Returns the keyword arguments for `read_text_preview` from the parsed preview arguments. """
+
+    return {"max_lines": args.preview_lines, "max_bytes": args.preview_kb * 1024, "mode": args.preview_mode}
@@ -1,37 +1,41 @@
 import argparse
-from   atlassian import Confluence
+import chunked_upload
+from   confluence_session import CountingSession, create_confluence, create_session, request_headers
+from   concurrent.futures import ThreadPoolExecutor, as_completed
+import contextlib
 from   datetime  import date
 from   datetime  import datetime
+import glob
+from   instrumentation import RequestMetrics, add_instrumentation_arguments, instrument_session, report_metrics, start_profile, stop_profile
 import json
+from   multipart_stream import StreamingMultipartEncoder
 import os
+from   page_cache import PageCache, get_page_by_title_cached
+from   publish_manifest import PublishManifest
+from   rate_limit import add_rate_limit_arguments, rate_limit_options
 import requests
+from   storage_diff import update_page_incremental
+from   storage_format import preview_page_chunks
+from   text_reader import add_preview_arguments, preview_options, read_text_preview
+import threading
+import time
+from   wait_for_ready import add_wait_for_ready_arguments, wait_if_asked
 
 # ==== CONVERT UPLOAD TEXT TO FORMATTED XHTML ====
 def convert_text_to_xhtml(text: str, filename: str) -> str:
     """
     Generates formatted Confluence storage-format XHTML with a heading, text preview,
     and a downloadable attachment link.
-    """
-    # Short preview only, to avoid long pages in the browser:
-    # You would replace `text` in the f-string below with `preview` if you want to show the preview instead.
-#   preview = html.escape("\n".join(text.splitlines()[:20]))
-
-    return f"""
-<h1>{filename}</h1>
-
-<p>This file has been uploaded automatically to Confluence. You can download the full version below.</p>
 
-<p><b>Preview:</b></p>
-
-<ac:structured-macro ac:name="code">
-  <ac:plain-text-body><![CDATA[{text}]]></ac:plain-text-body>
-</ac:structured-macro>
+    text:     The preview of the file (see `text_reader.read_text_preview`); the full file goes in the attachment.
+    filename: The name of the uploaded file.
+    """
 
-<p><b>Download:</b> <ac:link><ri:attachment ri:filename="{filename}"/></ac:link></p>
-""".strip()
+    return "".join(preview_page_chunks(text, filename))
 
 # ==== GET THE parent PAGE ID (VERIFY PAGE EXISTS) ====
-def get_parent_page_id(base_url: str, pat: str, title: str, space_key: str):
+def get_parent_page_id(base_url: str, pat: str, title: str, space_key: str, session: requests.Session = None,
+                       cache: PageCache = None):
     """
     Checks if a Confluence page with the given title and space key exists.
     If it does not exist, raises an exception.
@@ -40,27 +44,34 @@ def get_parent_page_id(base_url: str, pat: str, title: str, space_key: str):
     pat:       Personal Access Token for authentication.
     title:     The title of the Confluence page.
     space_key: The space key where the page should exist.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:     Optional page cache (see `page_cache.PageCache`) answering repeated lookups without a request.
 
     Raises an exception if the page does not exist.
     """
 
+    # Answer from the page cache if the parent was looked up recently:
+    if cache is not None:
+        page = cache.get(space_key, title)
+        if page is not None:
+            return page["id"]
+
     # Set the URL for the Confluence API to search for the page:
     url = f"{base_url}/rest/api/content"
 
     # Set the parameters for the GET request:
+    # The version is expanded too, so the entry cached from the response is complete:
     params = {
         "title": title,
-        "spaceKey": space_key
+        "spaceKey": space_key,
+        "expand": "version"
     }
 
     # Create the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-        "Authorization": f"Bearer {pat}",
-        "Content-Type": "application/json"
-    }
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
 
     # Make the GET request to Confluence to try to find the page we're looking for:
-    response = requests.get(url, params=params, headers=headers_with_pat)
+    response = (session or requests).get(url, params=params, headers=headers_with_pat)
 
     # Check if the request was successful:
     response.raise_for_status()
@@ -77,11 +88,15 @@ def get_parent_page_id(base_url: str, pat: str, title: str, space_key: str):
 
         print(f"The specified parent page '{title}' exists in space '{space_key}'.")
 
+        if cache is not None:
+            cache.put_page(results[0], space_key)
+
         # Return the ID of the parent page:
         return results[0]["id"]
 
 # ==== FIND OR CREATE CONFLUENCE PAGE ====
-def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str):
+def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str, session: requests.Session = None,
+                            cache: PageCache = None):
     """
     Retrieves the Confluence page ID and version number for a given title and space key.
     If the page does not exist, it returns None.
@@ -90,12 +105,20 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     pat:       Personal Access Token for authentication.
     title:     The title of the Confluence page.
     space_key: The space key where the page will be created/updated.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:     Optional page cache (see `page_cache.PageCache`) answering repeated lookups without a request.
 
     Returns the page ID and version number if the page exists, otherwise returns None.
 
     Raises an exception if the request fails.
     """
 
+    # Answer from the page cache if the page was looked up or written recently, with its version:
+    if cache is not None:
+        page = cache.get(space_key, title, need_version=True)
+        if page is not None:
+            return page["id"], page["version"]["number"]
+
     # Set the URL for the Confluence API to search for the page:
     url = f"{base_url}/rest/api/content"
 
@@ -107,13 +130,10 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     }
 
     # Create the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-        "Authorization": f"Bearer {pat}",
-        "Content-Type": "application/json"
-    }
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
 
     # Make the GET request to Confluence to find the page we're looking for:
-    response = requests.get(url, params=params, headers=headers_with_pat)
+    response = (session or requests).get(url, params=params, headers=headers_with_pat)
     response.raise_for_status()
 
     # Parse the JSON response:
@@ -122,21 +142,31 @@ def get_page_id_and_version(base_url: str, pat: str, title: str, space_key: str)
     # If the page exists, return its ID and version number:
     if results:
         page = results[0]
+
+        if cache is not None:
+            cache.put_page(page, space_key)
+
         return page["id"], page["version"]["number"]
 
     return None, None
 
 # ==== CREATE OR UPDATE CONFLUENCE PAGE ====
-def create_or_update_page(confluence: Confluence, pat: str, parent_page_id: str, title: str, space_key: str, content: str):
+def create_or_update_page(base_url: str, pat: str, parent_page_id: str, title: str, space_key: str, content: str,
+                          session: requests.Session = None, cache: PageCache = None, incremental: bool = False):
     """
     Creates or updates a Confluence page with the given title and content.
     If a page with the same title exists, it will be updated. Otherwise, a new page will be created.
 
-    confluence_obj:  The Confluence object to interact with the Confluence API.
+    base_url:        The base URL of the Confluence server.
     pat:             Personal Access Token for authentication.
+    parent_page_id:  The ID of the page the new page is created under.
     title:           The title of the Confluence page.
     space_key:       The space key where the page will be created/updated.
     content:         The content to be added to the page in XHTML format.
+    session:         Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:           Optional page cache; the written page is recorded in it, so it never needs a follow-up read.
+    incremental:     If True, an existing page is compared with the new content first and is only
+                     written if it changed (see `storage_diff.update_page_incremental`).
 
     Returns the response from the Confluence API.
 
@@ -149,7 +179,7 @@ def create_or_update_page(confluence: Confluence, pat: str, parent_page_id: str,
     # Check if the page already exists:
     # If it does, get the page ID and version number;
     # If it doesn't, create a new page.
-#   page_id, version = get_page_id_and_version(base_url, pat, title, space_key)
+    page_id, version = get_page_id_and_version(base_url, pat, title, space_key, session, cache)
 
     # Prepare the request body for creating or updating the page:
     body = {
@@ -166,33 +196,117 @@ def create_or_update_page(confluence: Confluence, pat: str, parent_page_id: str,
     }
 
     # Creaqte the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-         "Authorization": f"Bearer {pat}",
-         "Content-Type": "application/json"
-     }
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
+
+    # In incremental mode an existing page is only written as far as its content changed:
+    if page_id and incremental:
+
+        action, page_info = update_page_incremental(base_url, pat, page_id, content, session, title)
+
+        print(f"- Page ID {page_id}: {action}")
+
+        if cache is not None:
+            cache.put_page(page_info, space_key)
+
+        return page_info
+
+    # If the page exists in Confluence, update it:
+    if page_id:
+
+        print(f"- Updating page ID {page_id} ...")
+
+        # Update the version number in the request body:
+        body["version"] = {"number": version + 1}
 
-    username = "test-user1"
-    password = "P@$$w0rd"
-    pw_auth = (username, password)
+        # Make the PUT request to update the page:
+        response = (session or requests).put(f"{base_url}/rest/api/content/{page_id}",
+                                             headers=headers_with_pat,
+                                             data=json.dumps(body))
 
-    print("- Creating new page...")
+    else: # The page does not exist, so create a new one:
 
-    post_data = json.dumps(body)
+        print("- Creating new page...")
 
-    # Make the POST request to create the page:
-#   response = requests.post(url, headers=headers_with_pat, data=post_data)
-#   response = requests.post(url, auth=pw_auth, data=post_data)
+        # Make the POST request to create the page:
+        response = (session or requests).post(f"{base_url}/rest/api/content",
+                                              headers=headers_with_pat,
+                                              data=json.dumps(body))
 
-    confluence.update_or_create_page(space_key=space_key, title=title, body=content, parent_id=parent_page_id)
+    # A failed write may mean the cached version was stale, so don't trust it again:
+    if cache is not None and not response.ok:
+        cache.invalidate(space_key, title)
 
     # Check if the request was successful:
     response.raise_for_status()
 
-    # Parse the JSON response and return it:
-    return response.json()
+    # Parse the JSON response:
+    page_info = response.json()
+
+    # Remember the written page, so the new ID and version never need a follow-up read:
+    if cache is not None:
+        cache.put_page(page_info, space_key)
+
+    return page_info
+
+# ==== CREATE A NEW CONFLUENCE PAGE ====
+def create_page(base_url: str, pat: str, parent_page_id: str, title: str, space_key: str, content: str,
+                session: requests.Session = None, cache: PageCache = None, incremental: bool = False):
+    """
+    Creates a new Confluence page with a single POST, without looking the title up first.
+    Upload pages have timestamped titles and are almost always new; if the title does exist
+    after all, this falls back on `create_or_update_page`, which updates the existing page.
+
+    base_url:        The base URL of the Confluence server.
+    pat:             Personal Access Token for authentication.
+    parent_page_id:  The ID of the page the new page is created under.
+    title:           The title of the Confluence page.
+    space_key:       The space key where the page will be created.
+    content:         The content to be added to the page in XHTML format.
+    session:         Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    cache:           Optional page cache; the new page is recorded in it.
+    incremental:     If True and the page exists after all, it's only written if its content changed.
+
+    Returns the response from the Confluence API, which holds the page ID, version and web link.
+
+    Raises an exception if the request fails.
+    """
+
+    body = {
+        "type": "page",
+        "title": title,
+        "space": {"key": space_key},
+        "ancestors": [{"id": parent_page_id}],
+        "body": {
+            "storage": {
+                "value": content,
+                "representation": "storage"
+            }
+        }
+    }
+
+    headers_with_pat = request_headers(pat, session, {"Content-Type": "application/json"})
+
+    response = (session or requests).post(f"{base_url}/rest/api/content",
+                                          headers=headers_with_pat,
+                                          data=json.dumps(body))
+
+    # Confluence rejects a duplicate title with a 400; update the existing page instead:
+    if response.status_code == 400 and "already exists" in response.text:
+        return create_or_update_page(base_url, pat, parent_page_id, title, space_key, content, session, cache,
+                                     incremental)
+
+    response.raise_for_status()
+
+    page_info = response.json()
+
+    if cache is not None:
+        cache.put_page(page_info, space_key)
+
+    return page_info
 
 # ==== UPLOAD ATTACHMENT TO CONFLUENCE PAGE ====
-def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
+def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str, session: requests.Session = None,
+                      comment: str = None):
     """
     Uploads a file attachment to a Confluence page.
 
@@ -200,6 +314,10 @@ def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
     pat:       Personal Access Token for authentication.
     page_id:   The ID of the Confluence page to which the attachment will be uploaded.
     file_path: The full path to the file to be uploaded.
+    session:   Optional shared session (see `confluence_session.create_session`) to reuse connections.
+    comment:   Optional comment stored with the attachment.
+
+    The file is streamed from disk in chunks, so memory use doesn't grow with the file size.
 
     Returns the response from the Confluence API.
 
@@ -213,21 +331,18 @@ def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
     attachment_url = f"{base_url}/rest/api/content/{page_id}/child/attachment"
 
     # Create the headers for the request to include the personal access token for authentication:
-    headers_with_pat = {
-         "X-Atlassian-Token": "no-check",
-         "Authorization": f"Bearer {pat}",
-     }
+    headers_with_pat = request_headers(pat, session, {"X-Atlassian-Token": "no-check"})
 
-    # Open the target file in binary mode:
-    with open(file_path, 'rb') as file_data:
+    # Prepare the multipart body, which reads the target file from disk while it's being sent:
+    with StreamingMultipartEncoder("file", filename, file_path,
+                                   fields={"comment": comment} if comment else None) as upload_file:
 
-        # Prepare the file data for the request:
-        upload_file = { "file": (filename, file_data, "application/octet-stream") }
+        headers_with_pat["Content-Type"] = upload_file.content_type
 
         print(f"- Uploading attachment: {filename}")
 
         # Make the POST request to upload the attachment:
-        response = requests.post(attachment_url, headers=headers_with_pat, files=upload_file)
+        response = (session or requests).post(attachment_url, headers=headers_with_pat, data=upload_file)
 
         # Check if the request was successful:
         response.raise_for_status()
@@ -235,6 +350,309 @@ def upload_attachment(base_url: str, pat: str, page_id: str, file_path: str):
         # Parse the JSON response and return it:
         return response.json()
 
+# ==== VALIDATE THE TEXT FILE TO BE UPLOADED ====
+def validate_text_file(text_file: str):
+    """
+    Verifies that the text file to be uploaded exists, is readable and is not empty.
+
+    text_file: The full path to the text file to be uploaded.
+
+    Raises an exception if the file can't be uploaded.
+    """
+
+    if not os.path.isfile(text_file):
+
+        # If the text file does not exist, raise an exception and quit:
+        raise Exception(f"- The specified text file to be uploaded '{text_file}' does not exist.")
+
+    elif not os.access(text_file, os.R_OK):
+
+        # If the text file is not readable, raise an exception and quit:
+        raise Exception(f"- The specified text file to be uploaded '{text_file}' is not readable.")
+
+    elif not os.path.getsize(text_file):
+
+        # If the text file is empty, raise an exception and quit:
+        raise Exception(f"- The specified text file to be uploaded '{text_file}' is empty.")
+
+# ==== BUILD THE TITLE OF THE UPLOAD PAGE ====
+def make_upload_page_title(suffix: str = None) -> str:
+    """
+    Builds the title of the Confluence page the text file is uploaded to from the current date and time.
+
+    suffix: Optional text appended to the title; batch uploads pass the file name here so that
+            files uploaded in the same second don't end up with the same page title.
+
+    Returns the page title.
+    """
+
+    # Get the current date to use to create the Confluence page title:
+    today = date.today()
+    day = today.day
+    month_name = today.strftime("%b")
+    year = today.year
+
+    # Get the current time to use to create the Confluence page title:
+    now = datetime.now()
+    current_time = now.strftime("%H:%M:%S %p")
+
+    upload_page_title = f"{day} {month_name} {year} {current_time}"
+
+    if suffix:
+        upload_page_title = f"{upload_page_title} {suffix}"
+
+    return upload_page_title
+
+# ==== PUBLISH ONE TEXT FILE TO CONFLUENCE ====
+def publish_text_file(base_url: str, session: requests.Session, space_key: str, parent_page: dict, text_file: str,
+                      upload_page_title: str, host_slots: threading.BoundedSemaphore = None,
+                      part_size: int = None, part_workers: int = 4, cache: PageCache = None,
+                      preview: dict = None, state_dir: str = None) -> dict:
+    """
+    Publishes one text file: converts it to XHTML, creates the page under the parent page and
+    attaches the file to it.
+
+    This takes two requests per file. The page ID, version and web link all come from the
+    create response, so the page is never looked up again, and the parent page is resolved
+    once by the caller rather than once per file.
+
+    base_url:          The base URL of the Confluence server.
+    session:           The shared session (see `confluence_session.create_session`).
+    space_key:         The space key where the page will be created/updated.
+    parent_page:       The parent page, as returned by `get_page_by_title`.
+    text_file:         The full path to the text file to be uploaded.
+    upload_page_title: The title of the page to create.
+    host_slots:        Optional semaphore limiting the number of concurrent requests to the Confluence host.
+    part_size:         Files bigger than this many bytes are attached as numbered parts that can resume
+                       after an interruption (see `chunked_upload`); None attaches every file in one piece.
+    part_workers:      The number of parts uploaded at the same time.
+    cache:             Optional page cache; the new page is recorded in it from the create/update response.
+    preview:           Optional keyword arguments for `text_reader.read_text_preview` (mode, max_lines, max_bytes).
+    state_dir:         The directory of the state files of uploads in parts (default: `chunked_upload.DEFAULT_STATE_DIR`).
+
+    Returns a dictionary with the page ID, version and URL, the attachment ID (None for a file sent in parts),
+    the number of bytes uploaded, the number of requests sent and the elapsed time.
+
+    Raises an exception if any of the requests fail.
+    """
+
+    # With no per-host limit, every request goes out as soon as it's ready:
+    if host_slots is None:
+        host_slots = contextlib.nullcontext()
+
+    start_time = time.perf_counter()
+
+    # Count the requests this file takes; the session already carries the personal access token,
+    # so none is passed to the functions below:
+    counted_session = CountingSession(session)
+
+    validate_text_file(text_file)
+
+    # Read only the part of the text file shown in the page preview:
+    text_content = read_text_preview(text_file, **(preview or {}))
+
+    filename = os.path.basename(text_file)
+
+    # Convert the text file content to XHTML:
+    formatted_xhtml = convert_text_to_xhtml(text_content, filename)
+
+    # Big files are sent in parts; pick up an interrupted upload of the same file where it stopped:
+    upload_in_parts = bool(part_size) and os.path.getsize(text_file) > part_size
+    resume_state = None
+
+    if upload_in_parts:
+        state_path = chunked_upload.default_state_path(text_file, state_dir)
+        resume_state = chunked_upload.load_state(state_path, text_file, part_size)
+
+    if resume_state:
+
+        # The page was already created by the interrupted run:
+        page_info = {'id': resume_state['page_id'],
+                     '_links': {'webui': f"/pages/viewpage.action?pageId={resume_state['page_id']}"}}
+
+    else:
+
+        # Create the Confluence page with the formatted XHTML.
+        # The response describes the new page, so there's no need to look it up again by title:
+        with host_slots:
+            page_info = create_page(base_url, None, parent_page['id'], upload_page_title, space_key,
+                                    formatted_xhtml, counted_session, cache)
+
+    # Upload the file as an attachment to the same Confluence page, streaming it from disk:
+    attachment_id = None
+
+    if upload_in_parts:
+        # Each part takes a host slot of its own while it's sent, so the parts don't exceed the per-host limit:
+        chunked_upload.upload_file_in_parts(base_url,
+                                            None,
+                                            page_info['id'],
+                                            text_file,
+                                            part_size,
+                                            part_workers,
+                                            state_path,
+                                            session=counted_session,
+                                            state=resume_state,
+                                            host_slots=host_slots)
+    else:
+        with host_slots:
+            attachment = upload_attachment(base_url,
+                                           None,
+                                           page_info['id'],
+                                           text_file,
+                                           counted_session,
+                                           comment="Uploaded via cron job script.")
+        attachment_id = attachment['results'][0]['id']
+
+    # A resumed upload didn't create the page, so its version still has to be looked up:
+    if 'version' not in page_info:
+        with host_slots:
+            response = counted_session.get(f"{base_url}/rest/api/content/{page_info['id']}",
+                                           params={"expand": "version"})
+        response.raise_for_status()
+        page_info = response.json()
+
+    return {
+        "text_file":     text_file,
+        "page_id":       page_info['id'],
+        "version":       page_info.get('version', {}).get('number'),
+        "attachment_id": attachment_id,
+        "page_url":      f"{base_url}{page_info['_links']['webui']}",
+        "bytes":         os.path.getsize(text_file),
+        "requests":      counted_session.count,
+        "seconds":       time.perf_counter() - start_time
+    }
+
+# ==== FIND THE TEXT FILES TO UPLOAD IN A DIRECTORY ====
+def find_text_files(text_dir: str, text_glob: str = "*") -> list:
+    """
+    Lists the files in a directory matching a glob pattern.
+
+    text_dir:  The directory holding the text files to upload.
+    text_glob: The glob pattern the file names have to match; use `**` to descend into sub-directories.
+
+    Returns the sorted list of full file paths.
+
+    Raises an exception if the directory does not exist.
+    """
+
+    if not os.path.isdir(text_dir):
+        raise Exception(f"- The specified text file directory '{text_dir}' does not exist.")
+
+    matches = glob.glob(os.path.join(text_dir, text_glob), recursive=True)
+
+    return sorted(path for path in matches if os.path.isfile(path))
+
+# ==== UPLOAD MANY TEXT FILES TO CONFLUENCE ====
+def upload_text_files(base_url: str, pat: str, space_key: str, parent_page: dict, text_files: list,
+                      workers: int = 4, max_per_host: int = 4, text_dir: str = None,
+                      session: requests.Session = None, part_size: int = None, part_workers: int = 4,
+                      manifest: PublishManifest = None, cache: PageCache = None, preview: dict = None,
+                      state_dir: str = None) -> list:
+    """
+    Uploads many text files in one process over a pool of worker threads, with `publish_text_file`.
+
+    base_url:     The base URL of the Confluence server.
+    pat:          Personal Access Token for authentication.
+    space_key:    The space key where the pages will be created.
+    parent_page:  The parent page, as returned by `get_page_by_title`; it is only looked up once per batch.
+    text_files:   The full paths to the text files to be uploaded.
+    workers:      The number of worker threads.
+    max_per_host: The maximum number of requests in flight to the Confluence host at any time.
+    text_dir:     The directory the files were found in; the page titles use the path relative to it.
+    session:      Optional shared session (see `confluence_session.create_session`); one sized for
+                  the worker pool is created if it isn't given.
+    part_size:    Files bigger than this many bytes are attached in resumable parts (see `publish_text_file`).
+    part_workers: The number of parts of one file uploaded at the same time.
+    manifest:     Optional publish manifest; every file uploaded successfully is recorded in it.
+    cache:        Optional page cache shared by the workers.
+    preview:      Optional keyword arguments for `text_reader.read_text_preview`.
+    state_dir:    The directory of the state files of uploads in parts (see `publish_text_file`).
+
+    Returns a list with one result dictionary per file; failed files carry an `error` entry
+    instead of stopping the whole batch.
+    """
+
+    # All the workers share one pooled session, sized so that every in-flight request keeps its connection alive:
+    if session is None:
+        session = create_session(pat, pool_size=max(workers, max_per_host))
+
+    # All the workers share the per-host limit:
+    host_slots = threading.BoundedSemaphore(max_per_host)
+
+    def upload_one(text_file):
+
+        relative_name = os.path.relpath(text_file, text_dir) if text_dir else os.path.basename(text_file)
+
+        try:
+            result = publish_text_file(base_url,
+                                       session,
+                                       space_key,
+                                       parent_page,
+                                       text_file,
+                                       make_upload_page_title(relative_name),
+                                       host_slots,
+                                       part_size,
+                                       part_workers,
+                                       cache,
+                                       preview,
+                                       state_dir)
+
+            if manifest is not None:
+                manifest.record(text_file, result['page_id'], result['version'], result['attachment_id'])
+
+            return result
+
+        except Exception as e:
+            return {"text_file": text_file, "error": str(e), "bytes": 0, "requests": 0, "seconds": 0.0}
+
+    results = []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        futures = [executor.submit(upload_one, text_file) for text_file in text_files]
+
+        for future in as_completed(futures):
+
+            result = future.result()
+            results.append(result)
+
+            if "error" in result:
+                print(f"- FAILED {result['text_file']}: {result['error']}")
+            else:
+                print(f"- {result['text_file']}: {result['bytes']} bytes in {result['seconds']:.2f}s "
+                      f"({result['bytes'] / max(result['seconds'], 1e-9) / 1048576:.2f} MB/s), "
+                      f"{result['requests']} request(s)")
+                print(f"-   {result['page_url']}")
+
+    return results
+
+# ==== REPORT THE THROUGHPUT OF A BATCH UPLOAD ====
+def print_throughput_report(results: list, elapsed_seconds: float):
+    """
+    Prints the total and per-file throughput of a batch upload.
+
+    results:         The result dictionaries returned by `upload_text_files`.
+    elapsed_seconds: The wall-clock time the whole batch took.
+    """
+
+    uploaded = [result for result in results if "error" not in result]
+    failed = len(results) - len(uploaded)
+    total_bytes = sum(result["bytes"] for result in uploaded)
+    elapsed_seconds = max(elapsed_seconds, 1e-9)
+
+    print("========================================================================")
+    print(f"- Uploaded {len(uploaded)} file(s), {failed} failed, in {elapsed_seconds:.2f}s")
+    print(f"- Total throughput:    {len(uploaded) / elapsed_seconds:.2f} files/s, "
+          f"{total_bytes / elapsed_seconds / 1048576:.2f} MB/s")
+
+    if uploaded:
+        mean_seconds = sum(result["seconds"] for result in uploaded) / len(uploaded)
+        print(f"- Per-file throughput: {mean_seconds:.2f}s per file on average, "
+              f"{total_bytes / max(sum(result['seconds'] for result in uploaded), 1e-9) / 1048576:.2f} MB/s")
+        print(f"- Requests per file:   {sum(result['requests'] for result in uploaded) / len(uploaded):.1f} on average")
+
+    print("========================================================================")
+
 #================================================================================================
 # Main method:
 #================================================================================================
@@ -250,7 +668,7 @@ def main():
     # - personal access token for authentication
     # - Confluence space key
     # - Confluence parent page title
-    # - path to the text file to be uploaded
+    # - path to the text file to be uploaded, or a directory of text files to upload in one batch
     #
     parser = argparse.ArgumentParser(description="Parameters required to upload a text file to Confluence.")
 
@@ -278,34 +696,154 @@ def main():
                         required=True,
                         help="The title of the Confluence page to create/update.")
 
+    # Either a single text file or a directory of text files is uploaded:
+    upload_source = parser.add_mutually_exclusive_group(required=True)
+
     # Positional argument for the text file path:
-    parser.add_argument("--text_file",
-                        "-f",
-                        required=True,
-                        help="Full path to the text file to upload to Confluence.")
+    upload_source.add_argument("--text_file",
+                               "-f",
+                               help="Full path to the text file to upload to Confluence.")
+
+    # Positional argument for the text file directory:
+    upload_source.add_argument("--text_dir",
+                               "-d",
+                               help="Full path to a directory of text files to upload to Confluence in one batch.")
+
+    # Optional argument for the file name pattern used with the text file directory:
+    parser.add_argument("--text_glob",
+                        "-g",
+                        default="*",
+                        help="Glob pattern selecting the files to upload from the text file directory (default: '*').")
+
+    # Optional argument for the number of worker threads used with the text file directory:
+    parser.add_argument("--workers",
+                        "-w",
+                        type=int,
+                        default=4,
+                        help="Number of files uploaded in parallel in batch mode (default: 4).")
+
+    # Optional argument for the number of concurrent requests per Confluence host:
+    parser.add_argument("--max_per_host",
+                        type=int,
+                        default=4,
+                        help="Maximum number of concurrent requests to the Confluence host in batch mode (default: 4).")
+
+    # Optional argument for the size above which files are attached in resumable parts:
+    parser.add_argument("--part_size_mb",
+                        type=int,
+                        default=0,
+                        help="Attach files bigger than this many MB as numbered parts that resume after an interruption "
+                             "(default: 0, always attach in one piece).")
+
+    # Optional argument for the number of parts uploaded in parallel:
+    parser.add_argument("--part_workers",
+                        type=int,
+                        default=4,
+                        help="Number of parts of one file uploaded in parallel (default: 4).")
+
+    # Optional argument for where the progress of uploads in parts is kept:
+    parser.add_argument("--part_state_dir",
+                        default=chunked_upload.DEFAULT_STATE_DIR,
+                        help="Directory of the state files that let uploads in parts resume "
+                             f"(default: {chunked_upload.DEFAULT_STATE_DIR}).")
+
+    # Optional argument for the publish manifest used to skip unchanged files:
+    parser.add_argument("--manifest",
+                        "-m",
+                        help="Local manifest file recording what was published; files that haven't changed "
+                             "since they were recorded are skipped without contacting Confluence.")
+
+    # Optional argument for the SQLite file keeping page lookups between runs:
+    parser.add_argument("--page_cache",
+                        help="SQLite file caching page title lookups between runs (default: cache in memory only).")
+
+    # Optional argument for how long cached page lookups stay valid:
+    parser.add_argument("--page_cache_ttl",
+                        type=float,
+                        help="Seconds a cached page lookup stays valid (default: 300 in memory; two days with "
+                             "--page_cache, so one nightly run can use the lookups of the last).")
+
+    # Optional arguments for the part of each file shown on its page:
+    add_preview_arguments(parser)
+
+    # Optional arguments for pacing the requests, so a busy Confluence isn't overloaded:
+    add_rate_limit_arguments(parser)
+
+    # Optional arguments for timing the requests and profiling the run:
+    add_instrumentation_arguments(parser)
+
+    # Optional argument for waiting until a freshly started Confluence is ready:
+    add_wait_for_ready_arguments(parser)
 
     # Parse the command-line arguments:
     args = parser.parse_args()
 
+    part_size = args.part_size_mb * 1024 * 1024 or None
+
+    # The REST URLs are built by appending to the base URL:
+    args.confluence_base_url = args.confluence_base_url.rstrip("/")
+
+    # Every request of the run is measured, and the run is profiled if asked for:
+    metrics = RequestMetrics()
+    profiler = start_profile(args.profile)
+
     # Do the magic:
     # Read the text file, convert it to XHTML, and create/update the Confluence page.
     try:
+        # Work out which files to upload before talking to Confluence at all:
+        if args.text_dir:
+            text_files = find_text_files(args.text_dir, args.text_glob)
+        else:
+            validate_text_file(args.text_file)
+            text_files = [args.text_file]
+
+        # Leave out the files that haven't changed since they were last published:
+        manifest = PublishManifest(args.manifest) if args.manifest else None
+
+        if manifest is not None:
+
+            changed_files = [text_file for text_file in text_files if not manifest.is_unchanged(text_file)]
+
+            # Keep the new modification times of files that were touched without being changed:
+            manifest.flush()
+
+            print("========================================================================")
+            print(f"- {len(text_files) - len(changed_files)} of {len(text_files)} file(s) unchanged since the last upload; skipping them.")
+
+            text_files = changed_files
+
+            # Nothing to publish, so there's no reason to contact Confluence:
+            if not text_files:
+                print("========================================================================")
+                return
+
         # Creata a Confluence object to interact with the Confluence API:
         print("========================================================================")
         print("- Using Confluence base URL: " + args.confluence_base_url)
         print("------------------------------------------------------------------------")
 
-        aether_confluence_instance = Confluence(
-            url=args.confluence_base_url,
-            token=args.personal_access_token)
+        # A stack that was just started answers with errors until it's up; wait for it if asked to:
+        wait_if_asked(args.confluence_base_url, args)
+
+        # All the requests of the run share one pooled session, so the upload steps reuse one connection:
+        session = create_session(args.personal_access_token, pool_size=max(args.workers, args.max_per_host),
+                                 **rate_limit_options(args))
+
+        instrument_session(session, metrics)
+
+        aether_confluence_instance = create_confluence(args.confluence_base_url, session)
 
         # Check for the specified parent page and verify that it exists; if it doesn't,
         # we're not going to be able to create a chile page under it with the uploaded text file.
-#       parent_page_id = get_parent_page_id(args.confluence_base_url, args.personal_access_token, args.parent_page_title, args.space_key)
+#       parent_page_id = get_parent_page_id(args.confluence_base_url, args.personal_access_token, args.parent_page_title, args.space_key, session)
+
+        page_cache = PageCache(ttl=args.page_cache_ttl, sqlite_path=args.page_cache)
 
-        parent_page_id = aether_confluence_instance.get_page_by_title(
-            space=args.space_key,
-            title=args.parent_page_title)
+        parent_page_id = get_page_by_title_cached(
+            aether_confluence_instance,
+            args.space_key,
+            args.parent_page_title,
+            page_cache)
 
         if not parent_page_id:
 
@@ -316,53 +854,42 @@ def main():
             print(f"- Confluence page found; parent page ID is '{parent_page_id['id']}'.")
             print("------------------------------------------------------------------------")
 
-        # Print the text file to be uploaded:
-        if not os.path.isfile(args.text_file):
-
-            # If the text file does not exist, raise an exception and quit:
-            raise Exception(f"- The specified text file to be uploaded '{args.text_file}' does not exist.")
-            print("========================================================================")
-
-        elif not os.access(args.text_file, os.R_OK):
-
-            # If the text file is not readable, raise an exception and quit:
-            raise Exception(f"- The specified text file to be uploaded '{args.text_file}' is not readable.")
-            print("========================================================================")
-
-        elif not os.path.getsize(args.text_file):
-
-            # If the text file is empty, raise an exception and quit:
-            raise Exception(f"- The specified text file to be uploaded '{args.text_file}' is empty.")
-            print("========================================================================")
+        # Batch mode: upload every matching file in the directory over the worker pool:
+        if args.text_dir:
 
-        else:
-            print(f"- Reading upload file: ")
-            print(f"- {args.text_file}")
+            print(f"- Uploading {len(text_files)} file(s) from: ")
+            print(f"- {args.text_dir}")
+            print(f"- with {args.workers} worker(s), at most {args.max_per_host} request(s) in flight")
             print("------------------------------------------------------------------------")
 
-        # Read the text file to be written to Confluence:
-        with open(args.text_file, 'r', encoding='utf-8') as f:
-            text_content = f.read()
-
-        filename = os.path.basename(args.text_file)
+            start_time = time.perf_counter()
 
-        # Convert the text file content to XHTML:
-        formatted_xhtml = convert_text_to_xhtml(text_content, filename)
+            results = upload_text_files(args.confluence_base_url,
+                                        args.personal_access_token,
+                                        args.space_key,
+                                        parent_page_id,
+                                        text_files,
+                                        workers=args.workers,
+                                        max_per_host=args.max_per_host,
+                                        text_dir=args.text_dir,
+                                        session=session,
+                                        part_size=part_size,
+                                        part_workers=args.part_workers,
+                                        manifest=manifest,
+                                        cache=page_cache,
+                                        preview=preview_options(args),
+                                        state_dir=args.part_state_dir)
 
-        # Get the current date to use to create the Confluence page title:
-        today = date.today()
-        day = today.day
-        month_name = today.strftime("%b")
-        year = today.year
+            print_throughput_report(results, time.perf_counter() - start_time)
 
-        # Get the current time to use to create the Confluence page title:
-        now = datetime.now()
-        current_time = now.strftime("%H:%M:%S %p")
+            return
 
-#       print("Today's date is: " + str(day) + " " + str(month_name) + " " + str(year))
-#       print("Current time is: " + str(current_time))
+        # Print the text file to be uploaded:
+        print(f"- Reading upload file: ")
+        print(f"- {args.text_file}")
+        print("------------------------------------------------------------------------")
 
-        upload_page_title= f"{day} {month_name} {year} {current_time}"
+        upload_page_title = make_upload_page_title()
 
         print(f"- Creating/updating Confluence page \"{upload_page_title}\" ...")
         print(f"- under parent page ID {parent_page_id['id']}, ...")
@@ -370,42 +897,34 @@ def main():
         print(f"- in space: {args.space_key}")
         print("------------------------------------------------------------------------")
 
-        # Create or update the Confluence page with the formatted XHTML:
-        aether_confluence_instance.update_or_create(
-            parent_id=parent_page_id['id'],
-            title=upload_page_title,
-            body=formatted_xhtml,
-            representation="storage",
-            full_width=False)
-
-#       page_id = page_info['id']
-
-        upload_page_id = aether_confluence_instance.get_page_by_title(
-            space=args.space_key,
-            title=upload_page_title)
-
-        print("Attaching file to the page...")
-
-        # Upload the file as an attachment to the same Confluence page:
-#       upload_attachment(args.confluence_base_url, args.personal_access_token, page_id, args.text_file)
-        aether_confluence_instance.attach_file(
-            page_id=upload_page_id['id'],
-            filename=args.text_file,
-            name=filename,
-            title=filename,
-            space=args.space_key,
-            comment="Uploaded via cron job script.")
-
-        upload_page_properties = aether_confluence_instance.get_page_by_id(page_id=upload_page_id['id'])
+        result = publish_text_file(args.confluence_base_url,
+                                   session,
+                                   args.space_key,
+                                   parent_page_id,
+                                   args.text_file,
+                                   upload_page_title,
+                                   part_size=part_size,
+                                   part_workers=args.part_workers,
+                                   cache=page_cache,
+                                   preview=preview_options(args),
+                                   state_dir=args.part_state_dir)
+
+        if manifest is not None:
+            manifest.record(args.text_file, result['page_id'], result['version'], result['attachment_id'])
 
         # Print the URL where the page can be viewed:
         print("------------------------------------------------------------------------")
         print(f"- Success!  View the page at: ")
-        print(f"- {args.confluence_base_url}{upload_page_properties['_links']['webui']}")
+        print(f"- {result['page_url']}")
+        print(f"- ({result['requests']} request(s) to Confluence for this file)")
         print("========================================================================")
 
     except Exception as e:
         print(f"Error: {e}")
 
+    finally:
+        stop_profile(profiler, args.profile)
+        report_metrics(metrics, args)
+
 if __name__ == "__main__":
-   main()
\ No newline at end of file
+   main()
@@ -0,0 +1,136 @@
+import argparse
+import requests
+import sys
+import time
+
+# Default number of seconds to wait for Confluence to be ready:
+DEFAULT_TIMEOUT = 600
+
+# Default number of seconds between two polls of the status endpoint:
+DEFAULT_INTERVAL = 2.0
+
+# Seconds a single status request may take:
+STATUS_REQUEST_TIMEOUT = 5
+
+# The state Confluence reports on `/status` once it serves the REST API:
+READY_STATE = "RUNNING"
+
+# States Confluence doesn't leave on its own; waiting longer wouldn't help:
+FAILED_STATES = ("ERROR", "FIRST_RUN")
+
+# ==== READ THE STATE OF CONFLUENCE ====
+def confluence_state(base_url: str, session: requests.Session = None) -> str:
+    """
+    Reads the state Confluence reports on its `/status` endpoint, which needs no authentication:
+    "STARTING", "RUNNING", "FIRST_RUN" (the setup wizard hasn't been completed), "MAINTENANCE" or "ERROR".
+
+    base_url: The base URL of the Confluence server.
+    session:  Optional session to send the request with.
+
+    Returns the state, or None if Confluence can't be reached yet or doesn't answer with a state.
+    """
+
+    try:
+        response = (session or requests).get(f"{base_url}/status", timeout=STATUS_REQUEST_TIMEOUT)
+        return response.json().get("state")
+    except (requests.exceptions.RequestException, ValueError, AttributeError):
+        return None
+
+# ==== WAIT FOR CONFLUENCE TO BE READY ====
+def wait_for_ready(base_url: str, timeout: float = DEFAULT_TIMEOUT, interval: float = DEFAULT_INTERVAL,
+                   session: requests.Session = None) -> float:
+    """
+    Polls `/status` until Confluence reports "RUNNING", so a batch doesn't start (and fail on its
+    first requests) while a fresh stack is still booting. Every change of state is printed.
+
+    base_url: The base URL of the Confluence server.
+    timeout:  Seconds to wait at most.
+    interval: Seconds between two polls.
+    session:  Optional session to send the requests with.
+
+    Returns the number of seconds waited. Raises an exception if the time runs out, or if Confluence
+    reports a state it won't leave by itself ("ERROR", or "FIRST_RUN" until the setup is done).
+    """
+
+    start_time = time.monotonic()
+    deadline = start_time + timeout
+    last_state = ""
+
+    while True:
+
+        state = confluence_state(base_url, session)
+
+        if state != last_state:
+            print(f"- Confluence at {base_url} is {state or 'not reachable'}")
+            last_state = state
+
+        if state == READY_STATE:
+            return time.monotonic() - start_time
+
+        if state in FAILED_STATES:
+            raise Exception(f"Confluence at {base_url} reports the state {state}; it won't become ready by itself.")
+
+        if time.monotonic() + interval > deadline:
+            raise Exception(f"Confluence at {base_url} wasn't ready after {timeout:g}s (last state: {state or 'not reachable'}).")
+
+        time.sleep(interval)
+
+#================================================================================================
+# Command-line arguments:
+#================================================================================================
+def add_wait_for_ready_arguments(parser):
+    """ Adds the `--wait_for_ready` argument to an argument parser. """
+
+    parser.add_argument("--wait_for_ready",
+                        nargs="?",
+                        type=float,
+                        const=DEFAULT_TIMEOUT,
+                        metavar="SECONDS",
+                        help=f"Wait until Confluence reports it is running before starting, for at most SECONDS "
+                             f"(default when given without a value: {DEFAULT_TIMEOUT}).")
+
+def wait_if_asked(base_url: str, args, session: requests.Session = None):
+    """ Waits for Confluence to be ready if the parsed arguments ask for it (see `add_wait_for_ready_arguments`). """
+
+    if args.wait_for_ready is None:
+        return
+
+    seconds = wait_for_ready(base_url, timeout=args.wait_for_ready, session=session)
+
+    print(f"- Confluence ready after {seconds:.1f}s")
+
+#================================================================================================
+# Main method:
+#================================================================================================
+def main():
+
+    parser = argparse.ArgumentParser(description="Waits until Confluence reports it is running, e.g. after `docker compose up`.")
+
+    parser.add_argument("--confluence_base_url",
+                        "-u",
+                        default="http://localhost:8090",
+                        help="The base URL of the Confluence server (default: http://localhost:8090).")
+
+    parser.add_argument("--timeout",
+                        "-t",
+                        type=float,
+                        default=DEFAULT_TIMEOUT,
+                        help=f"Seconds to wait at most (default: {DEFAULT_TIMEOUT}).")
+
+    parser.add_argument("--interval",
+                        type=float,
+                        default=DEFAULT_INTERVAL,
+                        help=f"Seconds between two polls of /status (default: {DEFAULT_INTERVAL:g}).")
+
+    args = parser.parse_args()
+
+    try:
+        seconds = wait_for_ready(args.confluence_base_url.rstrip("/"), args.timeout, args.interval)
+        print(f"- Confluence ready after {seconds:.1f}s")
+    except Exception as e:
+        # A non-zero exit status lets shell scripts stop before their first batch:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
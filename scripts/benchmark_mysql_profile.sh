@@ -0,0 +1,69 @@
+#!/bin/bash
+
+#================================================================================================
+# Benchmarks the MySQL service of the compose stack with sysbench, so the sizing profiles
+# (MYSQL_PROFILE, see mysql_profile_entrypoint.sh) can be compared with each other and with the
+# plain configuration (MYSQL_PROFILE=none).
+#
+# Run it once per profile, restarting the stack in between:
+#
+#   MYSQL_PROFILE=none   docker compose -f Docker_compose.yaml up -d mysql && scripts/benchmark_mysql_profile.sh none
+#   MYSQL_PROFILE=medium docker compose -f Docker_compose.yaml up -d mysql && scripts/benchmark_mysql_profile.sh medium
+#
+# Every run appends one line to the results file, so the runs can be compared side by side.
+# Needs sysbench on the host (e.g. `apt install sysbench`). The test tables go in a separate
+# `sbtest` database, which is dropped afterwards; the `confluence` database isn't touched.
+#================================================================================================
+
+set -e
+
+LABEL="${1:?Usage: $0 <label, e.g. the profile name>}"
+
+# MySQL server details (the compose defaults):
+MYSQL_HOST="${MYSQL_HOST:-127.0.0.1}"
+MYSQL_PORT="${MYSQL_PORT:-3306}"
+MYSQL_ROOT_PASSWORD="${MYSQL_ROOT_PASSWORD:-my-secret-pw}"
+
+# Workload size; the tables should be bigger than the smallest buffer pool to show its effect:
+TABLES="${TABLES:-8}"
+TABLE_SIZE="${TABLE_SIZE:-1000000}"
+THREADS="${THREADS:-16}"
+DURATION="${DURATION:-300}"
+
+RESULTS_FILE="${RESULTS_FILE:-mysql_profile_results.tsv}"
+
+SYSBENCH_OPTIONS="--db-driver=mysql --mysql-host=${MYSQL_HOST} --mysql-port=${MYSQL_PORT} --mysql-user=root
+                  --mysql-password=${MYSQL_ROOT_PASSWORD} --mysql-db=sbtest --tables=${TABLES} --table-size=${TABLE_SIZE}"
+
+MYSQL="mysql -h${MYSQL_HOST} -P${MYSQL_PORT} -uroot -p${MYSQL_ROOT_PASSWORD}"
+
+# Record the settings the run was made with, next to its results:
+BUFFER_POOL=$(${MYSQL} -N -e "SELECT @@innodb_buffer_pool_size DIV 1048576" 2>/dev/null)
+FLUSH_LOG=$(${MYSQL} -N -e "SELECT @@innodb_flush_log_at_trx_commit" 2>/dev/null)
+
+echo "- Preparing ${TABLES} table(s) of ${TABLE_SIZE} row(s) ..."
+${MYSQL} -e "DROP DATABASE IF EXISTS sbtest; CREATE DATABASE sbtest" 2>/dev/null
+sysbench oltp_read_write ${SYSBENCH_OPTIONS} --threads="${THREADS}" prepare > /dev/null
+
+# A short warm-up, so every profile is measured with a warm buffer pool:
+echo "- Warming up ..."
+sysbench oltp_read_write ${SYSBENCH_OPTIONS} --threads="${THREADS}" --time=60 run > /dev/null
+
+echo "- Running oltp_read_write with ${THREADS} thread(s) for ${DURATION}s ..."
+OUTPUT=$(sysbench oltp_read_write ${SYSBENCH_OPTIONS} --threads="${THREADS}" --time="${DURATION}" --report-interval=0 run)
+
+TPS=$(echo "${OUTPUT}" | sed -n 's/.*transactions: *[0-9]* *(\([0-9.]*\) per sec.).*/\1/p')
+QPS=$(echo "${OUTPUT}" | sed -n 's/.*queries: *[0-9]* *(\([0-9.]*\) per sec.).*/\1/p')
+P95=$(echo "${OUTPUT}" | sed -n 's/.*95th percentile: *\([0-9.]*\).*/\1/p')
+
+sysbench oltp_read_write ${SYSBENCH_OPTIONS} cleanup > /dev/null
+${MYSQL} -e "DROP DATABASE IF EXISTS sbtest" 2>/dev/null
+
+if [ ! -f "${RESULTS_FILE}" ]; then
+    printf "label\tbuffer_pool_mb\tflush_log_at_trx_commit\tthreads\tseconds\ttps\tqps\tp95_ms\n" > "${RESULTS_FILE}"
+fi
+
+printf "%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\n" "${LABEL}" "${BUFFER_POOL}" "${FLUSH_LOG}" "${THREADS}" "${DURATION}" \
+       "${TPS}" "${QPS}" "${P95}" >> "${RESULTS_FILE}"
+
+echo "- ${LABEL}: ${TPS} transactions/s, ${QPS} queries/s, p95 ${P95} ms (appended to ${RESULTS_FILE})"
@@ -22,17 +22,30 @@ echo "Page ID: ${PAGE_ID}"
 
 # Since to update the content, you first need to get the existing content and then append the updated content in it
 
-EXISTING_CONTENT=$(curl -s -X GET  -H "Content-Type: application/json" -u "${USERNAME}:${API_TOKEN}" \  "${CONFLUENCE_URL}/rest/api/content/${PAGE_ID}?expand=body.storage" |  jq -r '.body.storage.value')
+# The version is fetched in the same request, since the update has to carry the next version number
+
+EXISTING_PAGE=$(curl -s -X GET  -H "Content-Type: application/json" -u "${USERNAME}:${API_TOKEN}" "${CONFLUENCE_URL}/rest/api/content/${PAGE_ID}?expand=body.storage,version")
+
+EXISTING_CONTENT=$(echo "${EXISTING_PAGE}" | jq -r '.body.storage.value')
+
+NEXT_VERSION=$(( $(echo "${EXISTING_PAGE}" | jq -r '.version.number') + 1 ))
 
 # New content to update the page with
 
 NEW_CONTENT="This is the updated content for the Confluence page."
 
+# If the content was already appended by an earlier run, skip the update so that no identical version is stored
+
+if [[ "${EXISTING_CONTENT}" == *"${NEW_CONTENT}" ]]; then
+    echo "Page already ends with the new content, nothing to update"
+    exit 0
+fi
+
 # Combine existing and new content
 
 UPDATED_CONTENT="${EXISTING_CONTENT}\n\n${NEW_CONTENT}"
 
-curl -s -X PUT -H "Content-Type: application/json"  -u "${USERNAME}:${API_TOKEN}" -d "{\"type\":\"page\",\"title\":\"Updated Page Title\",\"body\":{\"storage\":{\"value\":\"${UPDATED_CONTENT}\",\"representation\":\"storage\"}}}"  "${CONFLUENCE_URL}/rest/api/content/${PAGE_ID}"
+curl -s -X PUT -H "Content-Type: application/json"  -u "${USERNAME}:${API_TOKEN}" -d "{\"type\":\"page\",\"title\":\"Updated Page Title\",\"version\":{\"number\":${NEXT_VERSION},\"minorEdit\":true},\"body\":{\"storage\":{\"value\":\"${UPDATED_CONTENT}\",\"representation\":\"storage\"}}}"  "${CONFLUENCE_URL}/rest/api/content/${PAGE_ID}"
 
 echo "Curl command completed"
 